@@ -0,0 +1,158 @@
+"""Baseline
+
+The schema of every migration up to "Partition query tables by month" in one
+step, for databases never migrated. It keeps that revision's id, so
+`app.migrate` stamps 9e4b1f6c2d87 and carries on with the revisions after it
+in `alembic/versions`. Databases already migrated, at whatever revision,
+upgrade through the full chain there, which this file does not replace.
+
+Revision ID: 9e4b1f6c2d87
+Revises:
+Create Date: 2026-10-19 09:52:30.614472
+
+"""
+
+from datetime import date, datetime
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9e4b1f6c2d87"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# monthly partitions created ahead of time, `app.core.partitions` keeps it up
+PREMAKE_MONTHS = 3
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    op.create_table(
+        "user_account",
+        sa.Column("user_id", sa.Uuid(as_uuid=False), nullable=False),
+        sa.Column("email", sa.String(length=256), nullable=False),
+        sa.Column("hashed_password", sa.String(length=128), nullable=False),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.create_index(op.f("ix_user_account_email"), "user_account", ["email"], unique=True)
+    op.create_table(
+        "refresh_token",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("refresh_token", sa.String(length=512), nullable=False),
+        sa.Column("used", sa.Boolean(), nullable=False),
+        sa.Column("exp", sa.BigInteger(), nullable=False),
+        sa.Column("user_id", sa.Uuid(as_uuid=False), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user_account.user_id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_refresh_token_refresh_token"), "refresh_token", ["refresh_token"], unique=True
+    )
+
+    op.create_table(
+        "query_records",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("query", sa.String(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("status", sa.Integer(), nullable=False),
+        sa.Column("num_results", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id", "timestamp"),
+        postgresql_partition_by="RANGE (timestamp)",
+    )
+    op.create_index(op.f("ix_query_records_query"), "query_records", ["query"], unique=False)
+    op.create_index(op.f("ix_query_records_timestamp"), "query_records", ["timestamp"], unique=False)
+    op.create_table(
+        "query_results",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("author", sa.String(), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("journal", sa.String(), nullable=True),
+        sa.Column("query_record_id", sa.Integer(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id", "timestamp"),
+        postgresql_partition_by="RANGE (timestamp)",
+    )
+    op.create_index(
+        "ix_query_results_query_record_id_id",
+        "query_results",
+        ["query_record_id", "id"],
+        unique=False,
+    )
+    op.create_index(op.f("ix_query_results_timestamp"), "query_results", ["timestamp"], unique=False)
+
+    current = datetime.utcnow().date().replace(day=1)
+    for offset in range(PREMAKE_MONTHS + 1):
+        month = add_months(current, offset)
+        for table in ("query_records", "query_results"):
+            op.execute(
+                f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table}"
+                f" FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+            )
+    op.execute("CREATE TABLE query_records_default PARTITION OF query_records DEFAULT")
+    op.execute("CREATE TABLE query_results_default PARTITION OF query_results DEFAULT")
+
+    op.create_table(
+        "authors",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("normalized_name", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_authors_normalized_name"), "authors", ["normalized_name"], unique=True)
+    op.create_table(
+        "query_result_authors",
+        sa.Column("author_id", sa.Integer(), nullable=False),
+        sa.Column("query_result_id", sa.Integer(), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["author_id"], ["authors.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("author_id", "query_result_id"),
+    )
+    op.create_index(
+        op.f("ix_query_result_authors_query_result_id"),
+        "query_result_authors",
+        ["query_result_id"],
+        unique=False,
+    )
+
+    op.create_table(
+        "daily_query_stats",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("num_queries", sa.BigInteger(), nullable=False),
+        sa.Column("num_results", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("day"),
+    )
+    op.create_table(
+        "journal_stats",
+        sa.Column("journal", sa.String(), nullable=False),
+        sa.Column("num_results", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("journal"),
+    )
+    op.create_index(op.f("ix_journal_stats_num_results"), "journal_stats", ["num_results"], unique=False)
+    op.create_table(
+        "query_stats",
+        sa.Column("query", sa.String(), nullable=False),
+        sa.Column("num_queries", sa.BigInteger(), nullable=False),
+        sa.Column("last_queried_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("query"),
+    )
+    op.create_index(op.f("ix_query_stats_num_queries"), "query_stats", ["num_queries"], unique=False)
+
+
+def downgrade():
+    op.drop_table("query_stats")
+    op.drop_table("journal_stats")
+    op.drop_table("daily_query_stats")
+    op.drop_table("query_result_authors")
+    op.drop_table("authors")
+    # dropping the partitioned tables drops their attached partitions too
+    op.drop_table("query_results")
+    op.drop_table("query_records")
+    op.drop_table("refresh_token")
+    op.drop_table("user_account")
@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncEngine
 
 from alembic import context
 from app.core.config import get_settings
+from app.core.partitions import is_partition
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -13,7 +14,7 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-fileConfig(config.config_file_name)  # type: ignore
+fileConfig(config.config_file_name, disable_existing_loggers=False)  # type: ignore
 
 # add your model's MetaData object here
 # for 'autogenerate' support
@@ -29,6 +30,14 @@ target_metadata = Base.metadata
 # ... etc.
 
 
+def include_object(object, name, type_, reflected, compare_to) -> bool:  # noqa: A002
+    # monthly and DEFAULT partitions are managed by `app.core.partitions`
+    table = object if type_ == "table" else getattr(object, "table", None)
+    if reflected and table is not None and is_partition(table.name):
+        return False
+    return True
+
+
 def get_database_uri() -> str:
     return get_settings().sqlalchemy_database_uri.render_as_string(hide_password=False)
 
@@ -53,6 +62,7 @@ def run_migrations_offline() -> None:
         dialect_opts={"paramstyle": "named"},
         compare_type=True,
         compare_server_default=True,
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -61,7 +71,10 @@ def run_migrations_offline() -> None:
 
 def do_run_migrations(connection: Connection | None) -> None:
     context.configure(
-        connection=connection, target_metadata=target_metadata, compare_type=True
+        connection=connection,
+        target_metadata=target_metadata,
+        compare_type=True,
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -0,0 +1,90 @@
+"""Author table
+
+Revision ID: 3f9c2a7e51d4
+Revises: 63b567c97add
+Create Date: 2026-10-19 09:10:27.514302
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3f9c2a7e51d4"
+down_revision = "63b567c97add"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "authors",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("normalized_name", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_authors_normalized_name"), "authors", ["normalized_name"], unique=True
+    )
+    op.create_table(
+        "query_result_authors",
+        sa.Column("author_id", sa.Integer(), nullable=False),
+        sa.Column("query_result_id", sa.Integer(), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["author_id"], ["authors.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(
+            ["query_result_id"], ["query_results.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("author_id", "query_result_id"),
+    )
+    op.create_index(
+        op.f("ix_query_result_authors_query_result_id"),
+        "query_result_authors",
+        ["query_result_id"],
+        unique=False,
+    )
+
+    # backfill from the comma-joined `query_results.author` column, normalization
+    # must match `app.core.ingestion.normalize_author_name`
+    op.execute(
+        """
+        CREATE TEMPORARY TABLE split_authors ON COMMIT DROP AS
+        SELECT
+            r.id AS query_result_id,
+            a.position - 1 AS position,
+            regexp_replace(trim(a.name), '\\s+', ' ', 'g') AS name,
+            lower(regexp_replace(trim(a.name), '\\s+', ' ', 'g')) AS normalized_name
+        FROM query_results r,
+            regexp_split_to_table(r.author, ',') WITH ORDINALITY AS a(name, position)
+        WHERE trim(a.name) <> ''
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO authors (name, normalized_name)
+        SELECT DISTINCT ON (normalized_name) name, normalized_name
+        FROM split_authors
+        ORDER BY normalized_name, query_result_id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO query_result_authors (author_id, query_result_id, position)
+        SELECT DISTINCT ON (au.id, s.query_result_id) au.id, s.query_result_id, s.position
+        FROM split_authors s
+        JOIN authors au ON au.normalized_name = s.normalized_name
+        ORDER BY au.id, s.query_result_id, s.position
+        """
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f("ix_query_result_authors_query_result_id"),
+        table_name="query_result_authors",
+    )
+    op.drop_table("query_result_authors")
+    op.drop_index(op.f("ix_authors_normalized_name"), table_name="authors")
+    op.drop_table("authors")
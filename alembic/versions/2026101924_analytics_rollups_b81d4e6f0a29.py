@@ -0,0 +1,95 @@
+"""Analytics rollups
+
+Revision ID: b81d4e6f0a29
+Revises: 3f9c2a7e51d4
+Create Date: 2026-10-19 09:24:51.102397
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b81d4e6f0a29"
+down_revision = "3f9c2a7e51d4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "daily_query_stats",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("num_queries", sa.BigInteger(), nullable=False),
+        sa.Column("num_results", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("day"),
+    )
+    op.create_table(
+        "journal_stats",
+        sa.Column("journal", sa.String(), nullable=False),
+        sa.Column("num_results", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("journal"),
+    )
+    op.create_index(
+        op.f("ix_journal_stats_num_results"),
+        "journal_stats",
+        ["num_results"],
+        unique=False,
+    )
+    op.create_table(
+        "query_stats",
+        sa.Column("query", sa.String(), nullable=False),
+        sa.Column("num_queries", sa.BigInteger(), nullable=False),
+        sa.Column("last_queried_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("query"),
+    )
+    op.create_index(
+        op.f("ix_query_stats_num_queries"),
+        "query_stats",
+        ["num_queries"],
+        unique=False,
+    )
+
+    # one-off backfill, afterwards rollups are maintained at ingestion time
+    op.execute(
+        """
+        INSERT INTO daily_query_stats (day, num_queries, num_results)
+        SELECT
+            q.timestamp::date,
+            count(*),
+            coalesce(sum(r.num_stored), 0)
+        FROM query_records q
+        LEFT JOIN (
+            SELECT query_record_id, count(*) AS num_stored
+            FROM query_results
+            GROUP BY query_record_id
+        ) r ON r.query_record_id = q.id
+        GROUP BY q.timestamp::date
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO journal_stats (journal, num_results)
+        SELECT journal, count(*)
+        FROM query_results
+        WHERE journal IS NOT NULL AND journal <> ''
+        GROUP BY journal
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO query_stats (query, num_queries, last_queried_at)
+        SELECT query, count(*), max(timestamp)
+        FROM query_records
+        GROUP BY query
+        """
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_query_stats_num_queries"), table_name="query_stats")
+    op.drop_table("query_stats")
+    op.drop_index(op.f("ix_journal_stats_num_results"), table_name="journal_stats")
+    op.drop_table("journal_stats")
+    op.drop_table("daily_query_stats")
@@ -0,0 +1,48 @@
+"""Partial indexes on refresh tokens
+
+Refresh lookups go through an index of unused tokens only, the token reaper
+finds used tokens and the expiry of unused ones through two more. Built
+concurrently, logins and refreshes keep writing meanwhile.
+
+Revision ID: db771703118e
+Revises: 9e4b1f6c2d87
+Create Date: 2026-10-19 10:36:05.118532
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "db771703118e"
+down_revision = "9e4b1f6c2d87"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_refresh_token_unused", ["refresh_token"], "NOT used"),
+    ("ix_refresh_token_used", ["id"], "used"),
+    ("ix_refresh_token_unused_exp", ["exp"], "NOT used"),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, columns, where in INDEXES:
+            op.create_index(
+                name,
+                "refresh_token",
+                columns,
+                unique=False,
+                postgresql_where=sa.text(where),
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _, _ in INDEXES:
+            op.drop_index(name, table_name="refresh_token", postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,28 @@
+"""Index query results by record
+
+Revision ID: 5c0e7d2a9b13
+Revises: b81d4e6f0a29
+Create Date: 2026-10-19 09:38:12.448210
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5c0e7d2a9b13"
+down_revision = "b81d4e6f0a29"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_query_results_query_record_id_id",
+        "query_results",
+        ["query_record_id", "id"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_query_results_query_record_id_id", table_name="query_results")
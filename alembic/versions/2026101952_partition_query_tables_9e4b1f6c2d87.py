@@ -0,0 +1,166 @@
+"""Partition query tables by month
+
+Revision ID: 9e4b1f6c2d87
+Revises: 5c0e7d2a9b13
+Create Date: 2026-10-19 09:52:30.614472
+
+"""
+
+from datetime import date, datetime
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9e4b1f6c2d87"
+down_revision = "5c0e7d2a9b13"
+branch_labels = None
+depends_on = None
+
+# monthly partitions created ahead of time, `app.core.partitions` keeps it up
+PREMAKE_MONTHS = 3
+
+QUERY_RECORD_COLUMNS = ["id", "query", "timestamp", "status", "num_results"]
+QUERY_RESULT_COLUMNS = ["id", "author", "title", "journal", "query_record_id", "timestamp"]
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def query_records_columns(partitioned):
+    return [
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('query_records_id_seq'::regclass)"),
+            nullable=False,
+        ),
+        sa.Column("query", sa.String(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("status", sa.Integer(), nullable=False),
+        sa.Column("num_results", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id", "timestamp") if partitioned else sa.PrimaryKeyConstraint("id"),
+    ]
+
+
+def query_results_columns(partitioned):
+    return [
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('query_results_id_seq'::regclass)"),
+            nullable=False,
+        ),
+        sa.Column("author", sa.String(), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("journal", sa.String(), nullable=True),
+        sa.Column("query_record_id", sa.Integer(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id", "timestamp") if partitioned else sa.PrimaryKeyConstraint("id"),
+    ]
+
+
+def create_indexes():
+    op.create_index("ix_query_records_query", "query_records", ["query"], unique=False)
+    op.create_index("ix_query_records_timestamp", "query_records", ["timestamp"], unique=False)
+    op.create_index("ix_query_results_timestamp", "query_results", ["timestamp"], unique=False)
+    op.create_index(
+        "ix_query_results_query_record_id_id",
+        "query_results",
+        ["query_record_id", "id"],
+        unique=False,
+    )
+
+
+def move_aside(table):
+    # keeps the data while the new table takes the name, index names are schema wide
+    op.rename_table(table, f"{table}_old")
+    op.execute(f"ALTER TABLE {table}_old RENAME CONSTRAINT {table}_pkey TO {table}_old_pkey")
+
+
+def copy_from_old(table, columns):
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    op.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {table}_old")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    op.drop_table(f"{table}_old")
+
+
+def upgrade():
+    # a unique "id" cannot be enforced across partitions, so nothing can reference it
+    op.drop_constraint(
+        "query_result_authors_query_result_id_fkey", "query_result_authors", type_="foreignkey"
+    )
+    op.drop_constraint("query_results_query_record_id_fkey", "query_results", type_="foreignkey")
+    op.drop_index("ix_query_records_query", table_name="query_records")
+    op.drop_index("ix_query_records_timestamp", table_name="query_records")
+    op.drop_index("ix_query_results_timestamp", table_name="query_results")
+    op.drop_index("ix_query_results_query_record_id_id", table_name="query_results")
+    move_aside("query_records")
+    move_aside("query_results")
+
+    op.create_table(
+        "query_records", *query_records_columns(True), postgresql_partition_by="RANGE (timestamp)"
+    )
+    op.create_table(
+        "query_results", *query_results_columns(True), postgresql_partition_by="RANGE (timestamp)"
+    )
+
+    # one partition per month of existing history up to PREMAKE_MONTHS ahead
+    first, last = op.get_bind().execute(
+        sa.text(
+            "SELECT min(timestamp), max(timestamp) FROM ("
+            " SELECT timestamp FROM query_records_old"
+            " UNION ALL SELECT timestamp FROM query_results_old) AS history"
+        )
+    ).one()
+    current = datetime.utcnow().date().replace(day=1)
+    month = min(first.date().replace(day=1), current) if first else current
+    last_month = max(last.date().replace(day=1), current) if last else current
+    while month <= add_months(last_month, PREMAKE_MONTHS):
+        for table in ("query_records", "query_results"):
+            op.execute(
+                f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table}"
+                f" FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+            )
+        month = add_months(month, 1)
+    op.execute("CREATE TABLE query_records_default PARTITION OF query_records DEFAULT")
+    op.execute("CREATE TABLE query_results_default PARTITION OF query_results DEFAULT")
+
+    copy_from_old("query_records", QUERY_RECORD_COLUMNS)
+    copy_from_old("query_results", QUERY_RESULT_COLUMNS)
+    create_indexes()
+
+
+def downgrade():
+    op.drop_index("ix_query_records_query", table_name="query_records")
+    op.drop_index("ix_query_records_timestamp", table_name="query_records")
+    op.drop_index("ix_query_results_timestamp", table_name="query_results")
+    op.drop_index("ix_query_results_query_record_id_id", table_name="query_results")
+    move_aside("query_records")
+    move_aside("query_results")
+
+    op.create_table("query_records", *query_records_columns(False))
+    op.create_table("query_results", *query_results_columns(False))
+    # dropping the partitioned tables drops their attached partitions too
+    copy_from_old("query_records", QUERY_RECORD_COLUMNS)
+    copy_from_old("query_results", QUERY_RESULT_COLUMNS)
+    create_indexes()
+
+    op.create_foreign_key(
+        "query_results_query_record_id_fkey",
+        "query_results",
+        "query_records",
+        ["query_record_id"],
+        ["id"],
+    )
+    op.create_foreign_key(
+        "query_result_authors_query_result_id_fkey",
+        "query_result_authors",
+        "query_results",
+        ["query_result_id"],
+        ["id"],
+        ondelete="CASCADE",
+    )
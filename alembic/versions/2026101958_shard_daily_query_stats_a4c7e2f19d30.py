@@ -0,0 +1,54 @@
+"""Shard daily query stats
+
+Every search of a day added to the same `daily_query_stats` row, so
+concurrent ingestions queued on its row lock. Each ingestion now adds to one
+of a few shards of the day, readers sum them. Existing rows become shard 0.
+
+Revision ID: a4c7e2f19d30
+Revises: db771703118e
+Create Date: 2026-10-19 10:58:12.604311
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a4c7e2f19d30"
+down_revision = "db771703118e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a constant default, no table rewrite
+    op.add_column(
+        "daily_query_stats",
+        sa.Column("shard", sa.SmallInteger(), nullable=False, server_default="0"),
+    )
+    op.alter_column("daily_query_stats", "shard", server_default=None)
+    # one row per day so far, rebuilding the key is cheap
+    op.drop_constraint("daily_query_stats_pkey", "daily_query_stats", type_="primary")
+    op.create_primary_key("daily_query_stats_pkey", "daily_query_stats", ["day", "shard"])
+
+
+def downgrade():
+    op.execute(
+        """
+        WITH merged AS (
+            DELETE FROM daily_query_stats WHERE shard <> 0
+            RETURNING day, num_queries, num_results
+        )
+        INSERT INTO daily_query_stats (day, shard, num_queries, num_results)
+        SELECT day, 0, sum(num_queries), sum(num_results)
+        FROM merged
+        GROUP BY day
+        ON CONFLICT (day, shard) DO UPDATE SET
+            num_queries = daily_query_stats.num_queries + excluded.num_queries,
+            num_results = daily_query_stats.num_results + excluded.num_results
+        """
+    )
+    op.drop_constraint("daily_query_stats_pkey", "daily_query_stats", type_="primary")
+    op.create_primary_key("daily_query_stats_pkey", "daily_query_stats", ["day"])
+    op.drop_column("daily_query_stats", "shard")
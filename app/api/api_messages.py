@@ -4,3 +4,4 @@ REFRESH_TOKEN_NOT_FOUND = "Refresh token not found"
 REFRESH_TOKEN_EXPIRED = "Refresh token expired"
 REFRESH_TOKEN_ALREADY_USED = "Refresh token already used"
 EMAIL_ADDRESS_ALREADY_USED = "Cannot use this email address"
+TOO_MANY_REQUESTS = "Too many requests, try again later"
@@ -1,12 +1,15 @@
 from fastapi import APIRouter
 
 from app.api import api_messages
-from app.api.endpoints import auth, users, arxiv
+from app.api.endpoints import analytics, auth, metrics, users, arxiv
 
 # Setup routers for each module
 auth_router = APIRouter()
 auth_router.include_router(auth.router, prefix="/auth", tags=["auth"])
 
+metrics_router = APIRouter()
+metrics_router.include_router(metrics.router, tags=["metrics"])
+
 api_router = APIRouter(
     responses={
         401: {
@@ -36,3 +39,4 @@ api_router = APIRouter(
 # Include the individual routers with specific prefixes and tags
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(arxiv.router, prefix="/arxiv", tags=["arxiv"])
+api_router.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
@@ -1,35 +1,87 @@
+import time
 from collections.abc import AsyncGenerator
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy import select
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import api_messages
 from app.core import database_session
+from app.core.admission import get_admission_controller, retry_after
+from app.core.config import get_settings
 from app.core.security.jwt import verify_jwt_token
+from app.core.user_cache import cache_user, get_cached_user, user_cache_generation
 from app.models import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/access-token")
 
+# built once, runs on every authenticated request
+_USER_BY_ID = select(User).where(User.user_id == bindparam("user_id"))
+
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with database_session.get_async_session() as session:
         yield session
 
 
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    # read replica when configured and caught up, see `database_session.get_async_read_session`
+    async with await database_session.get_async_read_session() as session:
+        try:
+            yield session
+        except (OSError, DBAPIError) as exc:
+            monitor = database_session.get_replica_monitor()
+            if session.info.get("replica") and monitor is not None:
+                if isinstance(exc, OSError) or exc.connection_invalidated:
+                    monitor.mark_unavailable()
+            raise
+
+
+async def admit_password_hashing(request: Request) -> None:
+    # async so it runs on the event loop, not in the threadpool
+    if not get_settings().admission.enabled:
+        return
+    client = request.client.host if request.client is not None else "unknown"
+    wait = get_admission_controller().admit(client, time.monotonic())
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=api_messages.TOO_MANY_REQUESTS,
+            headers={"Retry-After": retry_after(wait)},
+        )
+
+
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ) -> User:
     token_payload = verify_jwt_token(token)
 
-    user = await session.scalar(select(User).where(User.user_id == token_payload.sub))
+    # the session only connects on first use, hits never check out a connection
+    user = await get_cached_user(token_payload.sub)
+    if user is not None:
+        return user
+
+    generation = user_cache_generation()
+    replica = session.info.get("replica")
+    # users to cache are read from the primary, a lagging replica can still
+    # return one deleted after its invalidation went out. With the cache on
+    # that is one primary read per user and worker every "user_cache__ttl_secs"
+    user = None
+    if not (replica and get_settings().user_cache.enabled):
+        user = await session.scalar(_USER_BY_ID, {"user_id": token_payload.sub})
+    if user is None and replica:
+        # also when the user has not replicated yet, e.g. right after registering
+        async with database_session.get_async_session() as primary_session:
+            user = await primary_session.scalar(_USER_BY_ID, {"user_id": token_payload.sub})
 
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=api_messages.JWT_ERROR_USER_REMOVED,
         )
+    await cache_user(user, generation)
     return user
@@ -0,0 +1,62 @@
+# Dashboard endpoints, served from the rollup tables maintained at ingestion
+# time by `app.core.ingestion.update_rollups`. Every read is a primary key range
+# or an index-ordered LIMIT, so cost does not grow with the search history.
+# Days are stored in a few shards, summed here, see `app/core/ingestion.py`.
+
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import Row, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_read_session
+from app.core.ingestion import daily_query_stats
+from app.models import DailyQueryStats, JournalStats, QueryStats
+from app.schemas.responses import (
+    DailyQueryStatsResponse,
+    JournalStatsResponse,
+    QueryStatsResponse,
+)
+
+router = APIRouter()
+
+
+@router.get("/queries-per-day", response_model=list[DailyQueryStatsResponse])
+async def get_queries_per_day(
+    start: date,
+    end: Optional[date] = None,
+    session: AsyncSession = Depends(get_read_session),
+) -> list[Row[tuple[date, int, int]]]:
+    query = daily_query_stats().where(DailyQueryStats.day >= start)
+    if end:
+        query = query.where(DailyQueryStats.day <= end)
+
+    result = await session.execute(query.order_by(DailyQueryStats.day))
+    return list(result.all())
+
+
+@router.get("/results-per-journal", response_model=list[JournalStatsResponse])
+async def get_results_per_journal(
+    limit: int = Query(10, ge=1, le=1000),
+    session: AsyncSession = Depends(get_read_session),
+) -> list[JournalStats]:
+    result = await session.scalars(
+        select(JournalStats)
+        .order_by(JournalStats.num_results.desc(), JournalStats.journal)
+        .limit(limit)
+    )
+    return list(result.all())
+
+
+@router.get("/top-queries", response_model=list[QueryStatsResponse])
+async def get_top_queries(
+    limit: int = Query(10, ge=1, le=1000),
+    session: AsyncSession = Depends(get_read_session),
+) -> list[QueryStats]:
+    result = await session.scalars(
+        select(QueryStats)
+        .order_by(QueryStats.num_queries.desc(), QueryStats.query)
+        .limit(limit)
+    )
+    return list(result.all())
@@ -1,12 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response, Query
+from fastapi import APIRouter, Depends, HTTPException, Path, status, Request, Response, Query
 from fastapi.responses import FileResponse, JSONResponse
+from sqlalchemy import bindparam, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
-from app.api.deps import get_session
-from app.models import QueryRecord, QueryResult
+from app.api.deps import get_read_session, get_session
+from app.api.http_cache import (
+    NO_CACHE,
+    closed_range_cache_control,
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+    validator_headers,
+)
+from app.api.pagination import count_rows, decode_cursor, encode_cursor, pagination_headers
+from app.core.cache import get_cache
+from app.core.config import get_settings
+from app.core.http_client import get_http_client
+from app.core.ingestion import normalize_author_name, store_result_authors, update_rollups
+from app.core.metrics import (
+    ARXIV_UPSTREAM_RESPONSES,
+    ARXIV_UPSTREAM_SECONDS,
+    FEED_PARSE_SECONDS,
+    QUERY_RECORDS_INGESTED,
+    QUERY_RESULTS_INGESTED,
+)
+from app.core.write_behind import WriteQueueFull, get_search_writer
+from app.models import Author, DailyQueryStats, QueryRecord, QueryResult, QueryResultAuthor
 from app.schemas.requests import ArxivSearchRequest
-from app.schemas.responses import QueryRecordResponse, QueryResultResponse
+from app.schemas.responses import QueryRecordDetailResponse, QueryRecordResponse, QueryResultResponse
+from app.schemas.serializers import (
+    QUERY_RECORD_FIELDS,
+    QUERY_RESULT_FIELDS,
+    dump_query_record,
+    dump_query_record_detail,
+    dump_query_record_rows,
+    dump_query_result_rows,
+)
+import asyncio
+import orjson
 import requests
 import feedparser
 from datetime import datetime
@@ -14,6 +46,7 @@ from typing import List, Optional
 import json
 import logging
 import csv
+import time
 from io import StringIO
 
 # Setup structured logging
@@ -26,8 +59,75 @@ logger.addHandler(handler)
 
 router = APIRouter()
 
+# List endpoints select plain columns from the Core tables, rows come back as
+# tuples in serializer field order and skip ORM instances and the identity map
+_query_records = QueryRecord.__table__
+_query_results = QueryResult.__table__
+_authors = Author.__table__
+_query_result_authors = QueryResultAuthor.__table__
+_QUERY_RECORD_COLUMNS = [_query_records.c[field] for field in QUERY_RECORD_FIELDS]
+_QUERY_RESULT_COLUMNS = [_query_results.c[field] for field in QUERY_RESULT_FIELDS]
+
+# largest int4, the id serials' type: larger ids are rejected as invalid before asyncpg overflows on them
+_MAX_ID = 2**31 - 1
+
+# Read statements are built once with bind parameters. SQLAlchemy memoizes the
+# cache key of a statement object, so requests skip both building and
+# re-keying them, go straight to the compiled cache and reuse the asyncpg
+# prepared statement for that SQL
+def _queries_in_range(with_end: bool) -> list:
+    in_range = [_query_records.c.timestamp >= bindparam("start")]
+    if with_end:
+        in_range.append(_query_records.c.timestamp <= bindparam("end"))
+    return in_range
+
+# the count catches rows committed late with a timestamp inside the range
+# (out of order commits, write-behind stamps at request time), which leave
+# min and max alone. Still an index-only scan of the timestamp index
+_QUERIES_WATERMARK = {
+    with_end: select(
+        func.min(_query_records.c.timestamp), func.max(_query_records.c.timestamp), func.count()
+    ).where(*_queries_in_range(with_end))
+    for with_end in (False, True)
+}
+_QUERIES = {with_end: select(*_QUERY_RECORD_COLUMNS).where(*_queries_in_range(with_end)) for with_end in (False, True)}
+_QUERY_RECORD = select(*_QUERY_RECORD_COLUMNS).where(_query_records.c.id == bindparam("query_id"))
+_QUERY_RECORD_TIMESTAMP = select(_query_records.c.timestamp).where(_query_records.c.id == bindparam("query_id"))
+# results are never older than their record, so the timestamp bound prunes
+# every older partition, the rest is a keyset page on (query_record_id, id)
+_QUERY_RECORD_RESULTS_PAGE = (
+    select(*_QUERY_RESULT_COLUMNS)
+    .where(
+        _query_results.c.query_record_id == bindparam("query_id"),
+        _query_results.c.timestamp >= bindparam("since"),
+        _query_results.c.id > bindparam("after_id"),
+    )
+    .order_by(_query_results.c.id)
+    .limit(bindparam("limit"))
+)
+# results ingested so far, kept by the rollups in the ingesting transaction,
+# a sum over the few rows per day of daily_query_stats
+_RESULTS_INGESTED = select(func.coalesce(func.sum(DailyQueryStats.num_results), 0)).scalar_subquery()
+_RESULTS_WATERMARK = select(
+    func.min(_query_results.c.id), func.max(_query_results.c.id), func.max(_query_results.c.timestamp), _RESULTS_INGESTED
+)
+_RESULT_IDS = select(_query_results.c.id)
+_RESULTS_PAGE = (
+    select(*_QUERY_RESULT_COLUMNS).order_by(_query_results.c.timestamp).offset(bindparam("offset")).limit(bindparam("limit"))
+)
+_AUTHOR_RESULTS = (
+    select(*_QUERY_RESULT_COLUMNS)
+    .select_from(
+        _query_results
+        .join(_query_result_authors, _query_result_authors.c.query_result_id == _query_results.c.id)
+        .join(_authors, _authors.c.id == _query_result_authors.c.author_id)
+    )
+    .where(_authors.c.normalized_name == bindparam("normalized_name"))
+)
+_AUTHOR_RESULTS_PAGE = _AUTHOR_RESULTS.order_by(_query_results.c.timestamp).offset(bindparam("offset")).limit(bindparam("limit"))
+
 @router.post("/search", response_model=QueryRecordResponse, status_code=status.HTTP_201_CREATED)
-async def search_arxiv(request: ArxivSearchRequest, session: AsyncSession = Depends(get_session)) -> QueryRecordResponse:
+async def search_arxiv(request: ArxivSearchRequest, session: AsyncSession = Depends(get_session)) -> Response:
     if not (request.author or request.title or request.journal):
         logger.error("Invalid request parameters")
         raise HTTPException(status_code=400, detail="At least one of the query parameters (author, title, journal) must be provided.")
@@ -41,19 +141,49 @@ async def search_arxiv(request: ArxivSearchRequest, session: AsyncSession = Depe
         query.append(f"jr:{request.journal}")
     query_str = "+AND+".join(query)
     
-    url = f"https://export.arxiv.org/api/query?search_query={query_str}&max_results={request.max_query_results or 8}&sortBy=relevance&sortOrder=descending"
-    logger.info(f"Querying arXiv with URL: {url}")
-    try:
-        response = requests.get(url)
+    url = f"{get_settings().upstream.arxiv_api_url}?search_query={query_str}&max_results={request.max_query_results or 8}&sortBy=relevance&sortOrder=descending"
+    # parsed feeds are shared by all workers, identical searches skip the upstream call
+    feed_cache = get_cache("arxiv-search", get_settings().cache.arxiv_search_ttl_secs)
+    cached_feed = await feed_cache.get(url)
+    if cached_feed is not None:
+        logger.info(f"Using cached arXiv feed for URL: {url}")
+        feed = orjson.loads(cached_feed)
+    else:
+        logger.info(f"Querying arXiv with URL: {url}")
+        upstream = get_settings().upstream
+        started = time.perf_counter()
+        try:
+            # requests blocks, the loop keeps serving other requests meanwhile
+            response = await asyncio.to_thread(
+                get_http_client().get, url, timeout=(upstream.connect_timeout_secs, upstream.read_timeout_secs)
+            )
+        except requests.exceptions.RequestException as e:
+            ARXIV_UPSTREAM_SECONDS.observe(time.perf_counter() - started)
+            ARXIV_UPSTREAM_RESPONSES.labels("error").inc()
+            logger.error(f"arXiv API not available: {str(e)}")
+            raise HTTPException(status_code=503, detail="arXiv API not available.")
+        ARXIV_UPSTREAM_SECONDS.observe(time.perf_counter() - started)
+        ARXIV_UPSTREAM_RESPONSES.labels(str(response.status_code)).inc()
         if response.status_code != 200:
             logger.error(f"Failed to query arXiv API with status code {response.status_code}, URL: {url}")
             raise HTTPException(status_code=response.status_code, detail="Error querying arxiv API.")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"arXiv API not available: {str(e)}")
-        raise HTTPException(status_code=503, detail="arXiv API not available.")
+        
+        with FEED_PARSE_SECONDS.time():
+            parsed_feed = feedparser.parse(response.content)
+        feed = {
+            "num_results": int(parsed_feed.feed.get("opensearch_totalresults", 0)),
+            "entries": [
+                {
+                    "title": entry.title,
+                    "authors": [author.name for author in entry.get('authors', [])],
+                    "journal": entry.get('arxiv_journal_ref', None),
+                }
+                for entry in parsed_feed.entries
+            ],
+        }
+        await feed_cache.set(url, orjson.dumps(feed))
     
-    feed = feedparser.parse(response.content)
-    num_results = int(feed.feed.get("opensearch_totalresults", 0))
+    num_results = feed["num_results"]
     if num_results == 0:
         logger.info("No results found for the query.")
         raise HTTPException(status_code=404, detail="No results found.")
@@ -61,32 +191,65 @@ async def search_arxiv(request: ArxivSearchRequest, session: AsyncSession = Depe
     query_record = QueryRecord(
         query=query_str,
         timestamp=datetime.utcnow(),
-        status=response.status_code,
+        status=status.HTTP_200_OK,
         num_results=num_results
     )
     
+    writer = get_search_writer()
+    if writer is not None:
+        # batched with other searches, see `app/core/write_behind.py`
+        query_results = [
+            QueryResult(
+                author=", ".join(entry["authors"]),
+                title=entry["title"],
+                journal=entry["journal"],
+                timestamp=datetime.utcnow()
+            )
+            for entry in feed["entries"]
+        ]
+        try:
+            await writer.submit(query_record, query_results, [entry["authors"] for entry in feed["entries"]])
+        except WriteQueueFull:
+            logger.error("Write-behind queue full, refusing search.")
+            raise HTTPException(status_code=503, detail="Too many searches, try again later.")
+        logger.info(f"Query record queued with ID {query_record.id} and {len(query_results)} results.")
+        return Response(
+            content=dump_query_record(query_record, query_results),
+            status_code=status.HTTP_201_CREATED,
+            media_type="application/json",
+        )
+    
     session.add(query_record)
-    await session.commit()
-    await session.refresh(query_record)
+    await session.flush()
     
-    for entry in feed.entries:
-        authors = ", ".join(author.name for author in entry.authors)
-        query_result = QueryResult(
-            author=authors,
-            title=entry.title,
-            journal=entry.get('arxiv_journal_ref', None),
+    query_results = [
+        QueryResult(
+            author=", ".join(entry["authors"]),
+            title=entry["title"],
+            journal=entry["journal"],
             query_record_id=query_record.id,
             timestamp=datetime.utcnow()
         )
-        session.add(query_result)
+        for entry in feed["entries"]
+    ]
+    session.add_all(query_results)
+    await session.flush()
     
+    await store_result_authors(
+        session, [(query_result.id, entry["authors"]) for query_result, entry in zip(query_results, feed["entries"])]
+    )
+    await update_rollups(session, [query_record], query_results)
     await session.commit()
-    logger.info(f"Query record created with ID {query_record.id} and {len(feed.entries)} results.")
-    
-    result = await session.execute(select(QueryRecord).options(joinedload(QueryRecord.results)).filter_by(id=query_record.id))
-    query_record_with_results = result.unique().scalar_one()
+    QUERY_RECORDS_INGESTED.inc()
+    QUERY_RESULTS_INGESTED.inc(len(query_results))
+    logger.info(f"Query record created with ID {query_record.id} and {len(query_results)} results.")
     
-    return query_record_with_results
+    # everything needed is already in memory, no need to reload and revalidate it
+    return Response(
+        content=dump_query_record(query_record, query_results),
+        status_code=status.HTTP_201_CREATED,
+        media_type="application/json",
+    )
 
 @router.get("/queries", responses={
     200: {
@@ -98,52 +261,187 @@ async def search_arxiv(request: ArxivSearchRequest, session: AsyncSession = Depe
     }
 })
 async def get_queries(
+    request: Request,
     query_timestamp_start: datetime,
     query_timestamp_end: datetime = None,
     download: bool = False,
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_read_session)
 ) -> Response:
     logger.info("Received request for queries with download option set to %s", download)
-    query = select(QueryRecord).where(QueryRecord.timestamp >= query_timestamp_start)
-    if query_timestamp_end:
-        query = query.where(QueryRecord.timestamp <= query_timestamp_end)
+    with_end = bool(query_timestamp_end)
+    in_range = {"start": query_timestamp_start, "end": query_timestamp_end} if with_end else {"start": query_timestamp_start}
 
-    result = await session.execute(query)
-    queries = result.scalars().all()
-    
-    if not queries:
+    first_timestamp, last_timestamp, num_queries = (await session.execute(_QUERIES_WATERMARK[with_end], in_range)).one()
+    if last_timestamp is None:
         logger.warning("No queries found within the specified time range.")
         raise HTTPException(status_code=404, detail="No queries found in the specified range.")
 
+    etag = make_etag("queries", query_timestamp_start, query_timestamp_end, download, first_timestamp, last_timestamp, num_queries)
+    headers = validator_headers(etag, last_timestamp, closed_range_cache_control(query_timestamp_end))
+    if is_not_modified(request, etag, last_timestamp):
+        logger.info("Queries not modified, returning 304.")
+        return not_modified_response(headers)
+
+    # the ETag changes with the data, so it doubles as a cache key needing no invalidation
+    read_cache = get_cache("arxiv-read", get_settings().cache.arxiv_read_ttl_secs)
+    body = await read_cache.get(etag)
+    if body is None:
+        result = await session.execute(_QUERIES[with_end], in_range)
+        rows = result.all()
+
+        if download:
+            output = StringIO()
+            writer = csv.writer(output)
+            writer.writerow(QUERY_RECORD_FIELDS)
+            for record_id, query, timestamp, record_status, num_results in rows:
+                writer.writerow([record_id, query, timestamp.isoformat(), record_status, num_results])
+            body = output.getvalue().encode()
+        else:
+            body = dump_query_record_rows(rows)
+        await read_cache.set(etag, body)
+
     if download:
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['id', 'query', 'timestamp', 'status', 'num_results'])
-        for record in queries:
-            writer.writerow([record.id, record.query, record.timestamp.isoformat(), record.status, record.num_results])
-        
-        output.seek(0)
         logger.info("Generating CSV file for download.")
-        return Response(content=output.getvalue(), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=queries.csv"})
+        return Response(content=body, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=queries.csv", **headers})
     else:
-        response_data = [{"id": record.id, "query": record.query, "timestamp": record.timestamp.isoformat(), "status": record.status, "num_results": record.num_results} for record in queries]
         logger.info("Returning JSON response with query results.")
-        return JSONResponse(content=response_data)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+async def _record_results_page(
+    session: AsyncSession, query_record_id: int, since: datetime, after_id: Optional[int], limit: int
+) -> tuple[list, Optional[str]]:
+    # one extra row tells whether there is a next page, ids are positive serials
+    rows = (await session.execute(
+        _QUERY_RECORD_RESULTS_PAGE,
+        {"query_id": query_record_id, "since": since, "after_id": after_id or 0, "limit": limit + 1},
+    )).all()
+    next_cursor = encode_cursor(rows[limit - 1][0], since.isoformat()) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+async def _record_timestamp(session: AsyncSession, query_id: int) -> datetime:
+    timestamp = await session.scalar(_QUERY_RECORD_TIMESTAMP, {"query_id": query_id})
+    if timestamp is None:
+        logger.warning("Query record %s not found.", query_id)
+        raise HTTPException(status_code=404, detail="Query record not found.")
+    return timestamp
+
+@router.get("/queries/{query_id}", response_model=QueryRecordDetailResponse, status_code=status.HTTP_200_OK)
+async def get_query(
+    query_id: int = Path(ge=1, le=_MAX_ID),
+    session: AsyncSession = Depends(get_read_session),
+    items_per_page: int = Query(10, ge=1, le=100)
+) -> Response:
+    logger.info("Fetching query record %s with the first %s results", query_id, items_per_page)
+    record = (await session.execute(_QUERY_RECORD, {"query_id": query_id})).one_or_none()
+    if record is None:
+        logger.warning("Query record %s not found.", query_id)
+        raise HTTPException(status_code=404, detail="Query record not found.")
+
+    rows, next_cursor = await _record_results_page(session, query_id, record.timestamp, None, items_per_page)
+
+    logger.info("Returning query record %s.", query_id)
+    return Response(
+        content=dump_query_record_detail(record, rows, next_cursor),
+        media_type="application/json",
+        headers=pagination_headers(next_cursor is not None, next_cursor=next_cursor),
+    )
+
+@router.get("/queries/{query_id}/results", response_model=list[QueryResultResponse], status_code=status.HTTP_200_OK)
+async def get_query_results(
+    query_id: int = Path(ge=1, le=_MAX_ID),
+    session: AsyncSession = Depends(get_read_session),
+    cursor: Optional[str] = Query(None, description="`next_cursor` of the previous page, omit for the first page"),
+    items_per_page: int = Query(10, ge=1, le=100)
+) -> Response:
+    logger.info("Fetching results of query record %s - cursor %s, items per page %s", query_id, cursor, items_per_page)
+    if cursor:
+        # the cursor carries the record timestamp, later pages skip looking it up
+        after_id, since = decode_cursor(cursor, 2)
+        try:
+            # bool is an int too
+            if not isinstance(after_id, int) or isinstance(after_id, bool) or not 1 <= after_id <= _MAX_ID:
+                raise ValueError(after_id)
+            since = datetime.fromisoformat(since)
+            # record timestamps are naive UTC, an aware one cannot be compared
+            if since.tzinfo is not None:
+                raise ValueError(since)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+    else:
+        after_id, since = None, await _record_timestamp(session, query_id)
+
+    rows, next_cursor = await _record_results_page(session, query_id, since, after_id, items_per_page)
+
+    logger.info("Returning %s results of query record %s.", len(rows), query_id)
+    return Response(
+        content=dump_query_result_rows(rows),
+        media_type="application/json",
+        headers=pagination_headers(next_cursor is not None, next_cursor=next_cursor),
+    )
 
 @router.get("/results", response_model=list[QueryResultResponse], status_code=status.HTTP_200_OK)
 async def get_results(
-    session: AsyncSession = Depends(get_session),
+    request: Request,
+    session: AsyncSession = Depends(get_read_session),
     page: int = Query(0, ge=0),  # Ensure page is non-negative
-    items_per_page: int = Query(10, ge=1)  # Ensure items_per_page is at least 1
-) -> list[QueryResult]:
+    items_per_page: int = Query(10, ge=1),  # Ensure items_per_page is at least 1
+    include_total: bool = Query(False, description="Add `X-Total-Count` (estimated for large sets, see `X-Total-Count-Exact`)")
+) -> Response:
     logger.info("Fetching results with pagination - page %s, items per page %s", page, items_per_page)
-    result = await session.execute(
-        select(QueryResult).order_by(QueryResult.timestamp).offset(page * items_per_page).limit(items_per_page)
-    )
-    results = result.scalars().all()
-    if not results:
+    # results are removed oldest first, moving the first id. Ids do not commit
+    # in order (write-behind takes them in blocks), a late commit below the
+    # last id only shows in the ingested count
+    first_id, last_id, last_timestamp, num_ingested = (await session.execute(_RESULTS_WATERMARK)).one()
+    if last_id is None:
         logger.warning("No query results found for the current page: %s", page)
         raise HTTPException(status_code=404, detail="No query results found.")
 
+    etag = make_etag("results", page, items_per_page, include_total, first_id, last_id, last_timestamp, num_ingested)
+    headers = validator_headers(etag, last_timestamp, NO_CACHE)
+    if is_not_modified(request, etag, last_timestamp):
+        logger.info("Query results not modified, returning 304.")
+        return not_modified_response(headers)
+
+    read_cache = get_cache("arxiv-read", get_settings().cache.arxiv_read_ttl_secs)
+    body, page_info = await read_cache.get_many([etag, f"{etag}:page"])
+    if body is None or page_info is None:
+        # one extra row tells whether there is a next page
+        result = await session.execute(_RESULTS_PAGE, {"offset": page * items_per_page, "limit": items_per_page + 1})
+        rows = result.all()
+        if not rows:
+            logger.warning("No query results found for the current page: %s", page)
+            raise HTTPException(status_code=404, detail="No query results found.")
+        page_headers = {"has_more": len(rows) > items_per_page}
+        if include_total:
+            page_headers["total"], page_headers["total_exact"] = await count_rows(session, _RESULT_IDS)
+        body = dump_query_result_rows(rows[:items_per_page])
+        page_info = orjson.dumps(page_headers)
+        await read_cache.set_many({etag: body, f"{etag}:page": page_info})
+    headers.update(pagination_headers(**orjson.loads(page_info)))
+
     logger.info("Returning query results.")
-    return results
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/authors/{name}/results", response_model=list[QueryResultResponse], status_code=status.HTTP_200_OK)
+async def get_author_results(
+    name: str,
+    session: AsyncSession = Depends(get_read_session),
+    page: int = Query(0, ge=0),
+    items_per_page: int = Query(10, ge=1),
+    include_total: bool = Query(False, description="Add `X-Total-Count` (estimated for large sets, see `X-Total-Count-Exact`)")
+) -> Response:
+    logger.info("Fetching results for author %s - page %s, items per page %s", name, page, items_per_page)
+    author = {"normalized_name": normalize_author_name(name)}
+    result = await session.execute(
+        _AUTHOR_RESULTS_PAGE, {**author, "offset": page * items_per_page, "limit": items_per_page + 1}
+    )
+    rows = result.all()
+    if not rows:
+        logger.warning("No query results found for author %s on page %s", name, page)
+        raise HTTPException(status_code=404, detail="No query results found for this author.")
+
+    total = await count_rows(session, _AUTHOR_RESULTS, author) if include_total else (None, True)
+    headers = pagination_headers(len(rows) > items_per_page, *total)
+
+    logger.info("Returning author query results.")
+    return Response(content=dump_query_result_rows(rows[:items_per_page]), media_type="application/json", headers=headers)
@@ -1,27 +1,88 @@
+import logging
+import math
 import secrets
 import time
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import BigInteger, String, bindparam, false, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import api_messages, deps
+from app.core import database_session
 from app.core.config import get_settings
+from app.core.metrics import LOGIN_SECONDS, PASSWORD_REHASHES
 from app.core.security.jwt import create_jwt_token
 from app.core.security.password import (
-    DUMMY_PASSWORD,
+    get_dummy_password_hash,
     get_password_hash,
+    needs_rehash,
+    run_password_hashing,
     verify_password,
 )
 from app.models import RefreshToken, User
 from app.schemas.requests import RefreshTokenRequest, UserCreateRequest
 from app.schemas.responses import AccessTokenResponse, UserResponse
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# built once with bind parameters, see `app/api/endpoints/arxiv.py`, each
+# flow is one statement plus its commit
+_users = User.__table__
+_refresh_tokens = RefreshToken.__table__
+_USER_BY_EMAIL = select(User).where(User.email == bindparam("email"))
+# no row when the email is taken, Core rather than ORM RETURNING, which costs
+# more than the round trip it saves
+_INSERT_USER = (
+    insert(_users)
+    .on_conflict_do_nothing(index_elements=[_users.c.email])
+    .returning(_users.c.user_id, _users.c.email)
+)
+# marks the token used and stores its successor, returns the user id when
+# the token was unused and unexpired, goes through "ix_refresh_token_unused"
+_spent_refresh_token = (
+    update(_refresh_tokens)
+    .where(
+        _refresh_tokens.c.refresh_token == bindparam("token"),
+        ~_refresh_tokens.c.used,
+        _refresh_tokens.c.exp >= bindparam("now", type_=BigInteger),
+    )
+    .values(used=True)
+    .returning(_refresh_tokens.c.user_id)
+    .cte("spent")
+)
+_ROTATE_REFRESH_TOKEN = (
+    insert(_refresh_tokens)
+    .from_select(
+        ["refresh_token", "used", "exp", "user_id"],
+        select(
+            bindparam("new_token", type_=String),
+            false(),
+            bindparam("new_exp", type_=BigInteger),
+            _spent_refresh_token.c.user_id,
+        ),
+    )
+    .returning(_refresh_tokens.c.user_id)
+)
+# only after a failed rotation, to tell why
+_REFRESH_TOKEN_STATE = select(_refresh_tokens.c.used, _refresh_tokens.c.exp).where(
+    _refresh_tokens.c.refresh_token == bindparam("token")
+)
+
+# bcrypt endpoints are admitted through `deps.admit_password_hashing`
+ADMISSION_RESPONSES: dict[int | str, dict[str, Any]] = {
+    429: {
+        "description": "Too many requests from this client or to this worker, see the `Retry-After` header",
+        "content": {
+            "application/json": {"example": {"detail": api_messages.TOO_MANY_REQUESTS}}
+        },
+    },
+}
+
 ACCESS_TOKEN_RESPONSES: dict[int | str, dict[str, Any]] = {
     400: {
         "description": "Invalid email or password",
@@ -29,6 +90,7 @@ ACCESS_TOKEN_RESPONSES: dict[int | str, dict[str, Any]] = {
             "application/json": {"example": {"detail": api_messages.PASSWORD_INVALID}}
         },
     },
+    **ADMISSION_RESPONSES,
 }
 
 REFRESH_TOKEN_RESPONSES: dict[int | str, dict[str, Any]] = {
@@ -65,28 +127,50 @@ REFRESH_TOKEN_RESPONSES: dict[int | str, dict[str, Any]] = {
     response_model=AccessTokenResponse,
     responses=ACCESS_TOKEN_RESPONSES,
     description="OAuth2 compatible token, get an access token for future requests using username and password",
+    dependencies=[Depends(deps.admit_password_hashing)],
 )
 async def login_access_token(
+    background_tasks: BackgroundTasks,
     session: AsyncSession = Depends(deps.get_session),
     form_data: OAuth2PasswordRequestForm = Depends(),
 ) -> AccessTokenResponse:
-    user = await session.scalar(select(User).where(User.email == form_data.username))
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        response = await _login(session, form_data, background_tasks)
+        outcome = "success"
+        return response
+    except HTTPException as exc:
+        outcome = "rejected" if exc.status_code == status.HTTP_503_SERVICE_UNAVAILABLE else "invalid"
+        raise
+    finally:
+        LOGIN_SECONDS.labels(outcome).observe(time.perf_counter() - start)
+
+
+async def _login(
+    session: AsyncSession, form_data: OAuth2PasswordRequestForm, background_tasks: BackgroundTasks
+) -> AccessTokenResponse:
+    user = await session.scalar(_USER_BY_EMAIL, {"email": form_data.username})
 
     if user is None:
         # this is naive method to not return early
-        verify_password(form_data.password, DUMMY_PASSWORD)
+        await run_password_hashing(verify_password, form_data.password, get_dummy_password_hash())
 
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=api_messages.PASSWORD_INVALID,
         )
 
-    if not verify_password(form_data.password, user.hashed_password):
+    if not await run_password_hashing(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=api_messages.PASSWORD_INVALID,
         )
 
+    if get_settings().security.password_rehash_on_login and needs_rehash(user.hashed_password):
+        # after the response, the login does not wait for a second hash
+        background_tasks.add_task(_rehash_password, user.user_id, user.hashed_password, form_data.password)
+
     jwt_token = create_jwt_token(user_id=user.user_id)
 
     refresh_token = RefreshToken(
@@ -105,6 +189,28 @@ async def login_access_token(
     )
 
 
+async def _rehash_password(user_id: str, old_hashed_password: str, password: str) -> None:
+    """Store the password at the current bcrypt cost, unless it was changed meanwhile."""
+    try:
+        hashed_password = await run_password_hashing(get_password_hash, password)
+    except HTTPException:
+        # hashing saturated, a later login tries again
+        return
+    try:
+        async with database_session.get_async_session() as session:
+            result = await session.execute(
+                update(User)
+                .where(User.user_id == user_id, User.hashed_password == old_hashed_password)
+                .values(hashed_password=hashed_password)
+            )
+            await session.commit()
+    except Exception:
+        logger.exception("Could not store rehashed password")
+        return
+    if result.rowcount:
+        PASSWORD_REHASHES.inc()
+
+
 @router.post(
     "/refresh-token",
     response_model=AccessTokenResponse,
@@ -115,80 +221,65 @@ async def refresh_token(
     data: RefreshTokenRequest,
     session: AsyncSession = Depends(deps.get_session),
 ) -> AccessTokenResponse:
-    token = await session.scalar(
-        select(RefreshToken)
-        .where(RefreshToken.refresh_token == data.refresh_token)
-        .with_for_update(skip_locked=True)
+    now = time.time()
+    new_refresh_token = secrets.token_urlsafe(32)
+    new_exp = int(now + get_settings().security.refresh_token_expire_secs)
+    user_id = await session.scalar(
+        _ROTATE_REFRESH_TOKEN,
+        # expired once now > exp, as exp is whole seconds
+        {"token": data.refresh_token, "now": math.ceil(now), "new_token": new_refresh_token, "new_exp": new_exp},
     )
 
-    if token is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=api_messages.REFRESH_TOKEN_NOT_FOUND,
-        )
-    elif time.time() > token.exp:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=api_messages.REFRESH_TOKEN_EXPIRED,
-        )
-    elif token.used:
+    if user_id is None:
+        # nothing was written, the transaction ends with the session
+        token = (await session.execute(_REFRESH_TOKEN_STATE, {"token": data.refresh_token})).first()
+        if token is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=api_messages.REFRESH_TOKEN_NOT_FOUND,
+            )
+        elif now > token.exp:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=api_messages.REFRESH_TOKEN_EXPIRED,
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=api_messages.REFRESH_TOKEN_ALREADY_USED,
         )
-
-    token.used = True
-    session.add(token)
-
-    jwt_token = create_jwt_token(user_id=token.user_id)
-
-    refresh_token = RefreshToken(
-        user_id=token.user_id,
-        refresh_token=secrets.token_urlsafe(32),
-        exp=int(time.time() + get_settings().security.refresh_token_expire_secs),
-    )
-    session.add(refresh_token)
     await session.commit()
 
+    jwt_token = create_jwt_token(user_id=str(user_id))
+
     return AccessTokenResponse(
         access_token=jwt_token.access_token,
         expires_at=jwt_token.payload.exp,
-        refresh_token=refresh_token.refresh_token,
-        refresh_token_expires_at=refresh_token.exp,
+        refresh_token=new_refresh_token,
+        refresh_token_expires_at=new_exp,
     )
 
 
 @router.post(
     "/register",
     response_model=UserResponse,
+    responses=ADMISSION_RESPONSES,
     description="Create new user",
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(deps.admit_password_hashing)],
 )
 async def register_new_user(
     new_user: UserCreateRequest,
     session: AsyncSession = Depends(deps.get_session),
 ) -> User:
-    user = await session.scalar(select(User).where(User.email == new_user.email))
-    if user is not None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=api_messages.EMAIL_ADDRESS_ALREADY_USED,
-        )
-
-    user = User(
-        email=new_user.email,
-        hashed_password=get_password_hash(new_user.password),
-    )
-    session.add(user)
-
-    try:
-        await session.commit()
-    except IntegrityError:  # pragma: no cover
-        await session.rollback()
-
+    # hashed before knowing whether the email is taken, so answers for taken
+    # and free addresses take equally long
+    hashed_password = await run_password_hashing(get_password_hash, new_user.password)
+    row = (await session.execute(_INSERT_USER, {"email": new_user.email, "hashed_password": hashed_password})).first()
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=api_messages.EMAIL_ADDRESS_ALREADY_USED,
         )
+    await session.commit()
 
-    return user
+    return User(user_id=row.user_id, email=row.email)
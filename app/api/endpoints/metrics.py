@@ -0,0 +1,13 @@
+# Prometheus scrape endpoint, metrics are defined in `app/core/metrics.py`.
+
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from app.core.metrics import scrape_registry
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=Response, description="Metrics in Prometheus text format")
+async def get_metrics() -> Response:
+    return Response(content=generate_latest(scrape_registry()), media_type=CONTENT_TYPE_LATEST)
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, status
-from sqlalchemy import delete
+from sqlalchemy import delete, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import deps
-from app.core.security.password import get_password_hash
+from app.core.security.password import get_password_hash, run_password_hashing
+from app.core.user_cache import invalidate_user
 from app.models import User
 from app.schemas.requests import UserUpdatePasswordRequest
 from app.schemas.responses import UserResponse
@@ -29,6 +30,7 @@ async def delete_current_user(
 ) -> None:
     await session.execute(delete(User).where(User.user_id == current_user.user_id))
     await session.commit()
+    await invalidate_user(current_user.user_id)
 
 
 @router.post(
@@ -41,6 +43,12 @@ async def reset_current_user_password(
     session: AsyncSession = Depends(deps.get_session),
     current_user: User = Depends(deps.get_current_user),
 ) -> None:
-    current_user.hashed_password = get_password_hash(user_update_password.password)
-    session.add(current_user)
+    hashed_password = await run_password_hashing(get_password_hash, user_update_password.password)
+    # current_user may come from a read replica session, write through this one
+    await session.execute(
+        update(User)
+        .where(User.user_id == current_user.user_id)
+        .values(hashed_password=hashed_password)
+    )
     await session.commit()
+    await invalidate_user(current_user.user_id)
@@ -0,0 +1,80 @@
+# HTTP conditional request helpers for read endpoints.
+#
+# ETags are derived from cheap database watermarks (index-only min/max/count lookups)
+# instead of from the response body, so a matching `If-None-Match` or
+# `If-Modified-Since` is answered with 304 before the rows are even loaded.
+#
+# https://www.rfc-editor.org/rfc/rfc9110#section-13
+
+
+import hashlib
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any
+
+from fastapi import Request, Response, status
+
+from app.core.config import get_settings
+
+NO_CACHE = "no-cache"
+
+
+def make_etag(*watermark: Any) -> str:
+    digest = hashlib.blake2b(repr(watermark).encode(), digest_size=16).hexdigest()
+    # weak, the same watermark means the same rows, not the same bytes
+    return f'W/"{digest}"'
+
+
+def as_utc(value: datetime) -> datetime:
+    # timestamps are stored as naive UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def closed_range_cache_control(range_end: datetime | None) -> str:
+    """Cacheable `Cache-Control` for ranges that can no longer receive rows.
+
+    Not `immutable`: retention still deletes from old ranges, clients
+    revalidate once `closed_range_max_age_secs` is up.
+    """
+    settings = get_settings().http_cache
+    settled_before = datetime.now(timezone.utc) - timedelta(
+        seconds=settings.closed_range_settle_secs
+    )
+    if range_end is not None and as_utc(range_end) < settled_before:
+        return f"public, max-age={settings.closed_range_max_age_secs}"
+    return NO_CACHE
+
+
+def validator_headers(
+    etag: str, last_modified: datetime | None, cache_control: str
+) -> dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(as_utc(last_modified), usegmt=True)
+    return headers
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: datetime | None
+) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since, weak comparison
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in candidates or etag.removeprefix("W/") in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have a one second resolution
+    return as_utc(last_modified).replace(microsecond=0) <= as_utc(since)
+
+
+def not_modified_response(headers: dict[str, str]) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
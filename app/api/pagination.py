@@ -0,0 +1,98 @@
+# Pagination metadata that never needs an extra full scan.
+#
+# `has_more` comes from fetching one row past the page. Totals are exact only
+# when the planner expects a small set, otherwise the planner estimate is
+# returned as is (EXPLAIN scales pg_class.reltuples to the current table size
+# and applies the filter selectivity, so it also works for filtered sets).
+#
+# Metadata is sent as headers so the list bodies keep their shape.
+#
+# Cursors are opaque, url safe tokens of the sort key of the last row sent, the
+# next page is a `WHERE key > cursor ORDER BY key LIMIT n` index range scan
+# whose cost does not grow with the page number.
+
+
+import base64
+import binascii
+from collections.abc import Mapping
+from typing import Any
+
+import orjson
+from fastapi import HTTPException, status
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.compiler import SQLCompiler
+from sqlalchemy.sql.elements import ClauseElement
+
+from app.core.config import get_settings
+
+PAGINATION_HEADERS = ["X-Has-More", "X-Next-Cursor", "X-Total-Count", "X-Total-Count-Exact"]
+
+
+class ExplainJson(Executable, ClauseElement):
+    """`EXPLAIN (FORMAT JSON)` of a statement, keeping its bound parameters."""
+
+    inherit_cache = False
+
+    def __init__(self, statement: Select[Any]) -> None:
+        self.statement = statement
+
+
+@compiles(ExplainJson, "postgresql")
+def _compile_explain_json(
+    element: ExplainJson, compiler: SQLCompiler, **kw: Any
+) -> str:
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+async def estimate_rows(
+    session: AsyncSession, statement: Select[Any], params: Mapping[str, Any] | None = None
+) -> int:
+    plan = await session.scalar(ExplainJson(statement), params)
+    if isinstance(plan, str | bytes):
+        plan = orjson.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def count_rows(
+    session: AsyncSession, statement: Select[Any], params: Mapping[str, Any] | None = None
+) -> tuple[int, bool]:
+    """Row count of `statement` (with bind `params`) and whether it is exact."""
+    estimate = await estimate_rows(session, statement, params)
+    if estimate > get_settings().pagination.exact_count_threshold:
+        return estimate, False
+
+    exact = await session.scalar(select(func.count()).select_from(statement.subquery()), params)
+    return int(exact or 0), True
+
+
+def encode_cursor(*key: Any) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(key)).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list[Any]:
+    """Sort key of `size` values from `cursor`, 400 when it was not ours."""
+    try:
+        key = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        key = None
+    if not isinstance(key, list) or len(key) != size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+    return key
+
+
+def pagination_headers(
+    has_more: bool,
+    total: int | None = None,
+    total_exact: bool = True,
+    next_cursor: str | None = None,
+) -> dict[str, str]:
+    headers = {"X-Has-More": "true" if has_more else "false"}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        headers["X-Total-Count"] = str(total)
+        headers["X-Total-Count-Exact"] = "true" if total_exact else "false"
+    return headers
@@ -0,0 +1,152 @@
+# Admission control for the endpoints that hash passwords.
+#
+# `POST /auth/access-token` and `POST /auth/register` cost a bcrypt call each,
+# unknown users included, so a credential stuffing burst could spend all CPU
+# on them and starve every other endpoint. They are admitted through token
+# buckets, checked per client (by address, with "per_client_enabled") and
+# then for the whole worker. Client addresses are only the clients' own when
+# uvicorn trusts the reverse proxy in front, see "server__forwarded_allow_ips".
+# Requests without a token get 429 with `Retry-After`, the time until the
+# bucket that refused them refills one.
+#
+# The worker bucket adapts to load. `run_load_sampler` measures every
+# `sample_interval_secs` the CPU this process used (event loop and bcrypt
+# threads, in CPU seconds per second) and how late the event loop woke up. While
+# either is above its limit the worker rate is halved, down to
+# `min_rate_factor` of `global_rate`, and otherwise recovers by `recovery_step`
+# per sample. The rest of the API is never throttled, it keeps what the auth
+# endpoints are refused.
+#
+# Configured by the "admission" settings group, see `app/core/config.py`.
+
+
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from app.core.config import get_settings
+from app.core.metrics import ADMISSION_RATE_FACTOR, ADMISSION_REJECTED, EVENT_LOOP_LAG_SECONDS
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_take(self, now: float) -> float:
+        """Take a token, returns 0 when there was one or else the seconds until there is."""
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        per_client_enabled: bool,
+        per_client_rate: float,
+        per_client_burst: int,
+        global_rate: float,
+        global_burst: int,
+        max_clients: int,
+        max_cpu_utilization: float,
+        max_loop_lag_secs: float,
+        min_rate_factor: float,
+        recovery_step: float,
+    ) -> None:
+        self.per_client_enabled = per_client_enabled
+        self.per_client_rate = per_client_rate
+        self.per_client_burst = per_client_burst
+        self.global_rate = global_rate
+        self.max_clients = max_clients
+        self.max_cpu_utilization = max_cpu_utilization
+        self.max_loop_lag_secs = max_loop_lag_secs
+        self.min_rate_factor = min_rate_factor
+        self.recovery_step = recovery_step
+        self.rate_factor = 1.0
+        self.worker = TokenBucket(global_rate, global_burst, time.monotonic())
+        # client -> bucket, least recently seen first
+        self.clients: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    def admit(self, client: str, now: float) -> float:
+        """0 when admitted, otherwise seconds to wait before retrying."""
+        if not self.per_client_enabled:
+            wait = self.worker.try_take(now)
+            if wait:
+                ADMISSION_REJECTED.labels("worker").inc()
+            return wait
+
+        bucket = self.clients.get(client)
+        if bucket is None:
+            bucket = self.clients[client] = TokenBucket(self.per_client_rate, self.per_client_burst, now)
+            if len(self.clients) > self.max_clients:
+                self.clients.popitem(last=False)
+        else:
+            self.clients.move_to_end(client)
+
+        wait = bucket.try_take(now)
+        if wait:
+            ADMISSION_REJECTED.labels("client").inc()
+            return wait
+        wait = self.worker.try_take(now)
+        if wait:
+            # refused anyway, the client keeps its token
+            bucket.tokens += 1
+            ADMISSION_REJECTED.labels("worker").inc()
+        return wait
+
+    def record_load(self, cpu_utilization: float, loop_lag_secs: float, now: float) -> None:
+        """Adapt the worker rate to one load sample, additive increase, multiplicative decrease."""
+        if cpu_utilization > self.max_cpu_utilization or loop_lag_secs > self.max_loop_lag_secs:
+            self.rate_factor = max(self.min_rate_factor, self.rate_factor / 2)
+        else:
+            self.rate_factor = min(1.0, self.rate_factor + self.recovery_step)
+        # tokens gathered so far keep the old rate
+        self.worker.refill(now)
+        self.worker.rate = self.global_rate * self.rate_factor
+        ADMISSION_RATE_FACTOR.set(self.rate_factor)
+
+
+@lru_cache(maxsize=1)
+def get_admission_controller() -> AdmissionController:
+    settings = get_settings().admission
+    return AdmissionController(
+        per_client_enabled=settings.per_client_enabled,
+        per_client_rate=settings.per_client_rate,
+        per_client_burst=settings.per_client_burst,
+        global_rate=settings.global_rate,
+        global_burst=settings.global_burst,
+        max_clients=settings.max_clients,
+        max_cpu_utilization=settings.max_cpu_utilization,
+        max_loop_lag_secs=settings.max_loop_lag_secs,
+        min_rate_factor=settings.min_rate_factor,
+        recovery_step=settings.recovery_step,
+    )
+
+
+def retry_after(wait_secs: float) -> str:
+    return str(max(1, math.ceil(wait_secs)))
+
+
+async def run_load_sampler() -> None:
+    """Feed CPU use and event loop lag to the admission controller forever."""
+    interval = get_settings().admission.sample_interval_secs
+    wall, cpu = time.monotonic(), time.process_time()
+    while True:
+        await asyncio.sleep(interval)
+        now, cpu_now = time.monotonic(), time.process_time()
+        # the sleep ends late by however long the loop was busy with other callbacks
+        lag = max(0.0, now - wall - interval)
+        EVENT_LOOP_LAG_SECONDS.set(lag)
+        get_admission_controller().record_load((cpu_now - cpu) / (now - wall), lag, now)
+        wall, cpu = now, cpu_now
@@ -0,0 +1,259 @@
+# Shared cache with pluggable backends.
+#
+# "memory" keeps an LRU per process, bounded by entries and by bytes, fine for
+# a single worker and tests.
+# "redis" talks the Redis protocol, so entries are shared by every uvicorn
+# worker and node and survive restarts. Values are opaque bytes, callers own
+# serialization, keys are namespaced as "{key_prefix}:{namespace}:{key}".
+#
+# The cache is an optimization, never a dependency: backend errors (Redis down
+# or timing out) are logged and counted, reads then miss and writes are
+# skipped, requests carry on against the database.
+#
+# `get_local_cache` is always in process memory whatever the backend, for hot
+# data that must not cost a network round trip and that other workers
+# invalidate by message, see `app/core/user_cache.py`.
+#
+# Configured by the "cache" settings group, see `app/core/config.py`.
+
+
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any
+
+from app.core.config import get_settings
+from app.core.metrics import register_stats
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheMetrics:
+    hits: int = 0
+    misses: int = 0
+    sets: int = 0
+    deletes: int = 0
+    errors: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get_many(self, keys: Sequence[str]) -> list[bytes | None]: ...
+
+    @abstractmethod
+    async def set_many(self, items: Mapping[str, bytes], ttl: int | None) -> None: ...
+
+    @abstractmethod
+    async def delete_many(self, keys: Sequence[str]) -> None: ...
+
+    async def close(self) -> None:
+        return None
+
+
+class InMemoryBackend(CacheBackend):
+    def __init__(self, max_entries: int, max_bytes: int | None = None) -> None:
+        self.max_entries = max_entries
+        # keys and values, a value above it on its own is not stored
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.evictions = 0
+        # key -> (monotonic expiry or None, value), least recently used first
+        self._entries: OrderedDict[str, tuple[float | None, bytes]] = OrderedDict()
+
+    def _remove(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self.size_bytes -= len(key) + len(value)
+
+    async def get_many(self, keys: Sequence[str]) -> list[bytes | None]:
+        now = time.monotonic()
+        values: list[bytes | None] = []
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                values.append(None)
+            elif entry[0] is not None and entry[0] <= now:
+                self._remove(key)
+                values.append(None)
+            else:
+                self._entries.move_to_end(key)
+                values.append(entry[1])
+        return values
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: int | None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        for key, value in items.items():
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and len(key) + len(value) > self.max_bytes:
+                continue
+            self._entries[key] = (expires_at, value)
+            self.size_bytes += len(key) + len(value)
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes is not None and self.size_bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        for key in keys:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend(CacheBackend):
+    def __init__(self, client: Any) -> None:
+        # any redis.asyncio.Redis compatible client, e.g. fakeredis in tests
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        import redis.asyncio
+
+        return cls(redis.asyncio.Redis.from_url(url))
+
+    async def get_many(self, keys: Sequence[str]) -> list[bytes | None]:
+        if not keys:
+            return []
+        return list(await self.client.mget(keys))
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: int | None) -> None:
+        if not items:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(key, value, ex=ttl or None)
+            await pipe.execute()
+
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        if keys:
+            await self.client.delete(*keys)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class Cache:
+    """Namespaced view over a backend, with per namespace metrics."""
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        namespace: str,
+        default_ttl: int | None = None,
+        key_prefix: str = "",
+    ) -> None:
+        self.backend = backend
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.metrics = CacheMetrics()
+        self._prefix = f"{key_prefix}:{namespace}:" if key_prefix else f"{namespace}:"
+
+    def _key(self, key: str) -> str:
+        return self._prefix + key
+
+    async def get(self, key: str) -> bytes | None:
+        return (await self.get_many([key]))[0]
+
+    def _failed(self, operation: str) -> None:
+        self.metrics.errors += 1
+        logger.warning("Cache %s of %r failed, carrying on without it", operation, self.namespace, exc_info=True)
+
+    async def get_many(self, keys: Sequence[str]) -> list[bytes | None]:
+        try:
+            values = await self.backend.get_many([self._key(key) for key in keys])
+        except Exception:
+            self._failed("get")
+            values = [None] * len(keys)
+        hits = sum(value is not None for value in values)
+        self.metrics.hits += hits
+        self.metrics.misses += len(values) - hits
+        return values
+
+    async def set(self, key: str, value: bytes, ttl: int | None = None) -> None:
+        await self.set_many({key: value}, ttl)
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: int | None = None) -> None:
+        try:
+            await self.backend.set_many(
+                {self._key(key): value for key, value in items.items()},
+                ttl if ttl is not None else self.default_ttl,
+            )
+        except Exception:
+            self._failed("set")
+            return
+        self.metrics.sets += len(items)
+
+    async def delete(self, *keys: str) -> None:
+        try:
+            await self.backend.delete_many([self._key(key) for key in keys])
+        except Exception:
+            self._failed("delete")
+            return
+        self.metrics.deletes += len(keys)
+
+
+@lru_cache(maxsize=1)
+def get_cache_backend() -> CacheBackend:
+    settings = get_settings().cache
+    if settings.backend == "redis":
+        return RedisBackend.from_url(settings.redis_url)
+    return InMemoryBackend(max_entries=settings.max_entries, max_bytes=settings.max_bytes)
+
+
+_CACHES: dict[str, Cache] = {}
+
+
+def get_cache(namespace: str, default_ttl: int | None = None) -> Cache:
+    cache = _CACHES.get(namespace)
+    if cache is None or cache.backend is not get_cache_backend():
+        cache = Cache(
+            get_cache_backend(),
+            namespace,
+            default_ttl=default_ttl,
+            key_prefix=get_settings().cache.key_prefix,
+        )
+        _CACHES[namespace] = cache
+    return cache
+
+
+_LOCAL_CACHES: dict[str, Cache] = {}
+
+
+def get_local_cache(namespace: str, max_entries: int, default_ttl: int | None = None) -> Cache:
+    cache = _LOCAL_CACHES.get(namespace)
+    if cache is None:
+        cache = Cache(InMemoryBackend(max_entries), namespace, default_ttl=default_ttl)
+        _LOCAL_CACHES[namespace] = cache
+    return cache
+
+
+def clear_local_caches() -> None:
+    for cache in _LOCAL_CACHES.values():
+        cache.backend.clear()  # type: ignore[attr-defined]
+
+
+def cache_metrics() -> dict[str, dict[str, float]]:
+    return {
+        namespace: {**asdict(cache.metrics), "hit_rate": cache.metrics.hit_rate}
+        for namespace, cache in (_CACHES | _LOCAL_CACHES).items()
+    }
+
+
+register_stats("cache", cache_metrics, counters={"hits", "misses", "sets", "deletes", "errors"}, label="namespace")
@@ -16,6 +16,7 @@
 
 from functools import lru_cache
 from pathlib import Path
+from typing import Literal
 
 from pydantic import AnyHttpUrl, BaseModel, SecretStr, computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -28,8 +29,18 @@ class Security(BaseModel):
     jwt_issuer: str = "my-app"
     jwt_secret_key: SecretStr
     jwt_access_token_expire_secs: int = 24 * 3600  # 1d
+    # verified access tokens kept per process, until they expire
+    jwt_verified_cache_size: int = 10_000
     refresh_token_expire_secs: int = 28 * 24 * 3600  # 28d
     password_bcrypt_rounds: int = 12
+    # bounds of the cost `python -m app.core.security.password` proposes
+    password_bcrypt_min_rounds: int = 10
+    password_bcrypt_max_rounds: int = 16
+    # stored hashes of a lower cost are replaced after a successful login
+    password_rehash_on_login: bool = True
+    # bcrypt runs on its own threads, calls beyond max pending get a 503
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 32
     allowed_hosts: list[str] = ["localhost", "127.0.0.1"]
     backend_cors_origins: list[AnyHttpUrl] = []
 
@@ -40,11 +51,173 @@ class Database(BaseModel):
     password: SecretStr
     port: int = 5432
     db: str = "postgres"
+    # per process and engine, so max connections is workers * (size + overflow)
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout_secs: float = 30.0
+    pool_recycle_secs: int = 600
+    pool_pre_ping: bool = True
+    # opened per pool at startup, at most pool_size
+    pool_prewarm_connections: int = 2
+    # optional read replica for read endpoints, same credentials and database,
+    # reads fall back to the primary while it lags or is unreachable
+    replica_hostname: str | None = None
+    replica_port: int | None = None  # defaults to "port"
+    replica_max_lag_secs: float = 5.0
+    replica_check_interval_secs: float = 5.0
+    replica_connect_timeout_secs: float = 2.0
+    # statements kept prepared per asyncpg connection, 0 disables (required
+    # behind pgbouncer in transaction pooling mode)
+    prepared_statement_cache_size: int = 100
+    # compiled SQL strings kept by SQLAlchemy per engine
+    compiled_cache_size: int = 500
+
+
+class Server(BaseModel):
+    # `python -m app.serve`, see `app/serve.py`
+    host: str = "0.0.0.0"
+    port: int = 8000
+    workers: int | None = None  # defaults to the CPUs available to the process
+    # in-flight requests get this long to finish after SIGTERM
+    graceful_shutdown_secs: int = 30
+    # comma separated addresses of reverse proxies whose X-Forwarded-For is
+    # the client address, "*" for any, defaults to uvicorn's "127.0.0.1"
+    forwarded_allow_ips: str | None = None
+
+
+class Upstream(BaseModel):
+    # shared HTTP client for upstream APIs, see `app/core/http_client.py`
+    arxiv_api_url: str = "https://export.arxiv.org/api/query"
+    pool_maxsize: int = 10  # keep-alive connections per host
+    prewarm_connections: int = 1
+    prewarm_timeout_secs: float = 5.0
+    # per upstream request, exceeding either answers the search with a 503
+    connect_timeout_secs: float = 5.0
+    read_timeout_secs: float = 30.0
+
+
+class Admission(BaseModel):
+    # token buckets in front of the password hashing endpoints, see `app/core/admission.py`
+    enabled: bool = True
+    # off until client addresses are the clients' own: behind a proxy not in
+    # "server__forwarded_allow_ips" every client shares the proxy's bucket
+    per_client_enabled: bool = False
+    per_client_rate: float = 0.5  # requests per second per client address
+    per_client_burst: int = 10
+    global_rate: float = 10.0  # per worker, lowered under load
+    global_burst: int = 20
+    max_clients: int = 10_000
+    sample_interval_secs: float = 0.5
+    # CPU seconds per second used by the worker, 1.0 is a whole core
+    max_cpu_utilization: float = 0.8
+    max_loop_lag_secs: float = 0.05
+    min_rate_factor: float = 0.1
+    recovery_step: float = 0.1
+
+
+class HttpCache(BaseModel):
+    # time ranges ending this long ago are considered closed, new rows are
+    # timestamped on insert so they cannot land in them anymore
+    closed_range_settle_secs: int = 5 * 60  # 5min
+    # short enough for retention deleting from old ranges to show up
+    closed_range_max_age_secs: int = 3600  # 1h
+
+
+class Cache(BaseModel):
+    # "redis" shares entries across workers and nodes, "memory" is per process
+    backend: Literal["memory", "redis"] = "memory"
+    redis_url: str = "redis://localhost:6379/0"
+    key_prefix: str = "app"
+    max_entries: int = 10_000  # memory backend only
+    # memory backend only, keys and values, whole export bodies are cached
+    max_bytes: int = 64 * 1024 * 1024  # 64MiB
+    arxiv_search_ttl_secs: int = 15 * 60  # 15min
+    arxiv_read_ttl_secs: int = 5 * 60  # 5min
+
+
+class UserCache(BaseModel):
+    # users of authenticated requests kept per process, see `app/core/user_cache.py`
+    enabled: bool = True
+    ttl_secs: int = 60
+    max_entries: int = 10_000
+    # how other workers learn about deleted users and changed passwords,
+    # "local" only suits a single worker
+    invalidation: Literal["local", "postgres", "redis"] = "postgres"
+    channel_name: str = "user_cache"
+    reconnect_interval_secs: float = 5.0
+
+
+class Pagination(BaseModel):
+    # above this planner estimate, totals are reported as estimates instead of
+    # running an exact COUNT(*)
+    exact_count_threshold: int = 10_000
+
+
+class Partitions(BaseModel):
+    # monthly partitions of query_records and query_results, see `app/core/partitions.py`
+    maintenance_enabled: bool = True
+    maintenance_interval_secs: int = 3600  # 1h
+    premake_months: int = 3
+    # partitions entirely older than this many months are detached, None keeps all
+    detach_after_months: int | None = None
+
+
+class Retention(BaseModel):
+    # archives and deletes old search history, see `app/core/retention.py`
+    enabled: bool = False
+    interval_secs: int = 24 * 3600  # 1d
+    query_history_days: int = 365
+    # a volume in docker-compose.yml, relative paths are to the project root
+    archive_dir: str = "/var/lib/app/archive"
+    batch_size: int = 1000
+    batch_pause_secs: float = 0.1
+
+
+class TokenReaper(BaseModel):
+    # deletes used and expired refresh tokens, see `app/core/token_reaper.py`
+    enabled: bool = True
+    interval_secs: int = 600  # 10min
+    batch_size: int = 1000
+    batch_pause_secs: float = 0.1
+
+
+class WriteBehind(BaseModel):
+    # batched search persistence, see `app/core/write_behind.py`
+    enabled: bool = False
+    # "committed" responds after the batch committed, "enqueued" once queued
+    durability: Literal["committed", "enqueued"] = "committed"
+    synchronous_commit: bool = True
+    queue_size: int = 10_000  # searches
+    batch_size: int = 500  # searches per transaction
+    flush_interval_secs: float = 0.05
+    enqueue_timeout_secs: float = 1.0  # waiting for room, then 503
+    id_block_size: int = 1000
+
+
+class Metrics(BaseModel):
+    # Prometheus metrics of all workers, see `app/core/metrics.py`
+    # shared by the workers of `app.serve` and emptied when it starts, one
+    # directory per server on a host
+    multiproc_dir: str = "/tmp/app-metrics"
+    # how often workers copy pool and stats collectors for other workers' scrapes
+    sync_interval_secs: float = 5.0
 
 
 class Settings(BaseSettings):
     security: Security
     database: Database
+    server: Server = Server()
+    upstream: Upstream = Upstream()
+    admission: Admission = Admission()
+    http_cache: HttpCache = HttpCache()
+    cache: Cache = Cache()
+    user_cache: UserCache = UserCache()
+    pagination: Pagination = Pagination()
+    partitions: Partitions = Partitions()
+    retention: Retention = Retention()
+    token_reaper: TokenReaper = TokenReaper()
+    write_behind: WriteBehind = WriteBehind()
+    metrics: Metrics = Metrics()
 
     @computed_field  # type: ignore[misc]
     @property
@@ -58,6 +231,16 @@ class Settings(BaseSettings):
             database=self.database.db,
         )
 
+    @computed_field  # type: ignore[misc]
+    @property
+    def sqlalchemy_replica_database_uri(self) -> URL | None:
+        if self.database.replica_hostname is None:
+            return None
+        return self.sqlalchemy_database_uri.set(
+            host=self.database.replica_hostname,
+            port=self.database.replica_port or self.database.port,
+        )
+
     model_config = SettingsConfigDict(
         env_file=f"{PROJECT_DIR}/.env",
         case_sensitive=False,
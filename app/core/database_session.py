@@ -4,33 +4,247 @@
 #
 # for pool size configuration:
 # https://docs.sqlalchemy.org/en/20/core/pooling.html#sqlalchemy.pool.Pool
+#
+# Pools are sized by the "database" settings group. Checkout wait time,
+# timeouts and occupancy are exported per pool ("primary", "replica") on
+# `GET /metrics`, see `app/core/metrics.py`, as are replica health and lag.
+#
+# Engines are created on first use rather than at import, so importing the app
+# opens nothing a pre-fork server would share between workers. The app lifespan
+# opens "database__pool_prewarm_connections" per pool before the first request
+# (`prewarm_engines`) and closes them on shutdown (`dispose_engines`).
+#
+# With "database__replica_hostname" set, `get_async_read_session` hands out
+# sessions on the read replica while `ReplicaMonitor` sees it up and within
+# "database__replica_max_lag_secs" of the primary, and primary sessions otherwise.
 
 
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
+from typing import Any
+
+from sqlalchemy import exc, text
 from sqlalchemy.engine.url import URL
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
 
 from app.core.config import get_settings
+from app.core.metrics import DB_POOL_CHECKOUT_SECONDS, DB_POOL_TIMEOUTS, register_engine, register_stats
+
+logger = logging.getLogger(__name__)
+
+# what the lag is computed from, the WAL receiver status needs a role with
+# pg_read_all_stats (e.g. pg_monitor), it reads as not streaming otherwise
+REPLICA_STATE = (
+    "SELECT pg_is_in_recovery() AS in_recovery,"
+    " EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') AS streaming,"
+    " pg_last_wal_receive_lsn() AS receive_lsn,"
+    " pg_last_wal_replay_lsn() AS replay_lsn,"
+    " pg_last_xact_replay_timestamp() AS replay_at"
+)
+# seconds the replica is behind, 0 when it replayed everything it received
+# (an idle primary would otherwise look like growing lag) or is not a replica.
+# NULL while the WAL receiver is not streaming: replay then catches up with
+# the last WAL received and stays there, however far the primary moves on
+REPLICA_LAG = (
+    "CASE"
+    " WHEN NOT in_recovery THEN 0"
+    " WHEN NOT streaming THEN NULL"
+    " WHEN receive_lsn = replay_lsn THEN 0"
+    " ELSE COALESCE(EXTRACT(EPOCH FROM now() - replay_at), 0)"
+    " END"
+)
+REPLICA_LAG_QUERY = text(f"SELECT {REPLICA_LAG} FROM ({REPLICA_STATE}) AS replica")
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool recording checkout wait time and timeouts, labelled by its logging name."""
+
+    # log under "sqlalchemy" like the stock pools, which SQLAlchemy keeps at WARN
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.InstrumentedAsyncQueuePool"
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        pool = self.logging_name or "default"
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.labels(pool).inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(pool).observe(time.perf_counter() - start)
+
+
+def new_async_engine(uri: URL, pool_name: str = "primary", **engine_options: Any) -> AsyncEngine:
+    settings = get_settings().database
+    connect_args = {
+        "prepared_statement_cache_size": settings.prepared_statement_cache_size,
+        **engine_options.pop("connect_args", {}),
+    }
+    options: dict[str, Any] = {
+        "poolclass": InstrumentedAsyncQueuePool,
+        "pool_logging_name": pool_name,
+        "pool_pre_ping": settings.pool_pre_ping,
+        "pool_size": settings.pool_size,
+        "max_overflow": settings.max_overflow,
+        "pool_timeout": settings.pool_timeout_secs,
+        "pool_recycle": settings.pool_recycle_secs,
+        "query_cache_size": settings.compiled_cache_size,
+    }
+    engine = create_async_engine(uri, connect_args=connect_args, **(options | engine_options))
+    register_engine(pool_name, engine)
+    return engine
+
+
+class ReplicaMonitor:
+    """Replica health, re-checked at most every `check_interval_secs`."""
+
+    def __init__(self, engine: AsyncEngine, max_lag_secs: float, check_interval_secs: float) -> None:
+        self.engine = engine
+        self.max_lag_secs = max_lag_secs
+        self.check_interval_secs = check_interval_secs
+        self.healthy = False
+        self.lag_secs: float | None = None
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def is_usable(self) -> bool:
+        # one request refreshes the status, concurrent ones use the last known
+        if time.monotonic() - self._checked_at >= self.check_interval_secs and not self._lock.locked():
+            async with self._lock:
+                await self.check()
+        if self.healthy:
+            self.replica_reads += 1
+        else:
+            self.primary_fallbacks += 1
+        return self.healthy
+
+    async def check(self) -> None:
+        try:
+            async with self.engine.connect() as conn:
+                lag_secs = await conn.scalar(REPLICA_LAG_QUERY)
+        except (OSError, SQLAlchemyError, asyncio.TimeoutError) as exc:
+            if self.healthy:
+                logger.warning("Read replica unavailable, reading from primary: %s", exc)
+            self.healthy = False
+            self.lag_secs = None
+        else:
+            if lag_secs is None:
+                # how far behind it is cannot be told
+                if self.healthy:
+                    logger.warning("Read replica WAL receiver not streaming, reading from primary")
+                self.healthy = False
+                self.lag_secs = None
+            else:
+                self.lag_secs = float(lag_secs)
+                if self.healthy and self.lag_secs > self.max_lag_secs:
+                    logger.warning("Read replica lags %.1fs, reading from primary", self.lag_secs)
+                self.healthy = self.lag_secs <= self.max_lag_secs
+        self._checked_at = time.monotonic()
 
+    def mark_unavailable(self) -> None:
+        """Stop using the replica until the next check, after a failed read."""
+        self.healthy = False
+        self._checked_at = time.monotonic()
 
-def new_async_engine(uri: URL) -> AsyncEngine:
-    return create_async_engine(
-        uri,
-        pool_pre_ping=True,
-        pool_size=5,
-        max_overflow=10,
-        pool_timeout=30.0,
-        pool_recycle=600,
-    )
 
+def new_replica_monitor(uri: URL) -> ReplicaMonitor:
+    settings = get_settings().database
+    engine = new_async_engine(uri, "replica", connect_args={"timeout": settings.replica_connect_timeout_secs})
+    return ReplicaMonitor(engine, settings.replica_max_lag_secs, settings.replica_check_interval_secs)
 
-_ASYNC_ENGINE = new_async_engine(get_settings().sqlalchemy_database_uri)
-_ASYNC_SESSIONMAKER = async_sessionmaker(_ASYNC_ENGINE, expire_on_commit=False)
+
+_ASYNC_ENGINE: AsyncEngine | None = None
+_ASYNC_SESSIONMAKER: async_sessionmaker[AsyncSession] | None = None
+
+_REPLICA_MONITOR: ReplicaMonitor | None = None
+_REPLICA_SESSIONMAKER: async_sessionmaker[AsyncSession] | None = None
+
+
+def get_async_engine() -> AsyncEngine:
+    global _ASYNC_ENGINE, _ASYNC_SESSIONMAKER
+    if _ASYNC_ENGINE is None:
+        _ASYNC_ENGINE = new_async_engine(get_settings().sqlalchemy_database_uri)
+        _ASYNC_SESSIONMAKER = async_sessionmaker(_ASYNC_ENGINE, expire_on_commit=False)
+    return _ASYNC_ENGINE
 
 
 def get_async_session() -> AsyncSession:  # pragma: no cover
-    return _ASYNC_SESSIONMAKER()
+    if _ASYNC_SESSIONMAKER is None:
+        get_async_engine()
+    return _ASYNC_SESSIONMAKER()  # type: ignore[misc]
+
+
+def get_replica_monitor() -> ReplicaMonitor | None:
+    global _REPLICA_MONITOR, _REPLICA_SESSIONMAKER
+    if _REPLICA_MONITOR is None and get_settings().database.replica_hostname is not None:
+        _REPLICA_MONITOR = new_replica_monitor(get_settings().sqlalchemy_replica_database_uri)  # type: ignore[arg-type]
+        _REPLICA_SESSIONMAKER = async_sessionmaker(_REPLICA_MONITOR.engine, expire_on_commit=False)
+    return _REPLICA_MONITOR
+
+
+def replica_metrics() -> dict[str, Any]:
+    # scrapes must not create the monitor, and its engine, themselves
+    monitor = _REPLICA_MONITOR
+    if monitor is None:
+        return {}
+    return {
+        "healthy": monitor.healthy,
+        "lag_secs": monitor.lag_secs,
+        "reads": monitor.replica_reads,
+        "primary_fallbacks": monitor.primary_fallbacks,
+    }
+
+
+register_stats("db_replica", replica_metrics, counters={"reads", "primary_fallbacks"})
+
+
+async def prewarm_pool(engine: AsyncEngine, connections: int) -> None:
+    """Open up to `connections` pooled connections now instead of on first use."""
+    # held at the same time so each checkout opens its own connection, beyond
+    # the pool size they would be closed again on return
+    count = min(connections, engine.pool.size())  # type: ignore[attr-defined]
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(*(stack.enter_async_context(engine.connect()) for _ in range(count)))
+
+
+async def prewarm_engines() -> None:
+    """Create the engines and pre-warm their pools, a failing pool is logged and left cold."""
+    engines = [get_async_engine()]
+    if (monitor := get_replica_monitor()) is not None:
+        engines.append(monitor.engine)
+    connections = get_settings().database.pool_prewarm_connections
+    results = await asyncio.gather(*(prewarm_pool(engine, connections) for engine in engines), return_exceptions=True)
+    for engine, result in zip(engines, results):
+        if isinstance(result, Exception):
+            logger.warning("Could not pre-warm %s pool: %s", engine.pool.logging_name, result)
+
+
+async def dispose_engines() -> None:
+    """Close all pooled connections, engines are created again on next use."""
+    global _ASYNC_ENGINE, _ASYNC_SESSIONMAKER, _REPLICA_MONITOR, _REPLICA_SESSIONMAKER
+    engines = [_ASYNC_ENGINE, _REPLICA_MONITOR.engine if _REPLICA_MONITOR is not None else None]
+    _ASYNC_ENGINE = _ASYNC_SESSIONMAKER = _REPLICA_MONITOR = _REPLICA_SESSIONMAKER = None
+    for engine in engines:
+        if engine is not None:
+            await engine.dispose()
+
+
+async def get_async_read_session() -> AsyncSession:
+    """Replica session when configured and healthy, primary session otherwise."""
+    monitor = get_replica_monitor()
+    if monitor is None or _REPLICA_SESSIONMAKER is None or not await monitor.is_usable():
+        return get_async_session()
+    session = _REPLICA_SESSIONMAKER()
+    session.info["replica"] = True
+    return session
@@ -0,0 +1,57 @@
+# Shared HTTP client for upstream APIs (arXiv).
+#
+# One `requests.Session` per process keeps connections to upstreams alive
+# between searches instead of a TCP and TLS handshake for each. It is created
+# on first use, the app lifespan creates it at startup, opens
+# "upstream__prewarm_connections" ahead of the first request and closes it on
+# shutdown.
+#
+# Configured by the "upstream" settings group, see `app/core/config.py`.
+
+
+import asyncio
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_HTTP_CLIENT: requests.Session | None = None
+
+
+def get_http_client() -> requests.Session:
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        client = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=get_settings().upstream.pool_maxsize)
+        client.mount("https://", adapter)
+        client.mount("http://", adapter)
+        _HTTP_CLIENT = client
+    return _HTTP_CLIENT
+
+
+async def prewarm_http_client() -> int:
+    """Open keep-alive connections to the arXiv API, returns how many failed."""
+    settings = get_settings().upstream
+    client = get_http_client()
+    results = await asyncio.gather(
+        *(
+            asyncio.to_thread(client.head, settings.arxiv_api_url, timeout=settings.prewarm_timeout_secs)
+            for _ in range(settings.prewarm_connections)
+        ),
+        return_exceptions=True,
+    )
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        logger.warning("Could not pre-warm %s upstream connections: %s", len(failures), failures[0])
+    return len(failures)
+
+
+def close_http_client() -> None:
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        _HTTP_CLIENT.close()
+        _HTTP_CLIENT = None
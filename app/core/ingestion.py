@@ -0,0 +1,234 @@
+# Bulk helpers used when persisting arXiv search results.
+#
+# Authors are stored once per normalized name in the `authors` table and linked
+# to results through `query_result_authors`, so "papers by author X" is an index
+# lookup instead of a `LIKE '%X%'` scan over `query_results.author`.
+#
+# Analytics rollups are upserted in the same transaction as the search itself,
+# keys are sorted so concurrent ingestions lock rollup rows in the same order.
+# Every search of a day counts towards that day, so its row would serialize
+# all ingestions on its lock: each transaction adds to one of
+# `DAILY_STATS_SHARDS` rows of the day picked at random, readers sum them.
+#
+# `store_searches` writes many searches with ids assigned up front in a handful
+# of statements, it is what the write-behind queue flushes with, see
+# `app/core/write_behind.py`.
+
+
+import random
+from collections import Counter
+from collections.abc import Sequence
+from datetime import date, datetime
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import (
+    Author,
+    DailyQueryStats,
+    JournalStats,
+    QueryRecord,
+    QueryResult,
+    QueryResultAuthor,
+    QueryStats,
+)
+
+
+DAILY_STATS_SHARDS = 16
+
+
+def daily_query_stats() -> Select[tuple[date, int, int]]:
+    """Per day totals of the `daily_query_stats` shards."""
+    return select(
+        DailyQueryStats.day,
+        func.sum(DailyQueryStats.num_queries).label("num_queries"),
+        func.sum(DailyQueryStats.num_results).label("num_results"),
+    ).group_by(DailyQueryStats.day)
+
+
+def normalize_author_name(name: str) -> str:
+    # Must stay in sync with the SQL backfill in the "author table" migration,
+    # which uses lower(regexp_replace(trim(name), '\s+', ' ', 'g'))
+    return " ".join(name.split()).lower()
+
+
+async def store_result_authors(
+    session: AsyncSession,
+    result_authors: Sequence[tuple[int, Sequence[str]]],
+) -> None:
+    """Link already flushed results to their authors.
+
+    `result_authors` holds `(query_result_id, [author name, ...])` pairs.
+    Missing authors are inserted in one statement, whatever the number of
+    results, followed by one lookup and one bulk insert of the links.
+    """
+    display_names: dict[str, str] = {}
+    for _, names in result_authors:
+        for name in names:
+            normalized_name = normalize_author_name(name)
+            if normalized_name:
+                display_names.setdefault(normalized_name, " ".join(name.split()))
+
+    if not display_names:
+        return
+
+    await session.execute(
+        insert(Author).on_conflict_do_nothing(index_elements=[Author.normalized_name]),
+        # sorted like the rollup keys, concurrent ingestions sharing authors
+        # take the unique index locks in the same order
+        [
+            {"name": display_names[normalized_name], "normalized_name": normalized_name}
+            for normalized_name in sorted(display_names)
+        ],
+    )
+    author_ids = dict(
+        (
+            await session.execute(
+                select(Author.normalized_name, Author.id).where(
+                    Author.normalized_name.in_(display_names)
+                )
+            )
+        )
+        .tuples()
+        .all()
+    )
+
+    links: dict[tuple[int, int], int] = {}
+    for query_result_id, names in result_authors:
+        for position, name in enumerate(names):
+            author_id = author_ids.get(normalize_author_name(name))
+            if author_id is not None:
+                links.setdefault((author_id, query_result_id), position)
+
+    await session.execute(
+        insert(QueryResultAuthor),
+        [
+            {
+                "author_id": author_id,
+                "query_result_id": query_result_id,
+                "position": position,
+            }
+            for (author_id, query_result_id), position in links.items()
+        ],
+    )
+
+
+async def update_rollups(
+    session: AsyncSession,
+    query_records: Sequence[QueryRecord],
+    query_results: Sequence[QueryResult],
+) -> None:
+    """Add already flushed records and results to the analytics rollups."""
+    record_days = {record.id: record.timestamp.date() for record in query_records}
+
+    daily_queries: Counter[date] = Counter(record_days.values())
+    daily_results: Counter[date] = Counter(
+        record_days[result.query_record_id] for result in query_results
+    )
+    journal_results: Counter[str] = Counter(
+        result.journal for result in query_results if result.journal
+    )
+    query_counts: Counter[str] = Counter(record.query for record in query_records)
+    last_queried_at: dict[str, datetime] = {}
+    for record in query_records:
+        last_queried_at[record.query] = max(
+            record.timestamp, last_queried_at.get(record.query, record.timestamp)
+        )
+
+    if daily_queries:
+        shard = random.randrange(DAILY_STATS_SHARDS)
+        stmt = insert(DailyQueryStats).values(
+            [
+                {
+                    "day": day,
+                    "shard": shard,
+                    "num_queries": daily_queries[day],
+                    "num_results": daily_results[day],
+                }
+                for day in sorted(daily_queries)
+            ]
+        )
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[DailyQueryStats.day, DailyQueryStats.shard],
+                set_={
+                    "num_queries": DailyQueryStats.num_queries
+                    + stmt.excluded.num_queries,
+                    "num_results": DailyQueryStats.num_results
+                    + stmt.excluded.num_results,
+                },
+            )
+        )
+
+    if journal_results:
+        stmt = insert(JournalStats).values(
+            [
+                {"journal": journal, "num_results": journal_results[journal]}
+                for journal in sorted(journal_results)
+            ]
+        )
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[JournalStats.journal],
+                set_={
+                    "num_results": JournalStats.num_results + stmt.excluded.num_results
+                },
+            )
+        )
+
+    if query_counts:
+        stmt = insert(QueryStats).values(
+            [
+                {
+                    "query": query,
+                    "num_queries": query_counts[query],
+                    "last_queried_at": last_queried_at[query],
+                }
+                for query in sorted(query_counts)
+            ]
+        )
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[QueryStats.query],
+                set_={
+                    "num_queries": QueryStats.num_queries + stmt.excluded.num_queries,
+                    "last_queried_at": func.greatest(
+                        QueryStats.last_queried_at, stmt.excluded.last_queried_at
+                    ),
+                },
+            )
+        )
+
+
+async def store_searches(
+    session: AsyncSession,
+    searches: Sequence[tuple[QueryRecord, Sequence[QueryResult], Sequence[Sequence[str]]]],
+) -> None:
+    """Bulk insert `(record, results, authors per result)` searches whose ids are already set."""
+    records = [record for record, _, _ in searches]
+    results = [result for _, record_results, _ in searches for result in record_results]
+    await session.execute(
+        insert(QueryRecord.__table__),
+        [
+            {column.key: getattr(record, column.key) for column in QueryRecord.__table__.c}
+            for record in records
+        ],
+    )
+    if results:
+        await session.execute(
+            insert(QueryResult.__table__),
+            [
+                {column.key: getattr(result, column.key) for column in QueryResult.__table__.c}
+                for result in results
+            ],
+        )
+    await store_result_authors(
+        session,
+        [
+            (result.id, names)
+            for _, record_results, authors in searches
+            for result, names in zip(record_results, authors)
+        ],
+    )
+    await update_rollups(session, records, results)
@@ -0,0 +1,361 @@
+# Prometheus metrics, served by `GET /metrics`, see `app/api/endpoints/metrics.py`.
+#
+# Events are counted where they happen. State that is already tracked
+# elsewhere, like pool occupancy or the stats dataclasses of the cache and
+# background jobs (`register_stats`), is read by collectors at scrape time so
+# requests pay nothing for it.
+#
+# `RequestMetricsMiddleware` times every HTTP request by route template, method
+# and status class. The histogram children of every route are created once,
+# requests only look theirs up.
+#
+# Workers of `app.serve` share one port, a scrape reaches any one of them. They
+# run in prometheus_client's multiprocess mode: metrics live in files under
+# "metrics__multiproc_dir" and every scrape merges those of all workers.
+# Collectors only see the process they run in, so each worker copies them into
+# such metrics every "metrics__sync_interval_secs" (`CollectedMirror`).
+# Without `app.serve`, e.g. a single `uvicorn app.main:app`, the process
+# serves its own registry.
+#
+# https://prometheus.github.io/client_python/multiprocess/
+#
+# Configured by the "metrics" settings group, see `app/core/config.py`.
+
+
+import asyncio
+import logging
+import os
+import time
+from collections.abc import Callable, Collection, Iterable, Iterator, Mapping
+from typing import Any
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.routing import BaseRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "Time to answer HTTP requests, by route template, method and status class",
+    ["route", "method", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests being answered",
+    multiprocess_mode="livesum",
+)
+
+ARXIV_UPSTREAM_SECONDS = Histogram(
+    "arxiv_upstream_seconds",
+    "Time to get an answer from the arXiv API, failed connections included",
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2.5, 5, 10, 30),
+)
+ARXIV_UPSTREAM_RESPONSES = Counter(
+    "arxiv_upstream_responses",
+    'arXiv API responses by HTTP status, "error" when there was none',
+    ["status"],
+)
+FEED_PARSE_SECONDS = Histogram(
+    "arxiv_feed_parse_seconds",
+    "Time to parse an arXiv Atom feed",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+ROWS_INGESTED = Counter(
+    "rows_ingested",
+    "Search rows committed, directly or by the write-behind queue",
+    ["table"],
+)
+QUERY_RECORDS_INGESTED = ROWS_INGESTED.labels("query_records")
+QUERY_RESULTS_INGESTED = ROWS_INGESTED.labels("query_results")
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to get a connection from the pool, including opening a new one",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_timeouts",
+    "Checkouts that gave up after waiting pool_timeout_secs",
+    ["pool"],
+)
+
+LOGIN_SECONDS = Histogram(
+    "auth_login_seconds",
+    "Time to answer POST /auth/access-token, by outcome",
+    ["outcome"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2.5, 5, 10),
+)
+PASSWORD_HASHING_PENDING = Gauge(
+    "password_hashing_pending",
+    "bcrypt calls waiting for or running on the password hashing threads",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASHING_REJECTED = Counter(
+    "password_hashing_rejected",
+    "Requests refused with 503 because password_hash_max_pending calls were pending",
+)
+PASSWORD_BCRYPT_ROUNDS = Gauge(
+    "password_bcrypt_rounds",
+    "bcrypt cost new password hashes get",
+    multiprocess_mode="livemax",
+)
+PASSWORD_REHASHES = Counter(
+    "password_rehashes",
+    "Stored password hashes of another bcrypt cost replaced after a successful login",
+)
+
+ADMISSION_REJECTED = Counter(
+    "admission_rejected",
+    "Password hashing requests refused with 429, by the bucket that refused them",
+    ["bucket"],
+)
+ADMISSION_RATE_FACTOR = Gauge(
+    "admission_rate_factor",
+    "Share of admission__global_rate currently admitted, lowered under CPU or event loop pressure",
+    multiprocess_mode="liveall",
+)
+EVENT_LOOP_LAG_SECONDS = Gauge(
+    "event_loop_lag_seconds",
+    "How late the event loop woke up for the last admission load sample",
+    multiprocess_mode="liveall",
+)
+
+
+class PoolCollector(Collector):
+    """Occupancy of the connection pools of registered engines."""
+
+    def __init__(self) -> None:
+        self.engines: dict[str, AsyncEngine] = {}
+
+    def collect(self) -> Iterator[Metric]:
+        size = GaugeMetricFamily("db_pool_size", "Persistent connections the pool keeps", labels=["pool"])
+        in_use = GaugeMetricFamily("db_pool_connections_in_use", "Connections checked out", labels=["pool"])
+        idle = GaugeMetricFamily("db_pool_connections_idle", "Open connections waiting in the pool", labels=["pool"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Connections open beyond the pool size", labels=["pool"])
+        for name, engine in self.engines.items():
+            # engine.pool follows re-creation on dispose()
+            pool = engine.pool
+            size.add_metric([name], pool.size())  # type: ignore[attr-defined]
+            in_use.add_metric([name], pool.checkedout())  # type: ignore[attr-defined]
+            idle.add_metric([name], pool.checkedin())  # type: ignore[attr-defined]
+            # the overflow counter starts at -pool_size
+            overflow.add_metric([name], max(pool.overflow(), 0))  # type: ignore[attr-defined]
+        yield from (size, in_use, idle, overflow)
+
+
+POOL_COLLECTOR = PoolCollector()
+REGISTRY.register(POOL_COLLECTOR)
+
+
+def register_engine(name: str, engine: AsyncEngine) -> None:
+    POOL_COLLECTOR.engines[name] = engine
+
+
+class StatsSource:
+    def __init__(
+        self,
+        subsystem: str,
+        read: Callable[[], Mapping[str, Any]],
+        counters: Collection[str],
+        label: str | None,
+    ) -> None:
+        self.subsystem = subsystem
+        self.read = read
+        self.counters = counters
+        self.label = label
+
+    def collect(self) -> Iterator[Metric]:
+        stats = self.read()
+        # unlabelled sources are one anonymous series
+        series = stats.items() if self.label is not None else [(None, stats)]
+        families: dict[str, GaugeMetricFamily | CounterMetricFamily] = {}
+        for label_value, fields in series:
+            for field, value in fields.items():
+                if value is None:
+                    continue
+                family = families.get(field)
+                if family is None:
+                    name = f"{self.subsystem}_{field}"
+                    documentation = f"{field} of {self.subsystem}"
+                    labels = [self.label] if self.label is not None else []
+                    family_type = CounterMetricFamily if field in self.counters else GaugeMetricFamily
+                    family = families[field] = family_type(name, documentation, labels=labels)
+                family.add_metric([label_value] if label_value is not None else [], float(value))
+        yield from families.values()
+
+
+class StatsCollector(Collector):
+    """Stats dataclasses of other modules, read at scrape time."""
+
+    def __init__(self) -> None:
+        self.sources: dict[str, StatsSource] = {}
+
+    def collect(self) -> Iterator[Metric]:
+        for source in self.sources.values():
+            yield from source.collect()
+
+
+STATS_COLLECTOR = StatsCollector()
+REGISTRY.register(STATS_COLLECTOR)
+
+
+def register_stats(
+    subsystem: str,
+    read: Callable[[], Mapping[str, Any]],
+    counters: Collection[str] = (),
+    label: str | None = None,
+) -> None:
+    """Export the fields `read` returns as "{subsystem}_{field}", gauges unless listed in `counters`.
+
+    With `label`, `read` returns the fields per value of that label instead.
+    """
+    STATS_COLLECTOR.sources[subsystem] = StatsSource(subsystem, read, counters, label)
+
+
+def multiprocess_enabled() -> bool:
+    # set by `app.serve` before any worker imports prometheus_client
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+class CollectedMirror:
+    """Copies what collectors report at scrape time into multiprocess metrics.
+
+    Gauges are kept per worker ("liveall", a "pid" label) and dropped when it
+    exits. Counters grow by what they grew since the last copy, so they add up
+    across workers and keep counting after one exits.
+    """
+
+    def __init__(self, collectors: Iterable[Collector]) -> None:
+        self.collectors = list(collectors)
+        self.metrics: dict[str, Counter | Gauge] = {}
+        self.copied: dict[tuple[str, tuple[str, ...]], float] = {}
+
+    def _metric(self, family: Metric, labelnames: tuple[str, ...]) -> Counter | Gauge:
+        metric = self.metrics.get(family.name)
+        if metric is None:
+            # not registered, the multiprocess collector reads them from the files
+            if family.type == "counter":
+                metric = Counter(family.name, family.documentation, labelnames, registry=None)
+            else:
+                metric = Gauge(family.name, family.documentation, labelnames, registry=None, multiprocess_mode="liveall")
+            self.metrics[family.name] = metric
+        return metric
+
+    def sync(self) -> None:
+        for collector in self.collectors:
+            for family in collector.collect():
+                for sample in family.samples:
+                    if sample.name.endswith("_created"):
+                        continue
+                    labelnames = tuple(sorted(sample.labels))
+                    labelvalues = tuple(sample.labels[name] for name in labelnames)
+                    metric = self._metric(family, labelnames)
+                    child = metric.labels(*labelvalues) if labelnames else metric
+                    if isinstance(child, Counter):
+                        key = (family.name, labelvalues)
+                        grown = sample.value - self.copied.get(key, 0.0)
+                        self.copied[key] = sample.value
+                        if grown > 0:
+                            child.inc(grown)
+                    else:
+                        child.set(sample.value)
+
+
+COLLECTED_MIRROR = CollectedMirror([POOL_COLLECTOR, STATS_COLLECTOR])
+
+
+def scrape_registry() -> CollectorRegistry:
+    """What `GET /metrics` serves, the metrics of all workers in multiprocess mode."""
+    if not multiprocess_enabled():
+        return REGISTRY
+    # fresh for the worker answering, up to sync_interval_secs old for the others
+    COLLECTED_MIRROR.sync()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+async def run_collected_mirror() -> None:
+    """Run `CollectedMirror.sync` forever, every `sync_interval_secs`."""
+    while True:
+        try:
+            COLLECTED_MIRROR.sync()
+        except Exception:
+            logger.exception("Copying collected metrics failed")
+        await asyncio.sleep(get_settings().metrics.sync_interval_secs)
+
+
+def mark_worker_dead() -> None:
+    """Drop the live gauges of this worker, call when it exits."""
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(os.getpid())
+
+
+# status class of the response, by status // 100
+_STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+# requests no route matched, e.g. 404 or refused by TrustedHostMiddleware
+UNMATCHED_ROUTE = "unmatched"
+# any other method is "OTHER", clients choose it and could add series at will
+_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+
+class RequestMetricsMiddleware:
+    """Times HTTP requests into `HTTP_REQUEST_SECONDS` and counts them in `HTTP_REQUESTS_IN_FLIGHT`.
+
+    A pure ASGI middleware, no request or response objects are built. The
+    route is the one the router matched (`scope["route"]`), so paths with
+    parameters share one series.
+    """
+
+    def __init__(self, app: ASGIApp, routes: Iterable[BaseRoute] = ()) -> None:
+        self.app = app
+        # route template -> method -> histogram child per status class
+        self.children: dict[str, dict[str, list[Histogram]]] = {}
+        for route in routes:
+            for method in getattr(route, "methods", None) or ():
+                self._children(getattr(route, "path_format", UNMATCHED_ROUTE), method)
+
+    def _children(self, route: str, method: str) -> list[Histogram]:
+        by_method = self.children.setdefault(route, {})
+        children = by_method.get(method)
+        if children is None:
+            children = by_method[method] = [
+                HTTP_REQUEST_SECONDS.labels(route, method, status) for status in _STATUS_CLASSES
+            ]
+        return children
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # the router leaves the matched route in the scope
+            route = getattr(scope.get("route"), "path_format", UNMATCHED_ROUTE)
+            method = scope["method"] if scope["method"] in _METHODS else "OTHER"
+            by_method = self.children.get(route)
+            children = by_method.get(method) if by_method is not None else None
+            if children is None:
+                children = self._children(route, method)
+            children[min(status_code // 100, 5) - 1].observe(time.perf_counter() - started)
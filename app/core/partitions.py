@@ -0,0 +1,145 @@
+# Monthly range partitions of the append-only arXiv tables.
+#
+# query_records and query_results are partitioned by month on "timestamp"
+# into "{table}_pYYYY_MM" tables, plus a DEFAULT partition that catches rows
+# no monthly partition exists for. Range filters on "timestamp" (see
+# `GET /arxiv/queries`) only touch the partitions they overlap, and old months
+# are removed by detaching a partition instead of deleting rows and vacuuming.
+#
+# `maintain_partitions` creates partitions `premake_months` ahead and detaches
+# those older than `detach_after_months`. Detached partitions are left behind
+# as plain tables to be archived or dropped. It runs periodically from the app
+# lifespan, a transaction level advisory lock makes concurrent workers skip it.
+#
+# Configured by the "partitions" settings group, see `app/core/config.py`.
+
+
+import asyncio
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("query_records", "query_results")
+
+# pg_try_advisory_xact_lock key, arbitrary but fixed
+_MAINTENANCE_LOCK_KEY = 0x70617274
+_PARTITION_MONTH = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+@dataclass
+class MaintenanceReport:
+    created: list[str] = field(default_factory=list)
+    detached: list[str] = field(default_factory=list)
+    # another worker held the maintenance lock
+    skipped: bool = False
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def is_partition(name: str) -> bool:
+    return name.endswith("_default") or _PARTITION_MONTH.search(name) is not None
+
+
+def partition_month(name: str) -> date | None:
+    match = _PARTITION_MONTH.search(name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+async def list_partitions(conn: AsyncConnection | AsyncSession, table: str) -> list[str]:
+    result = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+            " WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname"
+        ),
+        {"table": table},
+    )
+    return list(result.scalars())
+
+
+async def create_partition(conn: AsyncConnection | AsyncSession, table: str, month: date) -> str:
+    name = partition_name(table, month)
+    lower, upper = month, add_months(month, 1)
+    # Postgres refuses to attach a range the DEFAULT partition has rows in, so
+    # those are moved over first, before the partition has indexes to maintain
+    await conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+    await conn.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {table}_default"
+            ' WHERE "timestamp" >= :lower AND "timestamp" < :upper RETURNING *)'
+            f" INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"lower": lower, "upper": upper},
+    )
+    await conn.execute(
+        text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+    )
+    return name
+
+
+async def detach_partition(conn: AsyncConnection | AsyncSession, table: str, name: str) -> None:
+    await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+    if table == "query_results":
+        # author links have no foreign key to cascade from a partitioned table
+        await conn.execute(
+            text(f"DELETE FROM query_result_authors WHERE query_result_id IN (SELECT id FROM {name})")
+        )
+
+
+async def maintain_partitions(
+    conn: AsyncConnection | AsyncSession, now: datetime | None = None
+) -> MaintenanceReport:
+    """Create upcoming and detach expired monthly partitions, in the caller's transaction."""
+    settings = get_settings().partitions
+    if not await conn.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _MAINTENANCE_LOCK_KEY}):
+        return MaintenanceReport(skipped=True)
+
+    report = MaintenanceReport()
+    current = month_start(now or datetime.utcnow())
+    upcoming = [add_months(current, offset) for offset in range(settings.premake_months + 1)]
+    for table in PARTITIONED_TABLES:
+        existing = await list_partitions(conn, table)
+        for month in upcoming:
+            if partition_name(table, month) not in existing:
+                report.created.append(await create_partition(conn, table, month))
+
+        if settings.detach_after_months is None:
+            continue
+        cutoff = add_months(current, -settings.detach_after_months)
+        for name in existing:
+            month = partition_month(name)
+            if month is not None and month < cutoff:
+                await detach_partition(conn, table, name)
+                report.detached.append(name)
+    return report
+
+
+async def run_partition_maintenance(engine: AsyncEngine) -> None:
+    """Run `maintain_partitions` forever, every `maintenance_interval_secs`."""
+    while True:
+        try:
+            async with engine.begin() as conn:
+                report = await maintain_partitions(conn)
+            if report.created or report.detached:
+                logger.info("Partitions created: %s, detached: %s", report.created, report.detached)
+        except Exception:
+            logger.exception("Partition maintenance failed")
+        await asyncio.sleep(get_settings().partitions.maintenance_interval_secs)
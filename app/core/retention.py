@@ -0,0 +1,210 @@
+# Retention of old search history and spent refresh tokens.
+#
+# Query records older than `query_history_days` are archived together with
+# their results to gzip compressed JSON lines files under `archive_dir`, one
+# file per table and run, then deleted. Used or expired refresh tokens are
+# deleted without an archive, they are credentials (see `app/core/token_reaper.py`). Analytics rollups are
+# kept, they already summarize the deleted history.
+#
+# Work is done in short transactions of `batch_size` primary keys with a pause
+# of `batch_pause_secs` between them, so locks are held briefly and autovacuum
+# and replicas keep up. Rows are deleted with RETURNING and written (fsynced)
+# before their transaction commits, nothing is deleted without being archived.
+#
+# Runs daily from the app lifespan when enabled, or on demand:
+#
+#   python -m app.core.retention [--older-than-days N]
+#
+# Configured by the "retention" settings group, see `app/core/config.py`.
+
+
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import time
+from collections.abc import Mapping, Sequence
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import orjson
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from app.core.config import PROJECT_DIR, get_settings
+from app.core.metrics import register_stats
+from app.core.token_reaper import reap_refresh_tokens
+from app.models import QueryRecord, QueryResult, QueryResultAuthor
+
+logger = logging.getLogger(__name__)
+
+# pg_try_advisory_lock key, arbitrary but fixed
+_RETENTION_LOCK_KEY = 0x72657465
+
+_query_records = QueryRecord.__table__
+_query_results = QueryResult.__table__
+_query_result_authors = QueryResultAuthor.__table__
+
+
+@dataclass
+class RetentionMetrics:
+    runs: int = 0
+    batches: int = 0
+    query_records_archived: int = 0
+    query_results_archived: int = 0
+    refresh_tokens_deleted: int = 0
+    running: bool = False
+    last_run_started_at: float | None = None
+    last_run_duration_secs: float | None = None
+
+
+_METRICS = RetentionMetrics()
+
+
+def retention_metrics() -> dict[str, Any]:
+    return asdict(_METRICS)
+
+
+register_stats(
+    "retention",
+    retention_metrics,
+    counters={"runs", "batches", "query_records_archived", "query_results_archived", "refresh_tokens_deleted"},
+)
+
+
+class Archive:
+    """Gzip compressed JSON lines files, one per table, appended batch by batch."""
+
+    def __init__(self, directory: Path, run_id: str) -> None:
+        self.directory = directory
+        self.run_id = run_id
+
+    def path(self, table: str) -> Path:
+        return self.directory / f"{table}-{self.run_id}.jsonl.gz"
+
+    def write(self, table: str, rows: Sequence[Mapping[str, Any]]) -> None:
+        if not rows:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = b"".join(orjson.dumps(dict(row), option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+        # every batch is its own gzip member, concatenated members are a valid gzip file
+        with open(self.path(table), "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="ab") as compressed:
+                compressed.write(data)
+            raw.flush()
+            os.fsync(raw.fileno())
+
+
+async def archive_query_history_batch(
+    conn: AsyncConnection | AsyncSession, archive: Archive, cutoff: datetime, batch_size: int
+) -> tuple[int, int]:
+    """Archive and delete up to `batch_size` records older than `cutoff` with their results."""
+    batch = (await conn.execute(
+        select(_query_records.c.id, _query_records.c.timestamp)
+        .where(_query_records.c.timestamp < cutoff)
+        .order_by(_query_records.c.timestamp, _query_records.c.id)
+        .limit(batch_size)
+    )).all()
+    if not batch:
+        return 0, 0
+    record_ids = [record_id for record_id, _ in batch]
+    oldest = batch[0].timestamp
+
+    # results are never older than their record, the bound prunes partitions
+    results = (await conn.execute(
+        delete(_query_results)
+        .where(_query_results.c.query_record_id.in_(record_ids), _query_results.c.timestamp >= oldest)
+        .returning(*_query_results.c)
+    )).mappings().all()
+    if results:
+        await conn.execute(
+            delete(_query_result_authors).where(
+                _query_result_authors.c.query_result_id.in_([result["id"] for result in results])
+            )
+        )
+    records = (await conn.execute(
+        delete(_query_records)
+        .where(_query_records.c.id.in_(record_ids), _query_records.c.timestamp < cutoff)
+        .returning(*_query_records.c)
+    )).mappings().all()
+
+    await asyncio.to_thread(archive.write, "query_records", records)
+    await asyncio.to_thread(archive.write, "query_results", results)
+    return len(records), len(results)
+
+
+async def run_retention(engine: AsyncEngine, older_than_days: int | None = None) -> RetentionMetrics:
+    """One full retention pass, returns what this run did."""
+    settings = get_settings().retention
+    days = older_than_days if older_than_days is not None else settings.query_history_days
+    started_at = datetime.utcnow()
+    cutoff = started_at - timedelta(days=days)
+    run = RetentionMetrics(runs=1, running=True, last_run_started_at=time.time())
+
+    async with engine.connect() as lock_conn:
+        locked = await lock_conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": _RETENTION_LOCK_KEY})
+        # the lock is session level, do not sit idle in a transaction meanwhile
+        await lock_conn.commit()
+        if not locked:
+            logger.info("Retention already running elsewhere, skipping")
+            return RetentionMetrics()
+        _METRICS.runs += 1
+        _METRICS.running = True
+        _METRICS.last_run_started_at = run.last_run_started_at
+        try:
+            archive = Archive(Path(PROJECT_DIR, settings.archive_dir), f"{started_at:%Y%m%dT%H%M%S}")
+            while True:
+                async with engine.begin() as conn:
+                    records, results = await archive_query_history_batch(conn, archive, cutoff, settings.batch_size)
+                if not records:
+                    break
+                for metrics in (run, _METRICS):
+                    metrics.batches += 1
+                    metrics.query_records_archived += records
+                    metrics.query_results_archived += results
+                logger.info(
+                    "Retention archived %s query records, %s results so far",
+                    run.query_records_archived,
+                    run.query_results_archived,
+                )
+                await asyncio.sleep(settings.batch_pause_secs)
+
+            # usually little left, `app.core.token_reaper` runs more often
+            deleted = await reap_refresh_tokens(engine, settings.batch_size, settings.batch_pause_secs)
+            for metrics in (run, _METRICS):
+                metrics.refresh_tokens_deleted += deleted
+        finally:
+            await lock_conn.scalar(text("SELECT pg_advisory_unlock(:key)"), {"key": _RETENTION_LOCK_KEY})
+            await lock_conn.commit()
+            run.running = _METRICS.running = False
+            run.last_run_duration_secs = _METRICS.last_run_duration_secs = time.time() - run.last_run_started_at
+
+    logger.info("Retention finished: %s", asdict(run))
+    return run
+
+
+async def run_retention_schedule(engine: AsyncEngine) -> None:
+    """Run `run_retention` forever, every `interval_secs`."""
+    while True:
+        try:
+            await run_retention(engine)
+        except Exception:
+            logger.exception("Retention run failed")
+        await asyncio.sleep(get_settings().retention.interval_secs)
+
+
+async def main(older_than_days: int | None) -> None:
+    from app.core.database_session import get_async_engine
+
+    run = await run_retention(get_async_engine(), older_than_days)
+    print(orjson.dumps(asdict(run), option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":  # pragma: no cover
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Archive and delete old search history and spent refresh tokens.")
+    parser.add_argument("--older-than-days", type=int, default=None, help="defaults to RETENTION__QUERY_HISTORY_DAYS")
+    asyncio.run(main(parser.parse_args().older_than_days))
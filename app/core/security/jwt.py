@@ -1,10 +1,13 @@
 import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
 
 import jwt
 from fastapi import HTTPException, status
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
-from app.core.config import get_settings
+from app.core.config import Settings, get_settings
 
 JWT_ALGORITHM = "HS256"
 
@@ -12,6 +15,9 @@ JWT_ALGORITHM = "HS256"
 # Payload follows RFC 7519
 # https://www.rfc-editor.org/rfc/rfc7519#section-4.1
 class JWTTokenPayload(BaseModel):
+    # verified payloads are cached and shared between requests
+    model_config = ConfigDict(frozen=True)
+
     iss: str
     sub: str
     exp: int
@@ -23,24 +29,61 @@ class JWTToken(BaseModel):
     access_token: str
 
 
+@dataclass
+class SigningContext:
+    """Security settings in the form jwt needs them, plus tokens verified with them."""
+
+    settings: Settings
+    key: bytes
+    issuer: str
+    expire_secs: int
+    verified_cache_size: int
+    # token -> payload, least recently used first, only valid while iat <= now < exp
+    verified: OrderedDict[str, JWTTokenPayload] = field(default_factory=OrderedDict)
+
+    def cached_payload(self, token: str, now: float) -> JWTTokenPayload | None:
+        payload = self.verified.get(token)
+        if payload is None:
+            return None
+        if not payload.iat <= now < payload.exp:
+            # jwt.decode raises the right error for it
+            del self.verified[token]
+            return None
+        self.verified.move_to_end(token)
+        return payload
+
+    def remember(self, token: str, payload: JWTTokenPayload) -> None:
+        self.verified[token] = payload
+        if len(self.verified) > self.verified_cache_size:
+            self.verified.popitem(last=False)
+
+
+_CONTEXT: SigningContext | None = None
+
+
+def get_signing_context() -> SigningContext:
+    global _CONTEXT
+    # rebuilt, and verified tokens forgotten, whenever settings are reloaded
+    settings = get_settings()
+    if _CONTEXT is None or _CONTEXT.settings is not settings:
+        _CONTEXT = SigningContext(
+            settings=settings,
+            key=settings.security.jwt_secret_key.get_secret_value().encode(),
+            issuer=settings.security.jwt_issuer,
+            expire_secs=settings.security.jwt_access_token_expire_secs,
+            verified_cache_size=settings.security.jwt_verified_cache_size,
+        )
+    return _CONTEXT
+
+
 def create_jwt_token(user_id: str) -> JWTToken:
+    context = get_signing_context()
     iat = int(time.time())
-    exp = iat + get_settings().security.jwt_access_token_expire_secs
+    claims: dict[str, Any] = {"iss": context.issuer, "sub": user_id, "exp": iat + context.expire_secs, "iat": iat}
 
-    token_payload = JWTTokenPayload(
-        iss=get_settings().security.jwt_issuer,
-        sub=user_id,
-        exp=exp,
-        iat=iat,
-    )
+    access_token = jwt.encode(claims, key=context.key, algorithm=JWT_ALGORITHM)
 
-    access_token = jwt.encode(
-        token_payload.model_dump(),
-        key=get_settings().security.jwt_secret_key.get_secret_value(),
-        algorithm=JWT_ALGORITHM,
-    )
-
-    return JWTToken(payload=token_payload, access_token=access_token)
+    return JWTToken(payload=JWTTokenPayload.model_construct(**claims), access_token=access_token)
 
 
 def verify_jwt_token(token: str) -> JWTTokenPayload:
@@ -52,13 +95,23 @@ def verify_jwt_token(token: str) -> JWTTokenPayload:
     # If unsure, jump into jwt.decode code, make sure tests are passing
     # https://pyjwt.readthedocs.io/en/stable/usage.html#encoding-decoding-tokens-with-hs256
 
+    #
+    # A token is decoded once, then served from the context's cache until it
+    # expires. The cache is keyed by the whole token string, so only the exact
+    # bytes that passed the checks below ever hit.
+
+    context = get_signing_context()
+    payload = context.cached_payload(token, time.time())
+    if payload is not None:
+        return payload
+
     try:
         raw_payload = jwt.decode(
             token,
-            get_settings().security.jwt_secret_key.get_secret_value(),
+            context.key,
             algorithms=[JWT_ALGORITHM],
             options={"verify_signature": True},
-            issuer=get_settings().security.jwt_issuer,
+            issuer=context.issuer,
         )
     except jwt.InvalidTokenError as e:
         raise HTTPException(
@@ -66,4 +119,6 @@ def verify_jwt_token(token: str) -> JWTTokenPayload:
             detail=f"Token invalid: {e}",
         )
 
-    return JWTTokenPayload(**raw_payload)
+    payload = JWTTokenPayload(**raw_payload)
+    context.remember(token, payload)
+    return payload
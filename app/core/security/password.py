@@ -1,6 +1,49 @@
+# bcrypt password hashing.
+#
+# A hash or check takes hundreds of milliseconds by design, request handlers
+# run them with `run_password_hashing` on a dedicated thread pool of
+# "security__password_hash_workers" threads, so the event loop keeps serving
+# other requests meanwhile (bcrypt releases the GIL). At most
+# "security__password_hash_max_pending" calls wait or run at once, beyond that
+# requests fail fast with 503 instead of queueing up behind a login burst.
+# A call holds its slot until its thread is done, a request cancelled meanwhile
+# (client gone, timeout) does not stop bcrypt and does not free the slot early.
+#
+# The bcrypt cost is "security__password_bcrypt_rounds", the same for every
+# worker and node. Stored hashes of a lower cost are rehashed after a
+# successful login, see `app/api/endpoints/auth.py`, higher ones are kept.
+#
+# Calibration only proposes a cost, it is never applied by itself: workers
+# calibrating on their own would each pick another cost, depending on the
+# hardware and on how busy the node was, and rehash users back and forth.
+# Run it on a quiet machine of the fleet's slowest kind and set the result:
+#
+#   python -m app.core.security.password --target-ms 250
+
+import argparse
+import asyncio
+import logging
+import threading
+import timeit
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import TypeVar
+
 import bcrypt
+from fastapi import HTTPException, status
 
 from app.core.config import get_settings
+from app.core.metrics import PASSWORD_BCRYPT_ROUNDS, PASSWORD_HASHING_PENDING, PASSWORD_HASHING_REJECTED
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_EXECUTOR: ThreadPoolExecutor | None = None
+_PENDING = 0
+# released from executor threads
+_PENDING_LOCK = threading.Lock()
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -12,8 +55,108 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return bcrypt.hashpw(
         password.encode(),
-        bcrypt.gensalt(get_settings().security.password_bcrypt_rounds),
+        bcrypt.gensalt(get_password_rounds()),
     ).decode()
 
 
-DUMMY_PASSWORD = get_password_hash("")
+def get_password_rounds() -> int:
+    return get_settings().security.password_bcrypt_rounds
+
+
+def password_hash_rounds(hashed_password: str) -> int:
+    # "$2b$12$<salt and hash>"
+    return int(hashed_password.split("$")[2])
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    # lowering the cost is a deliberate decision, it does not rehash anyone
+    return password_hash_rounds(hashed_password) < get_password_rounds()
+
+
+@lru_cache(maxsize=1)
+def get_dummy_password_hash() -> str:
+    """Hash to check passwords against for unknown users, computed once on first use."""
+    return get_password_hash("")
+
+
+def calibrate_password_rounds(target_ms: float, min_rounds: int, max_rounds: int) -> int:
+    """Highest cost in [min_rounds, max_rounds] whose hash takes at most `target_ms` here."""
+    # every round doubles the work, so one timed cost predicts all others
+    salt = bcrypt.gensalt(min_rounds)
+    elapsed_ms = min(timeit.repeat(lambda: bcrypt.hashpw(b"calibration", salt), number=1, repeat=3)) * 1000
+    rounds = min_rounds
+    while rounds < max_rounds and elapsed_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+    if elapsed_ms > target_ms:
+        logger.warning("bcrypt cost %s takes %.0f ms, above the %.0f ms target", min_rounds, elapsed_ms, target_ms)
+    logger.info("bcrypt cost %s, about %.0f ms per hash", rounds, elapsed_ms * 2 ** (rounds - min_rounds))
+    return rounds
+
+
+def prepare_password_hashing() -> None:
+    """Compute the dummy hash, blocking, run on the password executor."""
+    PASSWORD_BCRYPT_ROUNDS.set(get_password_rounds())
+    get_dummy_password_hash()
+
+
+def get_password_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(
+            max_workers=get_settings().security.password_hash_workers,
+            thread_name_prefix="bcrypt",
+        )
+    return _EXECUTOR
+
+
+def shutdown_password_executor() -> None:
+    """Wait for running hashes and stop the threads, blocks, call with `asyncio.to_thread`."""
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=True)
+        _EXECUTOR = None
+
+
+async def run_password_hashing(function: Callable[..., T], *args: str) -> T:
+    """Run `verify_password` or `get_password_hash` off the event loop, 503 when saturated."""
+    global _PENDING
+    with _PENDING_LOCK:
+        if _PENDING >= get_settings().security.password_hash_max_pending:
+            PASSWORD_HASHING_REJECTED.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many password checks in progress, try again later",
+                headers={"Retry-After": "1"},
+            )
+        _PENDING += 1
+        PASSWORD_HASHING_PENDING.inc()
+    future = get_password_executor().submit(function, *args)
+    # on the executor future rather than in a finally here, cancelling the
+    # awaiting request leaves a started hash running
+    future.add_done_callback(_release_pending)
+    return await asyncio.wrap_future(future)
+
+
+def _release_pending(future: Future) -> None:  # type: ignore[type-arg]
+    global _PENDING
+    with _PENDING_LOCK:
+        _PENDING -= 1
+        PASSWORD_HASHING_PENDING.dec()
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    settings = get_settings().security
+    parser = argparse.ArgumentParser(description="Propose a bcrypt cost for SECURITY__PASSWORD_BCRYPT_ROUNDS.")
+    parser.add_argument("--target-ms", type=float, required=True, help="longest a hash may take on this machine")
+    parser.add_argument("--min-rounds", type=int, default=settings.password_bcrypt_min_rounds)
+    parser.add_argument("--max-rounds", type=int, default=settings.password_bcrypt_max_rounds)
+    args = parser.parse_args(argv)
+
+    rounds = calibrate_password_rounds(args.target_ms, args.min_rounds, args.max_rounds)
+    print(f"SECURITY__PASSWORD_BCRYPT_ROUNDS={rounds}")
+    return rounds
+
+
+if __name__ == "__main__":  # pragma: no cover
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,92 @@
+# Deletes used and expired refresh tokens.
+#
+# Every login and refresh inserts a refresh token and every refresh marks one
+# used, so the table only grows unless spent tokens are removed. The app
+# lifespan runs `run_token_reaper` every `interval_secs`, which deletes them in
+# short transactions of `batch_size` rows with a pause of `batch_pause_secs`
+# between them. Spent rows are found through the partial indexes on
+# "refresh_token", see `app/models.py`, and locked with SKIP LOCKED so workers
+# running it at the same time take different rows instead of waiting.
+#
+# Configured by the "token_reaper" settings group, see `app/core/config.py`.
+
+
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from app.core.config import get_settings
+from app.core.metrics import register_stats
+from app.models import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+_refresh_tokens = RefreshToken.__table__
+
+
+@dataclass
+class TokenReaperMetrics:
+    runs: int = 0
+    batches: int = 0
+    refresh_tokens_deleted: int = 0
+    last_run_duration_secs: float | None = None
+
+
+_METRICS = TokenReaperMetrics()
+
+
+def token_reaper_metrics() -> dict[str, Any]:
+    return asdict(_METRICS)
+
+
+register_stats("token_reaper", token_reaper_metrics, counters={"runs", "batches", "refresh_tokens_deleted"})
+
+
+async def delete_refresh_tokens_batch(conn: AsyncConnection | AsyncSession, now: int, batch_size: int) -> int:
+    """Delete up to `batch_size` used or expired refresh tokens."""
+    # written as the predicates of the partial indexes so both arms can use them
+    used = _refresh_tokens.c.used
+    spent = (
+        select(_refresh_tokens.c.id)
+        .where(or_(used, and_(~used, _refresh_tokens.c.exp < now)))
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = await conn.execute(delete(_refresh_tokens).where(_refresh_tokens.c.id.in_(spent.scalar_subquery())))
+    return result.rowcount
+
+
+async def reap_refresh_tokens(engine: AsyncEngine, batch_size: int, batch_pause_secs: float) -> int:
+    """Delete spent refresh tokens batch by batch until a batch comes back short, returns how many."""
+    deleted = 0
+    while True:
+        async with engine.begin() as conn:
+            batch = await delete_refresh_tokens_batch(conn, int(time.time()), batch_size)
+        deleted += batch
+        _METRICS.batches += 1
+        _METRICS.refresh_tokens_deleted += batch
+        if batch < batch_size:
+            return deleted
+        await asyncio.sleep(batch_pause_secs)
+
+
+async def run_token_reaper(engine: AsyncEngine) -> None:
+    """Run `reap_refresh_tokens` forever, every `interval_secs`."""
+    while True:
+        settings = get_settings().token_reaper
+        started = time.monotonic()
+        try:
+            deleted = await reap_refresh_tokens(engine, settings.batch_size, settings.batch_pause_secs)
+        except Exception:
+            logger.exception("Refresh token reaper failed")
+        else:
+            if deleted:
+                logger.info("Deleted %s spent refresh tokens", deleted)
+        _METRICS.runs += 1
+        _METRICS.last_run_duration_secs = time.monotonic() - started
+        await asyncio.sleep(settings.interval_secs)
@@ -0,0 +1,243 @@
+# Per-process cache of authenticated users, used by `get_current_user` in
+# `app/api/deps.py`.
+#
+# Every authenticated request resolves its token to a user. Hits are answered
+# from a bounded LRU of user_id -> email in process memory (`get_local_cache`)
+# without a database round trip, misses load the row and keep it for
+# "user_cache__ttl_secs". Only what endpoints read from the current user is
+# kept: users built from a hit carry `user_id` and `email`, no
+# `hashed_password`, and are not attached to any session.
+#
+# Deleting a user or changing their password calls `invalidate_user` after the
+# commit. It drops the entry in this process right away and in every other
+# worker through the "user_cache__invalidation" channel:
+#
+#   "local"     nothing is sent, for a single worker
+#   "postgres"  NOTIFY on "user_cache__channel_name", every worker LISTENs on a
+#               connection of its own
+#   "redis"     PUBLISH on "{cache__key_prefix}:{user_cache__channel_name}" at
+#               "cache__redis_url", every worker subscribes
+#
+# A read racing an invalidation, started before the change committed and done
+# after the message arrived, must not cache what it read. Every invalidation
+# sent or received bumps a per-worker generation, `cache_user` is given the
+# generation from before the read and skips caching when it moved. Cached
+# users are read from the primary, see `get_current_user`, a lagging replica
+# could return one deleted after its invalidation went out.
+#
+# The app lifespan runs the listener (`listen_for_invalidations`). It clears
+# the whole cache whenever it (re)connects, as messages sent while it was not
+# listening are lost. The TTL bounds how long an entry can outlive a message
+# lost any other way, e.g. a failed publish.
+#
+# Configured by the "user_cache" settings group, see `app/core/config.py`.
+
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any
+
+from sqlalchemy import text
+
+from app.core import database_session
+from app.core.cache import Cache, get_local_cache
+from app.core.config import get_settings
+from app.core.metrics import register_stats
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+# message dropping every entry
+ALL_USERS = "*"
+
+OnMessage = Callable[[str], Awaitable[None]]
+
+
+@dataclass
+class UserCacheMetrics:
+    published: int = 0
+    publish_failures: int = 0
+    received: int = 0
+    resets: int = 0
+
+
+_METRICS = UserCacheMetrics()
+
+
+# bumped by every invalidation, see `cache_user`
+_GENERATION = 0
+
+
+def user_cache_metrics() -> dict[str, Any]:
+    return asdict(_METRICS)
+
+
+register_stats("user_cache", user_cache_metrics, counters={"published", "publish_failures", "received", "resets"})
+
+
+class InvalidationChannel(ABC):
+    @abstractmethod
+    async def publish(self, user_id: str) -> None: ...
+
+    @abstractmethod
+    async def listen(self, on_message: OnMessage) -> None:
+        """Pass published user ids to `on_message` until cancelled, `ALL_USERS` after each (re)connect."""
+
+
+class LocalChannel(InvalidationChannel):
+    async def publish(self, user_id: str) -> None:
+        return None
+
+    async def listen(self, on_message: OnMessage) -> None:
+        return None
+
+
+class PostgresChannel(InvalidationChannel):
+    def __init__(self, channel: str, reconnect_interval_secs: float) -> None:
+        self.channel = channel
+        self.reconnect_interval_secs = reconnect_interval_secs
+
+    async def publish(self, user_id: str) -> None:
+        async with database_session.get_async_engine().begin() as conn:
+            await conn.execute(
+                text("SELECT pg_notify(:channel, :user_id)"), {"channel": self.channel, "user_id": user_id}
+            )
+
+    async def listen(self, on_message: OnMessage) -> None:
+        import asyncpg
+
+        # not a pooled connection, it is held for as long as the app runs
+        dsn = get_settings().sqlalchemy_database_uri.set(drivername="postgresql").render_as_string(hide_password=False)
+
+        async def notified(connection: Any, pid: int, channel: str, payload: str) -> None:
+            await on_message(payload)
+
+        while True:
+            try:
+                connection = await asyncpg.connect(dsn)
+                try:
+                    closed = asyncio.Event()
+                    connection.add_termination_listener(lambda _: closed.set())
+                    await connection.add_listener(self.channel, notified)
+                    await on_message(ALL_USERS)
+                    await closed.wait()
+                finally:
+                    await connection.close()
+            except Exception as exc:
+                logger.warning("User cache invalidation listener failed, reconnecting: %s", exc)
+            else:
+                logger.warning("User cache invalidation listener lost its connection, reconnecting")
+            await asyncio.sleep(self.reconnect_interval_secs)
+
+
+class RedisChannel(InvalidationChannel):
+    def __init__(self, client: Any, channel: str, reconnect_interval_secs: float) -> None:
+        # any redis.asyncio.Redis compatible client, e.g. fakeredis in tests
+        self.client = client
+        self.channel = channel
+        self.reconnect_interval_secs = reconnect_interval_secs
+
+    @classmethod
+    def from_url(cls, url: str, channel: str, reconnect_interval_secs: float) -> "RedisChannel":
+        import redis.asyncio
+
+        return cls(redis.asyncio.Redis.from_url(url), channel, reconnect_interval_secs)
+
+    async def publish(self, user_id: str) -> None:
+        await self.client.publish(self.channel, user_id)
+
+    async def listen(self, on_message: OnMessage) -> None:
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    await on_message(ALL_USERS)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            await on_message(message["data"].decode())
+            except Exception as exc:
+                logger.warning("User cache invalidation listener failed, reconnecting: %s", exc)
+            await asyncio.sleep(self.reconnect_interval_secs)
+
+
+@lru_cache(maxsize=1)
+def get_invalidation_channel() -> InvalidationChannel:
+    settings = get_settings()
+    channel = settings.user_cache
+    if channel.invalidation == "postgres":
+        return PostgresChannel(channel.channel_name, channel.reconnect_interval_secs)
+    if channel.invalidation == "redis":
+        return RedisChannel.from_url(
+            settings.cache.redis_url,
+            f"{settings.cache.key_prefix}:{channel.channel_name}",
+            channel.reconnect_interval_secs,
+        )
+    return LocalChannel()
+
+
+def get_user_cache() -> Cache:
+    settings = get_settings().user_cache
+    return get_local_cache("users", settings.max_entries, default_ttl=settings.ttl_secs)
+
+
+def clear_user_cache() -> None:
+    get_user_cache().backend.clear()  # type: ignore[attr-defined]
+
+
+async def get_cached_user(user_id: str) -> User | None:
+    if not get_settings().user_cache.enabled:
+        return None
+    email = await get_user_cache().get(user_id)
+    if email is None:
+        return None
+    return User(user_id=user_id, email=email.decode())
+
+
+def user_cache_generation() -> int:
+    """Take before reading a user to cache, see `cache_user`."""
+    return _GENERATION
+
+
+async def cache_user(user: User, generation: int) -> None:
+    """Cache a user read after `user_cache_generation` returned `generation`.
+
+    Skipped when any invalidation came in since, the user may predate it.
+    """
+    if get_settings().user_cache.enabled and generation == _GENERATION:
+        await get_user_cache().set(user.user_id, user.email.encode())
+
+
+async def _drop(user_id: str) -> None:
+    global _GENERATION
+    _GENERATION += 1
+    if user_id == ALL_USERS:
+        _METRICS.resets += 1
+        clear_user_cache()
+    else:
+        _METRICS.received += 1
+        await get_user_cache().delete(user_id)
+
+
+async def invalidate_user(user_id: str) -> None:
+    """Drop a user here and in other workers, call after committing the change."""
+    global _GENERATION
+    _GENERATION += 1
+    await get_user_cache().delete(user_id)
+    if not get_settings().user_cache.enabled:
+        return
+    try:
+        await get_invalidation_channel().publish(user_id)
+    except Exception:
+        # the change is committed, other workers catch up within the TTL
+        logger.exception("Could not publish user cache invalidation")
+        _METRICS.publish_failures += 1
+    else:
+        _METRICS.published += 1
+
+
+async def listen_for_invalidations() -> None:
+    await get_invalidation_channel().listen(_drop)
@@ -0,0 +1,240 @@
+# Write-behind persistence of arXiv searches.
+#
+# With "write_behind__enabled" `POST /arxiv/search` does not open a
+# transaction of its own. Its query record and results get ids from blocks of
+# sequence values fetched ahead (one round trip per `id_block_size` ids), go
+# into a bounded in-process queue, and a background flusher writes up to
+# `batch_size` searches per transaction with `store_searches`, at the latest
+# `flush_interval_secs` after the first one was queued. Many searches share
+# one commit and WAL flush instead of paying for one each.
+#
+# Durability, "write_behind__durability":
+#
+#   "committed"  the request waits until its batch committed, a failed batch
+#                fails its requests. Nothing is lost, latency grows by up to
+#                `flush_interval_secs`.
+#   "enqueued"   the request returns once queued. Searches still queued when
+#                the process dies, or in a batch that fails, are lost (logged
+#                and counted), and may not be readable right after the response.
+#
+# With "write_behind__synchronous_commit" false batches commit without waiting
+# for the WAL flush (Postgres `synchronous_commit = off`), a crash of the
+# database may then lose the last few hundred milliseconds of batches.
+#
+# A full queue is backpressure: requests wait up to `enqueue_timeout_secs` for
+# room and are then refused with 503. On shutdown the app lifespan stops the
+# flusher only after the queue is drained, see `app/main.py`.
+#
+# Configured by the "write_behind" settings group, see `app/core/config.py`.
+
+
+import asyncio
+import logging
+from collections import deque
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+from sqlalchemy import text
+
+from app.core import database_session
+from app.core.config import get_settings
+from app.core.ingestion import store_searches
+from app.core.metrics import QUERY_RECORDS_INGESTED, QUERY_RESULTS_INGESTED, register_stats
+from app.models import QueryRecord, QueryResult
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueueFull(Exception):
+    """No room in the write-behind queue within `enqueue_timeout_secs`."""
+
+
+@dataclass
+class WriteBehindMetrics:
+    enqueued: int = 0
+    rejected: int = 0
+    written: int = 0
+    lost: int = 0
+    batches: int = 0
+    failed_batches: int = 0
+    queue_depth: int = 0
+
+
+_METRICS = WriteBehindMetrics()
+
+
+def write_behind_metrics() -> dict[str, Any]:
+    writer = get_search_writer()
+    _METRICS.queue_depth = writer.queue.qsize() if writer is not None else 0
+    return asdict(_METRICS)
+
+
+register_stats(
+    "write_behind",
+    write_behind_metrics,
+    counters={"enqueued", "rejected", "written", "lost", "batches", "failed_batches"},
+)
+
+
+class IdAllocator:
+    """Ids of a sequence, fetched `block_size` at a time."""
+
+    def __init__(self, sequence: str, block_size: int) -> None:
+        self.sequence = sequence
+        self.block_size = block_size
+        self._ids: deque[int] = deque()
+        self._lock = asyncio.Lock()
+
+    async def take(self, count: int) -> list[int]:
+        async with self._lock:
+            while len(self._ids) < count:
+                async with database_session.get_async_engine().connect() as conn:
+                    result = await conn.execute(
+                        text("SELECT nextval(CAST(:sequence AS regclass)) FROM generate_series(1, :count)"),
+                        {"sequence": self.sequence, "count": max(self.block_size, count)},
+                    )
+                    self._ids.extend(result.scalars())
+            return [self._ids.popleft() for _ in range(count)]
+
+
+@dataclass
+class PendingSearch:
+    record: QueryRecord
+    results: Sequence[QueryResult]
+    authors: Sequence[Sequence[str]]
+    # set once written, when the request waits for it
+    written: asyncio.Future[None] | None = field(default=None, repr=False)
+
+
+class SearchWriter:
+    """Bounded queue of searches and the task flushing it in batches."""
+
+    def __init__(
+        self,
+        queue_size: int,
+        batch_size: int,
+        flush_interval_secs: float,
+        enqueue_timeout_secs: float,
+        wait_for_commit: bool,
+        synchronous_commit: bool,
+        id_block_size: int,
+    ) -> None:
+        self.queue: asyncio.Queue[PendingSearch] = asyncio.Queue(queue_size)
+        self.batch_size = batch_size
+        self.flush_interval_secs = flush_interval_secs
+        self.enqueue_timeout_secs = enqueue_timeout_secs
+        self.wait_for_commit = wait_for_commit
+        self.synchronous_commit = synchronous_commit
+        self.record_ids = IdAllocator("query_records_id_seq", id_block_size)
+        self.result_ids = IdAllocator("query_results_id_seq", id_block_size)
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Write everything queued, then stop the flusher."""
+        await self.queue.join()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def submit(
+        self, record: QueryRecord, results: Sequence[QueryResult], authors: Sequence[Sequence[str]]
+    ) -> None:
+        """Assign ids and queue the search, waiting for its commit in "committed" mode."""
+        record.id = (await self.record_ids.take(1))[0]
+        for result, result_id in zip(results, await self.result_ids.take(len(results))):
+            result.id = result_id
+            result.query_record_id = record.id
+
+        search = PendingSearch(record, results, authors)
+        if self.wait_for_commit:
+            search.written = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self.queue.put(search), self.enqueue_timeout_secs)
+        except asyncio.TimeoutError:
+            _METRICS.rejected += 1
+            raise WriteQueueFull() from None
+        _METRICS.enqueued += 1
+        if search.written is not None:
+            await search.written
+
+    async def _next_batch(self) -> list[PendingSearch]:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval_secs
+        while len(batch) < self.batch_size:
+            if self.queue.empty():
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write(batch)
+            except Exception as exc:
+                logger.exception("Write-behind batch of %s searches failed", len(batch))
+                _METRICS.failed_batches += 1
+                for search in batch:
+                    if search.written is None:
+                        _METRICS.lost += 1
+                    elif not search.written.done():
+                        search.written.set_exception(exc)
+            else:
+                _METRICS.batches += 1
+                _METRICS.written += len(batch)
+                QUERY_RECORDS_INGESTED.inc(len(batch))
+                QUERY_RESULTS_INGESTED.inc(sum(len(search.results) for search in batch))
+                for search in batch:
+                    if search.written is not None and not search.written.done():
+                        search.written.set_result(None)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _write(self, batch: list[PendingSearch]) -> None:
+        async with database_session.get_async_session() as session:
+            if not self.synchronous_commit:
+                await session.execute(text("SET LOCAL synchronous_commit = off"))
+            await store_searches(session, [(search.record, search.results, search.authors) for search in batch])
+            await session.commit()
+
+
+_WRITER: SearchWriter | None = None
+
+
+def get_search_writer() -> SearchWriter | None:
+    """The running writer, None unless enabled and started by the app lifespan."""
+    return _WRITER
+
+
+def start_search_writer() -> SearchWriter:
+    global _WRITER
+    settings = get_settings().write_behind
+    _WRITER = SearchWriter(
+        queue_size=settings.queue_size,
+        batch_size=settings.batch_size,
+        flush_interval_secs=settings.flush_interval_secs,
+        enqueue_timeout_secs=settings.enqueue_timeout_secs,
+        wait_for_commit=settings.durability == "committed",
+        synchronous_commit=settings.synchronous_commit,
+        id_block_size=settings.id_block_size,
+    )
+    _WRITER.start()
+    return _WRITER
+
+
+async def stop_search_writer() -> None:
+    global _WRITER
+    if _WRITER is not None:
+        writer, _WRITER = _WRITER, None
+        await writer.close()
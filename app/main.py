@@ -1,9 +1,69 @@
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import ORJSONResponse
 
-from app.api.api_router import api_router, auth_router
+from app.api.api_router import api_router, auth_router, metrics_router
+from app.api.pagination import PAGINATION_HEADERS
+from app.core.admission import run_load_sampler
 from app.core.config import get_settings
+from app.core.database_session import dispose_engines, get_async_engine, prewarm_engines
+from app.core.http_client import close_http_client, prewarm_http_client
+from app.core.metrics import RequestMetricsMiddleware, mark_worker_dead, multiprocess_enabled, run_collected_mirror
+from app.core.partitions import run_partition_maintenance
+from app.core.retention import run_retention_schedule
+from app.core.security.password import get_password_executor, prepare_password_hashing, shutdown_password_executor
+from app.core.token_reaper import run_token_reaper
+from app.core.user_cache import listen_for_invalidations
+from app.core.write_behind import start_search_writer, stop_search_writer
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # created here rather than at import, in each worker of a pre-fork server,
+    # and warmed up so the first requests do not pay for connecting or hashing
+    started = time.perf_counter()
+    await asyncio.gather(
+        prewarm_engines(),
+        prewarm_http_client(),
+        asyncio.get_running_loop().run_in_executor(get_password_executor(), prepare_password_hashing),
+    )
+    logger.info("Startup finished in %.0f ms", (time.perf_counter() - started) * 1000)
+    if get_settings().write_behind.enabled:
+        start_search_writer()
+    background_tasks = []
+    if get_settings().admission.enabled:
+        background_tasks.append(asyncio.create_task(run_load_sampler()))
+    if get_settings().user_cache.enabled:
+        background_tasks.append(asyncio.create_task(listen_for_invalidations()))
+    if get_settings().partitions.maintenance_enabled:
+        background_tasks.append(asyncio.create_task(run_partition_maintenance(get_async_engine())))
+    if get_settings().token_reaper.enabled:
+        background_tasks.append(asyncio.create_task(run_token_reaper(get_async_engine())))
+    if get_settings().retention.enabled:
+        background_tasks.append(asyncio.create_task(run_retention_schedule(get_async_engine())))
+    if multiprocess_enabled():
+        background_tasks.append(asyncio.create_task(run_collected_mirror()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    # drained before the engines go away
+    await stop_search_writer()
+    close_http_client()
+    await asyncio.to_thread(shutdown_password_executor)
+    await dispose_engines()
+    mark_worker_dead()
+
 
 app = FastAPI(
     title="Minimal fastapi-postgres template for MLOps role at Zeiss",
@@ -11,9 +71,12 @@ app = FastAPI(
     description="The `/arxiv` endpoints can be directly tested using the ```Try it out``` feature in Swagger UI. Simply provide the necessary parameters or request body depending on the endpoint and execute the requests. No authentication is required to access these endpoints.",
     openapi_url="/openapi.json",
     docs_url="/",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 app.include_router(auth_router)
+app.include_router(metrics_router)
 app.include_router(api_router)
 
 # Sets all CORS enabled origins
@@ -26,6 +89,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", *PAGINATION_HEADERS],
 )
 
 # Guards against HTTP Host Header attacks
@@ -33,3 +97,6 @@ app.add_middleware(
     TrustedHostMiddleware,
     allowed_hosts=get_settings().security.allowed_hosts,
 )
+
+# Added last, so outermost and timing the middleware above too, see `app/core/metrics.py`
+app.add_middleware(RequestMetricsMiddleware, routes=app.routes)
@@ -0,0 +1,108 @@
+# Schema migrations at startup
+#
+#   python -m app.migrate
+#
+# Runs `alembic upgrade head` only when the database is not at the head of
+# the migration scripts already. Checking costs one connection and one query,
+# instead of importing the app and running Alembic's environment on every
+# container start. Script heads are read from the revision files' source, so
+# Alembic itself is only imported when there is something to upgrade. How long
+# the check and the upgrade took is logged.
+#
+# A database never migrated is created from the squashed revision in
+# `alembic/baseline` first, which stands for the oldest part of the chain and
+# keeps its last revision id, then upgraded to head through the revisions after
+# it. Databases at any revision of the full chain upgrade through it as before.
+
+
+import ast
+import asyncio
+import logging
+import time
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.core.config import PROJECT_DIR, get_settings
+
+logger = logging.getLogger(__name__)
+
+
+VERSIONS_DIR = PROJECT_DIR / "alembic" / "versions"
+BASELINE_DIR = PROJECT_DIR / "alembic" / "baseline"
+
+
+def script_heads(versions_dir: Path = VERSIONS_DIR) -> set[str]:
+    """Revisions no other revision file revises."""
+    revisions: set[str] = set()
+    revised: set[str] = set()
+    for path in versions_dir.glob("*.py"):
+        assignments = {
+            target.id: node.value
+            for node in ast.parse(path.read_text()).body
+            if isinstance(node, ast.Assign)
+            for target in node.targets
+            if isinstance(target, ast.Name)
+        }
+        revisions.add(ast.literal_eval(assignments["revision"]))
+        down_revision = ast.literal_eval(assignments["down_revision"])
+        if isinstance(down_revision, str):
+            revised.add(down_revision)
+        elif down_revision:
+            revised.update(down_revision)
+    return revisions - revised
+
+
+async def database_revisions(conn: AsyncConnection) -> set[str]:
+    """Revisions stamped in alembic_version, empty for a database never migrated."""
+    if await conn.scalar(text("SELECT to_regclass('alembic_version')")) is None:
+        return set()
+    return set((await conn.scalars(text("SELECT version_num FROM alembic_version"))).all())
+
+
+async def read_database_revisions() -> set[str]:
+    engine = create_async_engine(get_settings().sqlalchemy_database_uri, poolclass=NullPool)
+    try:
+        async with engine.connect() as conn:
+            return await database_revisions(conn)
+    finally:
+        await engine.dispose()
+
+
+def migrate() -> bool:
+    """Upgrade the database to head unless it is there already, returns whether it ran."""
+    start = time.perf_counter()
+    heads = script_heads()
+    revisions = asyncio.run(read_database_revisions())
+    checked = time.perf_counter()
+    if revisions == heads:
+        logger.info("Schema at head %s, upgrade skipped (check %.0f ms)", ", ".join(heads), (checked - start) * 1000)
+        return False
+
+    logger.info("Schema at %s, upgrading to %s", ", ".join(revisions) or "nothing", ", ".join(heads))
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(str(PROJECT_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(PROJECT_DIR / "alembic"))
+    if not revisions:
+        baseline = Config(str(PROJECT_DIR / "alembic.ini"))
+        baseline.set_main_option("script_location", str(PROJECT_DIR / "alembic"))
+        baseline.set_main_option("version_locations", str(BASELINE_DIR))
+        command.upgrade(baseline, "head")
+        logger.info("Schema created from baseline %s", ", ".join(script_heads(BASELINE_DIR)))
+    command.upgrade(config, "head")
+    done = time.perf_counter()
+    logger.info(
+        "Schema upgraded (check %.0f ms, upgrade %.2f s)", (checked - start) * 1000, done - checked
+    )
+    return True
+
+
+if __name__ == "__main__":  # pragma: no cover
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-5.5s [%(name)s] %(message)s")
+    # alembic.ini's logging config, applied by the upgrade, puts the root logger at WARN
+    logger.setLevel(logging.INFO)
+    migrate()
@@ -13,10 +13,10 @@
 # alembic upgrade head
 
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 
-from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, String, Uuid, func, Integer
+from sqlalchemy import DDL, BigInteger, Boolean, Date, DateTime, ForeignKey, Index, SmallInteger, String, Uuid, event, func, Integer, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -37,6 +37,13 @@ class User(Base):
 
 class RefreshToken(Base):
     __tablename__ = "refresh_token"
+    __table_args__ = (
+        # refresh lookups only need live tokens, spent ones are deleted by
+        # `app.core.token_reaper`, which finds them through the other two
+        Index("ix_refresh_token_unused", "refresh_token", postgresql_where=text("NOT used")),
+        Index("ix_refresh_token_used", "id", postgresql_where=text("used")),
+        Index("ix_refresh_token_unused_exp", "exp", postgresql_where=text("NOT used")),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     refresh_token: Mapped[str] = mapped_column(
@@ -51,21 +58,92 @@ class RefreshToken(Base):
 
 class QueryRecord(Base):
     __tablename__ = 'query_records'
+    # range partitioned by month on timestamp, see `app.core.partitions`,
+    # Postgres requires the partition key to be part of the primary key
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
     
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     query: Mapped[str] = mapped_column(String, index=True)
-    timestamp: Mapped[datetime] = mapped_column(DateTime, index=True)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, primary_key=True, index=True)
     status: Mapped[int] = mapped_column(Integer)
     num_results: Mapped[int] = mapped_column(Integer)
-    results: Mapped[List["QueryResult"]] = relationship("QueryResult", back_populates="query_record")
+    results: Mapped[List["QueryResult"]] = relationship(
+        "QueryResult", primaryjoin="QueryRecord.id == foreign(QueryResult.query_record_id)", back_populates="query_record"
+    )
 
 class QueryResult(Base):
     __tablename__ = 'query_results'
+    __table_args__ = (
+        # keyset pages of one record's results, see `GET /arxiv/queries/{id}/results`
+        Index("ix_query_results_query_record_id_id", "query_record_id", "id"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
     
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     author: Mapped[str] = mapped_column(String)
     title: Mapped[str] = mapped_column(String)
     journal: Mapped[Optional[str]] = mapped_column(String, nullable=True)
-    query_record_id: Mapped[int] = mapped_column(ForeignKey('query_records.id'))
-    query_record: Mapped["QueryRecord"] = relationship("QueryRecord", back_populates="results")
-    timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    # no foreign keys from or to partitioned tables, a unique "id" cannot be enforced across partitions
+    query_record_id: Mapped[int] = mapped_column(Integer)
+    query_record: Mapped["QueryRecord"] = relationship(
+        "QueryRecord", primaryjoin="foreign(QueryResult.query_record_id) == QueryRecord.id", back_populates="results"
+    )
+    # never older than the timestamp of its query record
+    timestamp: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.utcnow, index=True)
+    authors: Mapped[List["QueryResultAuthor"]] = relationship(
+        primaryjoin="QueryResult.id == foreign(QueryResultAuthor.query_result_id)",
+        back_populates="query_result",
+        order_by="QueryResultAuthor.position",
+    )
+
+# a DEFAULT partition catches rows no monthly partition was created for yet
+for _table in (QueryRecord.__table__, QueryResult.__table__):
+    event.listen(_table, "after_create", DDL("CREATE TABLE %(table)s_default PARTITION OF %(table)s DEFAULT"))
+
+class Author(Base):
+    __tablename__ = 'authors'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String)
+    # lower-cased, whitespace-collapsed name, see `app.core.ingestion.normalize_author_name`
+    normalized_name: Mapped[str] = mapped_column(String, unique=True, index=True)
+
+class QueryResultAuthor(Base):
+    __tablename__ = 'query_result_authors'
+
+    # author_id leads the primary key so "results by author" is a btree range scan
+    author_id: Mapped[int] = mapped_column(ForeignKey('authors.id', ondelete="CASCADE"), primary_key=True)
+    # removed together with their query results, see `app.core.partitions`
+    query_result_id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    position: Mapped[int] = mapped_column(Integer)
+    author: Mapped["Author"] = relationship()
+    query_result: Mapped["QueryResult"] = relationship(
+        primaryjoin="foreign(QueryResultAuthor.query_result_id) == QueryResult.id", back_populates="authors"
+    )
+
+
+# Rollups below are maintained incrementally at ingestion time by
+# `app.core.ingestion.update_rollups`, so analytics endpoints read a handful of
+# pre-aggregated rows instead of running GROUP BY over the whole history.
+
+class DailyQueryStats(Base):
+    __tablename__ = 'daily_query_stats'
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    # concurrent ingestions add to different shards of the day, reads sum them
+    shard: Mapped[int] = mapped_column(SmallInteger, primary_key=True, default=0)
+    num_queries: Mapped[int] = mapped_column(BigInteger)
+    num_results: Mapped[int] = mapped_column(BigInteger)
+
+class JournalStats(Base):
+    __tablename__ = 'journal_stats'
+
+    journal: Mapped[str] = mapped_column(String, primary_key=True)
+    num_results: Mapped[int] = mapped_column(BigInteger, index=True)
+
+class QueryStats(Base):
+    __tablename__ = 'query_stats'
+
+    query: Mapped[str] = mapped_column(String, primary_key=True)
+    num_queries: Mapped[int] = mapped_column(BigInteger, index=True)
+    last_queried_at: Mapped[datetime] = mapped_column(DateTime)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 
 class BaseResponse(BaseModel):
@@ -37,3 +37,27 @@ class QueryRecordResponse(BaseModel):
 
     class Config:
         orm_mode = True
+
+class QueryRecordDetailResponse(BaseModel):
+    id: int
+    query: str = Field(..., description="Query string used", example="au:John Doe")
+    timestamp: datetime = Field(..., description="Timestamp of the query", example="2023-01-01T00:00:00")
+    status: int = Field(..., description="HTTP status code of the response", example=200)
+    num_results: int = Field(..., description="Number of results found", example=42)
+    results: List[QueryResultResponse] = Field(..., description="First page of query results")
+    next_cursor: Optional[str] = Field(None, description="Cursor of the next page of results, null on the last page")
+
+
+class DailyQueryStatsResponse(BaseResponse):
+    day: date = Field(..., description="UTC day", example="2023-01-01")
+    num_queries: int = Field(..., description="Number of searches made on that day", example=12)
+    num_results: int = Field(..., description="Number of results stored on that day", example=96)
+
+class JournalStatsResponse(BaseResponse):
+    journal: str = Field(..., description="Journal reference", example="Nature")
+    num_results: int = Field(..., description="Number of stored results from this journal", example=42)
+
+class QueryStatsResponse(BaseResponse):
+    query: str = Field(..., description="Query string used", example="au:John Doe")
+    num_queries: int = Field(..., description="Number of times this query was searched", example=7)
+    last_queried_at: datetime = Field(..., description="Timestamp of the latest search", example="2023-01-01T00:00:00")
@@ -0,0 +1,76 @@
+# Precompiled JSON serializers for arXiv responses.
+#
+# Rows read from our own database already satisfy the response schemas, so they
+# are dumped straight to JSON bytes with orjson instead of being validated again
+# through pydantic and `jsonable_encoder`. Output matches the schemas in
+# `app/schemas/responses.py`, keep both in sync.
+
+from collections.abc import Iterable, Sequence
+from operator import attrgetter
+from typing import Any
+
+import orjson
+
+from app.models import QueryRecord, QueryResult
+
+QUERY_RESULT_FIELDS = ("id", "author", "title", "journal")
+QUERY_RECORD_FIELDS = ("id", "query", "timestamp", "status", "num_results")
+
+_query_result_values = attrgetter(*QUERY_RESULT_FIELDS)
+_query_record_values = attrgetter(*QUERY_RECORD_FIELDS)
+
+
+def query_result_rows(rows: Iterable[Sequence[Any]]) -> list[dict[str, Any]]:
+    """`rows` are value tuples in QUERY_RESULT_FIELDS order."""
+    id_, author, title, journal = QUERY_RESULT_FIELDS
+    return [
+        {id_: row[0], author: row[1], title: row[2], journal: row[3]} for row in rows
+    ]
+
+
+def query_record_rows(rows: Iterable[Sequence[Any]]) -> list[dict[str, Any]]:
+    """`rows` are value tuples in QUERY_RECORD_FIELDS order."""
+    id_, query, timestamp, status, num_results = QUERY_RECORD_FIELDS
+    return [
+        {
+            id_: row[0],
+            query: row[1],
+            timestamp: row[2],
+            status: row[3],
+            num_results: row[4],
+        }
+        for row in rows
+    ]
+
+
+def dump_query_result_rows(rows: Iterable[Sequence[Any]]) -> bytes:
+    return orjson.dumps(query_result_rows(rows))
+
+
+def dump_query_record_rows(rows: Iterable[Sequence[Any]]) -> bytes:
+    # orjson writes naive datetimes exactly like datetime.isoformat()
+    return orjson.dumps(query_record_rows(rows))
+
+
+def dump_query_results(results: Iterable[QueryResult]) -> bytes:
+    return dump_query_result_rows(map(_query_result_values, results))
+
+
+def dump_query_records(records: Iterable[QueryRecord]) -> bytes:
+    return dump_query_record_rows(map(_query_record_values, records))
+
+
+def dump_query_record(record: QueryRecord, results: Iterable[QueryResult]) -> bytes:
+    (payload,) = query_record_rows([_query_record_values(record)])
+    payload["results"] = query_result_rows(map(_query_result_values, results))
+    return orjson.dumps(payload)
+
+
+def dump_query_record_detail(
+    record: Sequence[Any], results: Iterable[Sequence[Any]], next_cursor: str | None
+) -> bytes:
+    """`record` in QUERY_RECORD_FIELDS order, `results` in QUERY_RESULT_FIELDS order."""
+    (payload,) = query_record_rows([record])
+    payload["results"] = query_result_rows(results)
+    payload["next_cursor"] = next_cursor
+    return orjson.dumps(payload)
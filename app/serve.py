@@ -0,0 +1,81 @@
+# Production server launcher
+#
+#   python -m app.serve [--workers N] [--host HOST] [--port PORT]
+#
+# Runs uvicorn with N worker processes sharing one listening socket, by default
+# one per CPU available to the process (affinity and cgroup v2 quota included).
+# Workers are spawned, not forked: each imports the app on its own and creates
+# engines, the HTTP client and the dummy hash in its lifespan, see
+# `app/main.py`. Nothing holding sockets or threads crosses a process boundary.
+#
+# On SIGTERM or SIGINT workers stop accepting connections, give in-flight
+# requests up to "server__graceful_shutdown_secs" to finish, run the lifespan
+# shutdown and exit. A worker that dies is replaced by the supervisor.
+#
+# Every worker has its own connection pools, see "Connection Pool" in README.md.
+# Workers put their Prometheus metrics in "metrics__multiproc_dir", emptied
+# here before they start, so any of them can answer a scrape for all, see
+# `app/core/metrics.py`.
+#
+# Configured by the "server" settings group, see `app/core/config.py`.
+
+
+import argparse
+import math
+import os
+from collections.abc import Sequence
+from pathlib import Path
+
+import uvicorn
+
+from app.core.config import get_settings
+
+CGROUP_CPU_MAX = Path("/sys/fs/cgroup/cpu.max")
+
+
+def prepare_metrics_dir(path: Path) -> None:
+    """Empty `path` of a previous server's metric files and hand it to the workers."""
+    path.mkdir(parents=True, exist_ok=True)
+    for stale in path.glob("*.db"):
+        stale.unlink()
+    # read by prometheus_client when a worker imports it, so before uvicorn
+    # imports the app, also in this process when it runs the only worker
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(path)
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:  # pragma: no cover
+        cpus = os.cpu_count() or 1
+    # a container CPU limit shows all host cores but runs on fewer
+    try:
+        quota, period = CGROUP_CPU_MAX.read_text().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    settings = get_settings().server
+    parser = argparse.ArgumentParser(description="Run the API with multiple uvicorn workers.")
+    parser.add_argument("--host", default=settings.host)
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument("--workers", type=int, default=settings.workers, help="defaults to the available CPUs")
+    args = parser.parse_args(argv)
+
+    prepare_metrics_dir(Path(get_settings().metrics.multiproc_dir))
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers or available_cpus(),
+        timeout_graceful_shutdown=settings.graceful_shutdown_secs,
+        forwarded_allow_ips=settings.forwarded_allow_ips,
+    )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
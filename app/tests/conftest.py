@@ -12,9 +12,12 @@ from sqlalchemy.ext.asyncio import (
 )
 
 from app.core import database_session
+from app.core.admission import get_admission_controller
+from app.core.cache import clear_local_caches, get_cache_backend
 from app.core.config import get_settings
 from app.core.security.jwt import create_jwt_token
 from app.core.security.password import get_password_hash
+from app.core.user_cache import get_invalidation_channel
 from app.main import app as fastapi_app
 from app.models import Base, User
 
@@ -38,7 +41,7 @@ async def fixture_setup_new_test_database() -> None:
     test_db_name = f"test_db_{worker_name}"
 
     # create new test db using connection to current database
-    conn = await database_session._ASYNC_ENGINE.connect()
+    conn = await database_session.get_async_engine().connect()
     await conn.execution_options(isolation_level="AUTOCOMMIT")
     await conn.execute(sqlalchemy.text(f"DROP DATABASE IF EXISTS {test_db_name}"))
     await conn.execute(sqlalchemy.text(f"CREATE DATABASE {test_db_name}"))
@@ -77,6 +80,16 @@ async def fixture_clean_get_settings_between_tests() -> AsyncGenerator[None, Non
     get_settings.cache_clear()
 
 
+@pytest_asyncio.fixture(scope="function", autouse=True)
+async def fixture_clean_cache_between_tests() -> AsyncGenerator[None, None]:
+    yield
+
+    get_cache_backend.cache_clear()
+    get_admission_controller.cache_clear()
+    clear_local_caches()
+    get_invalidation_channel.cache_clear()
+
+
 @pytest_asyncio.fixture(name="default_hashed_password", scope="session")
 async def fixture_default_hashed_password() -> str:
     return get_password_hash(default_user_password)
@@ -89,7 +102,7 @@ async def fixture_session_with_rollback(
     # we want to monkeypatch get_async_session with one bound to session
     # that we will always rollback on function scope
 
-    connection = await database_session._ASYNC_ENGINE.connect()
+    connection = await database_session.get_async_engine().connect()
     transaction = await connection.begin()
 
     session = AsyncSession(bind=connection, expire_on_commit=False)
@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session, ingestion
+from app.core.ingestion import update_rollups
+from app.main import app
+from app.models import QueryRecord, QueryResult
+
+
+async def ingest(
+    session: AsyncSession, query: str, timestamp: datetime, journals: list[str | None]
+) -> None:
+    query_record = QueryRecord(
+        query=query, timestamp=timestamp, status=200, num_results=len(journals)
+    )
+    session.add(query_record)
+    await session.flush()
+    query_results = [
+        QueryResult(
+            author="Albert Einstein",
+            title="Relativity",
+            journal=journal,
+            query_record_id=query_record.id,
+            timestamp=timestamp,
+        )
+        for journal in journals
+    ]
+    session.add_all(query_results)
+    await session.flush()
+    await update_rollups(session, [query_record], query_results)
+    await session.commit()
+
+
+async def test_queries_per_day_are_accumulated(
+    client: AsyncClient, session: AsyncSession
+) -> None:
+    today = datetime(2024, 1, 2, 12)
+    await ingest(session, "au:Einstein", today, ["Nature", None])
+    await ingest(session, "ti:Relativity", today, ["Nature"])
+    await ingest(session, "au:Einstein", today - timedelta(days=1), [])
+
+    response = await client.get(
+        app.url_path_for("get_queries_per_day"), params={"start": "2024-01-01"}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"day": "2024-01-01", "num_queries": 1, "num_results": 0},
+        {"day": "2024-01-02", "num_queries": 2, "num_results": 3},
+    ]
+
+    response = await client.get(
+        app.url_path_for("get_queries_per_day"),
+        params={"start": "2024-01-02", "end": "2024-01-02"},
+    )
+
+    assert [row["day"] for row in response.json()] == ["2024-01-02"]
+
+
+async def test_queries_per_day_sums_shards(
+    client: AsyncClient, session: AsyncSession, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    today = datetime(2024, 1, 2, 12)
+    for shard in (0, 1, 1):
+        monkeypatch.setattr(ingestion.random, "randrange", lambda stop: shard)
+        await ingest(session, "au:Einstein", today, ["Nature"])
+
+    response = await client.get(
+        app.url_path_for("get_queries_per_day"), params={"start": "2024-01-02"}
+    )
+
+    assert response.json() == [
+        {"day": "2024-01-02", "num_queries": 3, "num_results": 3}
+    ]
+
+
+async def test_concurrent_ingestions_of_a_day_do_not_wait_for_each_other(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    today = datetime(2024, 1, 2, 12)
+    engine = database_session.get_async_engine()
+    async with AsyncSession(engine) as first, AsyncSession(engine) as second:
+        for shard, (session, query) in enumerate(((first, "au:Einstein"), (second, "au:Bohr"))):
+            monkeypatch.setattr(ingestion.random, "randrange", lambda stop: shard)
+            await session.execute(text("SET LOCAL lock_timeout = '1s'"))
+            record = QueryRecord(
+                id=-1 - shard, query=query, timestamp=today, status=200, num_results=0
+            )
+            # the first transaction is still open and holds its rollup rows
+            await update_rollups(session, [record], [])
+        await first.rollback()
+        await second.rollback()
+
+
+async def test_results_per_journal_are_ordered_by_count(
+    client: AsyncClient, session: AsyncSession
+) -> None:
+    now = datetime.utcnow()
+    await ingest(session, "au:Einstein", now, ["Nature", "Science", None])
+    await ingest(session, "au:Bohr", now, ["Science"])
+
+    response = await client.get(
+        app.url_path_for("get_results_per_journal"), params={"limit": 1}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [{"journal": "Science", "num_results": 2}]
+
+
+async def test_top_queries_track_count_and_last_search(
+    client: AsyncClient, session: AsyncSession
+) -> None:
+    now = datetime.utcnow()
+    await ingest(session, "au:Einstein", now - timedelta(hours=1), [])
+    await ingest(session, "au:Einstein", now, [])
+    await ingest(session, "au:Bohr", now, [])
+
+    response = await client.get(app.url_path_for("get_top_queries"))
+
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert [(row["query"], row["num_queries"]) for row in data] == [
+        ("au:Einstein", 2),
+        ("au:Bohr", 1),
+    ]
+    assert data[0]["last_queried_at"] == now.isoformat()
@@ -1,13 +1,22 @@
 import json
 from fastapi import status
 from httpx import AsyncClient
+from prometheus_client import REGISTRY
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 import pytest
+import requests
+import threading
 from unittest.mock import patch, MagicMock
 import time
 
+from app.api.pagination import encode_cursor
+from app.core import cache as cache_module
+from app.core.ingestion import update_rollups
+from app.core import write_behind
+from app.core.write_behind import SearchWriter
 from app.main import app
-from app.models import QueryRecord, QueryResult, User
+from app.models import Author, QueryRecord, QueryResult, QueryResultAuthor, User
 from app.schemas.requests import ArxivSearchRequest, QueryTimestampRequest
 from datetime import datetime, timedelta
 
@@ -44,7 +53,7 @@ async def test_arxiv_search_successful(client: AsyncClient, default_user_headers
 # Test no results found
 @pytest.mark.asyncio
 async def test_arxiv_search_no_results(client: AsyncClient, default_user_headers: dict, session: AsyncSession, mock_response):
-    with patch('requests.get', return_value=mock_response({'feed': {'opensearch_totalresults': '0', 'entries': []}}, 200)):
+    with patch('requests.Session.get', return_value=mock_response({'feed': {'opensearch_totalresults': '0', 'entries': []}}, 200)):
         request_data = {
             "author": "Nobody",
             "title": "",
@@ -79,7 +88,7 @@ async def test_arxiv_search_invalid_query(client: AsyncClient, default_user_head
 # Test arXiv API unavailability
 @pytest.mark.asyncio
 async def test_arxiv_api_unavailable(client: AsyncClient, default_user_headers: dict, session: AsyncSession, mock_response):
-    with patch('requests.get', return_value=mock_response({}, 503)):  # Simulate API failure
+    with patch('requests.Session.get', return_value=mock_response({}, 503)):  # Simulate API failure
         request_data = {
             "author": "Einstein",
             "title": "Relativity",
@@ -200,6 +209,8 @@ async def test_get_results_with_pagination(client: AsyncClient, default_user_hea
     data = response.json()
     assert len(data) == 1
     assert data[0]["author"] == "Newton"
+    assert response.headers["x-has-more"] == "true"
+    assert "x-total-count" not in response.headers
 
     response = await client.get(
         "/arxiv/results",
@@ -211,6 +222,7 @@ async def test_get_results_with_pagination(client: AsyncClient, default_user_hea
     data = response.json()
     assert len(data) == 1
     assert data[0]["author"] == "Einstein"
+    assert response.headers["x-has-more"] == "false"
 
 @pytest.mark.asyncio
 async def test_get_results_no_results(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
@@ -274,4 +286,419 @@ async def test_get_results_invalid_pagination_params(client: AsyncClient, defaul
         params={"page": "invalid", "items_per_page": "invalid"}
     )
 
-    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
\ No newline at end of file
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+ARXIV_FEED = b'''<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" xmlns:arxiv="http://arxiv.org/schemas/atom">
+  <title>ArXiv Query</title>
+  <opensearch:totalResults>2</opensearch:totalResults>
+  <entry>
+    <title>Can Quantum-Mechanical Description of Physical Reality Be Considered Complete?</title>
+    <author><name>Albert Einstein</name></author>
+    <author><name>Nathan  Rosen</name></author>
+    <arxiv:journal_ref>Phys. Rev. 47, 777</arxiv:journal_ref>
+  </entry>
+  <entry>
+    <title>Theoretical remark on the superconductivity of metals</title>
+    <author><name>albert einstein</name></author>
+  </entry>
+</feed>'''
+
+@pytest.fixture
+def arxiv_feed_response():
+    response = MagicMock()
+    response.status_code = 200
+    response.content = ARXIV_FEED
+    return response
+
+@pytest.mark.asyncio
+async def test_arxiv_search_stores_normalized_authors(client: AsyncClient, default_user_headers: dict, session: AsyncSession, arxiv_feed_response):
+    with patch('requests.Session.get', return_value=arxiv_feed_response):
+        response = await client.post(
+            "/arxiv/search",
+            headers=default_user_headers,
+            json={"author": "Einstein", "max_query_results": 8}
+        )
+
+    assert response.status_code == status.HTTP_201_CREATED
+    data = response.json()
+    assert [result["author"] for result in data["results"]] == ["Albert Einstein, Nathan  Rosen", "albert einstein"]
+
+    authors = (await session.execute(select(Author.normalized_name, Author.name).order_by(Author.normalized_name))).all()
+    assert authors == [("albert einstein", "Albert Einstein"), ("nathan rosen", "Nathan Rosen")]
+    links = await session.scalar(select(func.count()).select_from(QueryResultAuthor))
+    assert links == 3
+
+@pytest.mark.asyncio
+async def test_get_author_results(client: AsyncClient, default_user_headers: dict, session: AsyncSession, arxiv_feed_response):
+    with patch('requests.Session.get', return_value=arxiv_feed_response):
+        await client.post("/arxiv/search", headers=default_user_headers, json={"author": "Einstein"})
+
+    response = await client.get("/arxiv/authors/ALBERT  Einstein/results", headers=default_user_headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert len(data) == 2
+    assert {result["journal"] for result in data} == {"Phys. Rev. 47, 777", None}
+
+    response = await client.get("/arxiv/authors/nathan rosen/results", headers=default_user_headers, params={"page": 0, "items_per_page": 1})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 1
+
+@pytest.mark.asyncio
+async def test_get_author_results_no_results(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
+    response = await client.get("/arxiv/authors/Nobody/results", headers=default_user_headers)
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()["detail"] == "No query results found for this author."
+
+@pytest.mark.asyncio
+async def test_get_queries_not_modified_until_new_record(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
+    session.add(QueryRecord(query="au:Einstein", timestamp=datetime.utcnow() - timedelta(hours=1), status=200, num_results=10))
+    await session.commit()
+    params = {"query_timestamp_start": (datetime.utcnow() - timedelta(days=2)).isoformat()}
+
+    response = await client.get("/arxiv/queries", headers=default_user_headers, params=params)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["cache-control"] == "no-cache"
+    etag = response.headers["etag"]
+
+    response = await client.get("/arxiv/queries", headers={**default_user_headers, "If-None-Match": etag}, params=params)
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = await client.get("/arxiv/queries", headers={**default_user_headers, "If-None-Match": etag}, params={**params, "download": True})
+
+    assert response.status_code == status.HTTP_200_OK
+
+    session.add(QueryRecord(query="ti:Relativity", timestamp=datetime.utcnow(), status=200, num_results=5))
+    await session.commit()
+
+    response = await client.get("/arxiv/queries", headers={**default_user_headers, "If-None-Match": etag}, params=params)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["etag"] != etag
+    assert len(response.json()) == 2
+
+@pytest.mark.asyncio
+async def test_get_queries_etag_changes_on_late_record_inside_range(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
+    now = datetime.utcnow()
+    session.add(QueryRecord(query="au:Einstein", timestamp=now - timedelta(hours=2), status=200, num_results=10))
+    session.add(QueryRecord(query="au:Bohr", timestamp=now - timedelta(minutes=1), status=200, num_results=10))
+    await session.commit()
+    params = {"query_timestamp_start": (now - timedelta(days=1)).isoformat()}
+
+    response = await client.get("/arxiv/queries", headers=default_user_headers, params=params)
+    etag = response.headers["etag"]
+
+    # committed late, between the first and the last timestamp of the range
+    session.add(QueryRecord(query="ti:Relativity", timestamp=now - timedelta(hours=1), status=200, num_results=5))
+    await session.commit()
+
+    response = await client.get("/arxiv/queries", headers={**default_user_headers, "If-None-Match": etag}, params=params)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["etag"] != etag
+    assert len(response.json()) == 3
+
+@pytest.mark.asyncio
+async def test_get_queries_closed_range_is_cacheable(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
+    session.add(QueryRecord(query="au:Einstein", timestamp=datetime(2024, 1, 1, 12), status=200, num_results=10))
+    await session.commit()
+    params = {"query_timestamp_start": "2024-01-01T00:00:00", "query_timestamp_end": "2024-01-02T00:00:00"}
+
+    response = await client.get("/arxiv/queries", headers=default_user_headers, params=params)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["cache-control"] == "public, max-age=3600"
+    assert response.headers["last-modified"] == "Mon, 01 Jan 2024 12:00:00 GMT"
+
+    response = await client.get(
+        "/arxiv/queries",
+        headers={**default_user_headers, "If-Modified-Since": response.headers["last-modified"]},
+        params=params
+    )
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+@pytest.mark.asyncio
+async def test_get_results_not_modified(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
+    query_record = QueryRecord(query="au:Einstein", timestamp=datetime.utcnow(), status=200, num_results=1)
+    session.add(query_record)
+    await session.commit()
+    session.add(QueryResult(author="Einstein", title="Relativity", journal=None, query_record_id=query_record.id, timestamp=datetime.utcnow()))
+    await session.commit()
+
+    response = await client.get("/arxiv/results", headers=default_user_headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["etag"]
+
+    response = await client.get("/arxiv/results", headers={**default_user_headers, "If-None-Match": f'"other", {etag}'})
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    response = await client.get("/arxiv/results", headers={**default_user_headers, "If-None-Match": etag}, params={"page": 1})
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+@pytest.mark.asyncio
+async def test_get_results_etag_changes_on_late_commit_below_last_id(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
+    now = datetime.utcnow()
+    query_record = QueryRecord(query="au:Einstein", timestamp=now, status=200, num_results=3)
+    session.add(query_record)
+    await session.flush()
+    first, last = (
+        QueryResult(author="Einstein", title=f"Paper {i}", journal=None, query_record_id=query_record.id, timestamp=now)
+        for i in range(2)
+    )
+    session.add_all([first, last])
+    await session.flush()
+    last.id = first.id + 10
+    await update_rollups(session, [query_record], [first, last])
+    await session.commit()
+
+    response = await client.get("/arxiv/results", headers=default_user_headers)
+    etag = response.headers["etag"]
+
+    # another search committed late with an id taken earlier, e.g. from a write-behind block
+    late_record = QueryRecord(query="au:Bohr", timestamp=now, status=200, num_results=1)
+    session.add(late_record)
+    await session.flush()
+    late = QueryResult(id=first.id + 5, author="Bohr", title="Late", journal=None, query_record_id=late_record.id, timestamp=now)
+    session.add(late)
+    await session.flush()
+    await update_rollups(session, [late_record], [late])
+    await session.commit()
+
+    response = await client.get("/arxiv/results", headers={**default_user_headers, "If-None-Match": etag})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 3
+
+@pytest.mark.asyncio
+async def test_arxiv_search_reuses_cached_feed(client: AsyncClient, default_user_headers: dict, session: AsyncSession, arxiv_feed_response):
+    with patch('requests.Session.get', return_value=arxiv_feed_response) as upstream:
+        for _ in range(2):
+            response = await client.post("/arxiv/search", headers=default_user_headers, json={"title": "Relativity"})
+            assert response.status_code == status.HTTP_201_CREATED
+
+    assert upstream.call_count == 1
+    records = await session.scalar(select(func.count()).select_from(QueryRecord).where(QueryRecord.query == "ti:Relativity"))
+    assert records == 2
+
+@pytest.mark.asyncio
+async def test_arxiv_search_upstream_call_leaves_the_event_loop(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
+    loop_thread = threading.get_ident()
+    calls = []
+
+    def get(url, **kwargs):
+        calls.append((threading.get_ident(), kwargs))
+        raise requests.exceptions.ReadTimeout("read timed out")
+
+    with patch('requests.Session.get', side_effect=get):
+        response = await client.post("/arxiv/search", headers=default_user_headers, json={"title": "Slow upstream"})
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    ((thread, kwargs),) = calls
+    assert thread != loop_thread
+    assert kwargs["timeout"] == (5.0, 30.0)
+
+@pytest.mark.asyncio
+async def test_get_results_include_total(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
+    query_record = QueryRecord(query="au:Einstein", timestamp=datetime.utcnow(), status=200, num_results=3)
+    session.add(query_record)
+    await session.commit()
+    session.add_all([
+        QueryResult(author="Einstein", title=f"Paper {i}", journal=None, query_record_id=query_record.id, timestamp=datetime.utcnow())
+        for i in range(3)
+    ])
+    await session.commit()
+
+    response = await client.get("/arxiv/results", headers=default_user_headers, params={"items_per_page": 2, "include_total": True})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 2
+    assert response.headers["x-has-more"] == "true"
+    assert response.headers["x-total-count"] == "3"
+    assert response.headers["x-total-count-exact"] == "true"
+
+@pytest.mark.asyncio
+async def test_get_results_estimated_total(client: AsyncClient, default_user_headers: dict, session: AsyncSession, monkeypatch):
+    monkeypatch.setenv("PAGINATION__EXACT_COUNT_THRESHOLD", "0")
+    query_record = QueryRecord(query="au:Einstein", timestamp=datetime.utcnow(), status=200, num_results=1)
+    session.add(query_record)
+    await session.commit()
+    session.add(QueryResult(author="Einstein", title="Relativity", journal=None, query_record_id=query_record.id, timestamp=datetime.utcnow()))
+    await session.commit()
+
+    response = await client.get("/arxiv/results", headers=default_user_headers, params={"include_total": True})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["x-total-count-exact"] == "false"
+    assert int(response.headers["x-total-count"]) > 0
+
+@pytest.mark.asyncio
+async def test_get_author_results_include_total(client: AsyncClient, default_user_headers: dict, session: AsyncSession, arxiv_feed_response):
+    with patch('requests.Session.get', return_value=arxiv_feed_response):
+        await client.post("/arxiv/search", headers=default_user_headers, json={"author": "Einstein"})
+
+    response = await client.get("/arxiv/authors/albert einstein/results", headers=default_user_headers, params={"items_per_page": 1, "include_total": True})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["x-has-more"] == "true"
+    assert response.headers["x-total-count"] == "2"
+    assert response.headers["x-total-count-exact"] == "true"
+
+@pytest.mark.asyncio
+async def test_get_query_detail_and_results_by_cursor(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
+    query_record = QueryRecord(query="au:Einstein", timestamp=datetime.utcnow(), status=200, num_results=5)
+    session.add(query_record)
+    await session.commit()
+    session.add_all([
+        QueryResult(author="Einstein", title=f"Paper {i}", journal=None, query_record_id=query_record.id, timestamp=datetime.utcnow())
+        for i in range(5)
+    ])
+    await session.commit()
+
+    response = await client.get(f"/arxiv/queries/{query_record.id}", headers=default_user_headers, params={"items_per_page": 2})
+
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["id"] == query_record.id
+    assert data["num_results"] == 5
+    assert [result["title"] for result in data["results"]] == ["Paper 0", "Paper 1"]
+    assert data["next_cursor"] == response.headers["x-next-cursor"]
+
+    titles = [result["title"] for result in data["results"]]
+    cursor = data["next_cursor"]
+    while cursor:
+        response = await client.get(
+            f"/arxiv/queries/{query_record.id}/results",
+            headers=default_user_headers,
+            params={"cursor": cursor, "items_per_page": 2}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        titles += [result["title"] for result in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+
+    assert titles == [f"Paper {i}" for i in range(5)]
+    assert response.headers["x-has-more"] == "false"
+
+@pytest.mark.asyncio
+async def test_get_query_detail_not_found(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
+    response = await client.get("/arxiv/queries/2147483647", headers=default_user_headers)
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = await client.get("/arxiv/queries/2147483647/results", headers=default_user_headers)
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("query_id", [0, -1, 2**31])
+async def test_get_query_id_out_of_range(client: AsyncClient, default_user_headers: dict, session: AsyncSession, query_id: int):
+    for path in (f"/arxiv/queries/{query_id}", f"/arxiv/queries/{query_id}/results"):
+        response = await client.get(path, headers=default_user_headers)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+@pytest.mark.asyncio
+async def test_get_query_results_invalid_cursor(client: AsyncClient, default_user_headers: dict, session: AsyncSession):
+    query_record = QueryRecord(query="au:Einstein", timestamp=datetime.utcnow(), status=200, num_results=0)
+    session.add(query_record)
+    await session.commit()
+
+    now = datetime.utcnow().isoformat()
+    cursors = [
+        "not-a-cursor",
+        "WyJhIl0",
+        "WyJhIiwiYiJd",
+        # ids outside int4 or not ints, and timestamps with a time zone
+        encode_cursor(2**31, now),
+        encode_cursor(0, now),
+        encode_cursor(True, now),
+        encode_cursor(1, now + "+02:00"),
+    ]
+    for cursor in cursors:
+        response = await client.get(f"/arxiv/queries/{query_record.id}/results", headers=default_user_headers, params={"cursor": cursor})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = await client.get(f"/arxiv/queries/{query_record.id}/results", headers=default_user_headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+
+@pytest.mark.asyncio
+async def test_arxiv_search_write_behind(client: AsyncClient, default_user_headers: dict, session: AsyncSession, arxiv_feed_response, monkeypatch):
+    writer = SearchWriter(queue_size=10, batch_size=10, flush_interval_secs=0.01, enqueue_timeout_secs=1, wait_for_commit=True, synchronous_commit=False, id_block_size=10)
+    writer.start()
+    monkeypatch.setattr(write_behind, "_WRITER", writer)
+
+    with patch('requests.Session.get', return_value=arxiv_feed_response):
+        response = await client.post("/arxiv/search", headers=default_user_headers, json={"author": "Einstein"})
+    await writer.close()
+
+    assert response.status_code == status.HTTP_201_CREATED
+    data = response.json()
+    record = await session.get(QueryRecord, (data["id"], datetime.fromisoformat(data["timestamp"])))
+    assert record is not None
+    result_ids = (await session.scalars(select(QueryResult.id).where(QueryResult.query_record_id == data["id"]).order_by(QueryResult.id))).all()
+    assert result_ids == [result["id"] for result in data["results"]]
+    links = await session.scalar(select(func.count()).select_from(QueryResultAuthor))
+    assert links == 3
+
+@pytest.mark.asyncio
+async def test_arxiv_search_write_behind_queue_full(client: AsyncClient, default_user_headers: dict, session: AsyncSession, arxiv_feed_response, monkeypatch):
+    # never started, nothing drains the queue
+    writer = SearchWriter(queue_size=1, batch_size=10, flush_interval_secs=0.01, enqueue_timeout_secs=0.01, wait_for_commit=False, synchronous_commit=True, id_block_size=10)
+    monkeypatch.setattr(write_behind, "_WRITER", writer)
+
+    with patch('requests.Session.get', return_value=arxiv_feed_response):
+        response = await client.post("/arxiv/search", headers=default_user_headers, json={"author": "Einstein"})
+        assert response.status_code == status.HTTP_201_CREATED
+        response = await client.post("/arxiv/search", headers=default_user_headers, json={"author": "Einstein"})
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+@pytest.mark.asyncio
+async def test_arxiv_search_metrics(client: AsyncClient, default_user_headers: dict, session: AsyncSession, arxiv_feed_response):
+    def sample(name, labels=None):
+        return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+    before = {
+        "responses": sample("arxiv_upstream_responses_total", {"status": "200"}),
+        "parsed": sample("arxiv_feed_parse_seconds_count"),
+        "records": sample("rows_ingested_total", {"table": "query_records"}),
+        "results": sample("rows_ingested_total", {"table": "query_results"}),
+    }
+    with patch('requests.Session.get', return_value=arxiv_feed_response):
+        response = await client.post("/arxiv/search", headers=default_user_headers, json={"author": "Einstein"})
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert sample("arxiv_upstream_responses_total", {"status": "200"}) == before["responses"] + 1
+    assert sample("arxiv_feed_parse_seconds_count") == before["parsed"] + 1
+    assert sample("rows_ingested_total", {"table": "query_records"}) == before["records"] + 1
+    assert sample("rows_ingested_total", {"table": "query_results"}) == before["results"] + 2
+
+
+@pytest.mark.asyncio
+async def test_arxiv_endpoints_work_while_the_cache_is_down(client: AsyncClient, default_user_headers: dict, session: AsyncSession, arxiv_feed_response, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    server.connected = False
+    backend = cache_module.RedisBackend(fakeredis.FakeAsyncRedis(server=server))
+    monkeypatch.setattr(cache_module, "get_cache_backend", lambda: backend)
+
+    with patch('requests.Session.get', return_value=arxiv_feed_response):
+        response = await client.post("/arxiv/search", headers=default_user_headers, json={"author": "Einstein"})
+    assert response.status_code == status.HTTP_201_CREATED
+
+    start = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    response = await client.get("/arxiv/queries", headers=default_user_headers, params={"query_timestamp_start": start})
+    assert response.status_code == status.HTTP_200_OK
+    response = await client.get("/arxiv/results", headers=default_user_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert cache_module.cache_metrics()["arxiv-read"]["errors"] == 4
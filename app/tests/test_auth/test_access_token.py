@@ -1,14 +1,19 @@
 import time
 
+import bcrypt
+import pytest
+
 from fastapi import status
 from freezegun import freeze_time
-from httpx import AsyncClient
+from httpx import ASGITransport, AsyncClient
 from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
 from app.api import api_messages
 from app.core.config import get_settings
 from app.core.security.jwt import verify_jwt_token
+from app.core.security.password import password_hash_rounds, verify_password
 from app.main import app
 from app.models import RefreshToken, User
 from app.tests.conftest import default_user_password
@@ -191,3 +196,111 @@ async def test_auth_access_token_fail_for_invalid_password_with_message(
 
     assert response.status_code == status.HTTP_400_BAD_REQUEST
     assert response.json() == {"detail": api_messages.PASSWORD_INVALID}
+
+
+async def test_login_access_token_latency_is_exported(
+    client: AsyncClient,
+    default_user: User,
+) -> None:
+    await client.post(
+        app.url_path_for("login_access_token"),
+        data={"username": default_user.email, "password": "wrong"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+
+    response = await client.get("/metrics")
+
+    assert 'auth_login_seconds_count{outcome="invalid"}' in response.text
+    assert "password_hashing_pending 0.0" in response.text
+
+
+async def test_login_access_token_503_when_password_hashing_saturated(
+    client: AsyncClient,
+    default_user: User,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("SECURITY__PASSWORD_HASH_MAX_PENDING", "0")
+
+    response = await client.post(
+        app.url_path_for("login_access_token"),
+        data={"username": default_user.email, "password": default_user_password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["retry-after"] == "1"
+
+
+async def test_login_access_token_429_when_client_is_over_its_rate(
+    client: AsyncClient,
+    default_user: User,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("ADMISSION__PER_CLIENT_ENABLED", "true")
+    monkeypatch.setenv("ADMISSION__PER_CLIENT_BURST", "2")
+    monkeypatch.setenv("ADMISSION__PER_CLIENT_RATE", "0.1")
+
+    statuses = []
+    for _ in range(3):
+        response = await client.post(
+            app.url_path_for("login_access_token"),
+            data={"username": default_user.email, "password": "wrong"},
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        statuses.append(response.status_code)
+
+    assert statuses == [status.HTTP_400_BAD_REQUEST] * 2 + [status.HTTP_429_TOO_MANY_REQUESTS]
+    assert response.json() == {"detail": api_messages.TOO_MANY_REQUESTS}
+    # one token per 10s
+    assert 1 <= int(response.headers["retry-after"]) <= 10
+
+
+async def test_clients_behind_a_trusted_proxy_are_limited_separately(
+    default_user: User,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("ADMISSION__PER_CLIENT_ENABLED", "true")
+    monkeypatch.setenv("ADMISSION__PER_CLIENT_BURST", "1")
+    monkeypatch.setenv("ADMISSION__PER_CLIENT_RATE", "0.1")
+    # what uvicorn runs with "server__forwarded_allow_ips" set to the proxy, 127.0.0.1 here
+    transport = ASGITransport(app=ProxyHeadersMiddleware(app, trusted_hosts="127.0.0.1"))  # type: ignore[arg-type]
+
+    statuses = []
+    async with AsyncClient(transport=transport, base_url="http://test", headers={"Host": "localhost"}) as proxy:
+        for client_address in ("203.0.113.1", "203.0.113.2", "203.0.113.1"):
+            response = await proxy.post(
+                app.url_path_for("login_access_token"),
+                data={"username": default_user.email, "password": "wrong"},
+                headers={"X-Forwarded-For": client_address},
+            )
+            statuses.append(response.status_code)
+
+    assert statuses == [status.HTTP_400_BAD_REQUEST] * 2 + [status.HTTP_429_TOO_MANY_REQUESTS]
+
+
+@pytest.mark.parametrize("stored_rounds, rehashed", [(4, True), (6, False)])
+async def test_login_access_token_rehashes_password_of_a_lower_cost(
+    client: AsyncClient,
+    default_user: User,
+    session: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch,
+    stored_rounds: int,
+    rehashed: bool,
+) -> None:
+    monkeypatch.setenv("SECURITY__PASSWORD_BCRYPT_ROUNDS", "5")
+    old_hashed_password = bcrypt.hashpw(default_user_password.encode(), bcrypt.gensalt(stored_rounds)).decode()
+    default_user.hashed_password = old_hashed_password
+    await session.commit()
+
+    response = await client.post(
+        app.url_path_for("login_access_token"),
+        data={"username": default_user.email, "password": default_user_password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    hashed_password = await session.scalar(select(User.hashed_password).where(User.user_id == default_user.user_id))
+    assert hashed_password is not None
+    assert (hashed_password != old_hashed_password) is rehashed
+    assert password_hash_rounds(hashed_password) == (5 if rehashed else stored_rounds)
+    assert verify_password(default_user_password, hashed_password)
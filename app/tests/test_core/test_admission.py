@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from app.core import admission
+from app.core.admission import AdmissionController, TokenBucket, retry_after, run_load_sampler
+from app.core.config import get_settings
+
+
+def new_controller(**overrides: float) -> AdmissionController:
+    settings = {
+        "per_client_enabled": True,
+        "per_client_rate": 1.0,
+        "per_client_burst": 2,
+        "global_rate": 10.0,
+        "global_burst": 3,
+        "max_clients": 2,
+        "max_cpu_utilization": 0.8,
+        "max_loop_lag_secs": 0.05,
+        "min_rate_factor": 0.1,
+        "recovery_step": 0.25,
+    } | overrides
+    controller = AdmissionController(**settings)  # type: ignore[arg-type]
+    controller.worker.updated_at = 0.0
+    return controller
+
+
+def test_token_bucket_refills_at_its_rate() -> None:
+    bucket = TokenBucket(rate=2.0, burst=1, now=0.0)
+
+    assert bucket.try_take(0.0) == 0
+    assert bucket.try_take(0.0) == 0.5
+    assert bucket.try_take(0.5) == 0
+    assert retry_after(0.2) == "1"
+
+
+def test_clients_are_limited_separately() -> None:
+    controller = new_controller()
+
+    assert [controller.admit("a", 0.0) for _ in range(3)] == [0, 0, 1.0]
+    assert controller.admit("b", 0.0) == 0
+
+
+def test_without_per_client_limits_only_the_worker_limits() -> None:
+    controller = new_controller(per_client_enabled=False)
+
+    assert [controller.admit("proxy", 0.0) for _ in range(4)] == [0, 0, 0, 0.1]
+    assert not controller.clients
+
+
+def test_worker_limit_keeps_the_client_token() -> None:
+    controller = new_controller()
+
+    for client in ("a", "b", "c"):
+        assert controller.admit(client, 0.0) == 0
+    assert controller.admit("c", 0.0) > 0
+
+    assert controller.clients["c"].tokens == 1
+    # bounded, least recently seen forgotten first
+    assert list(controller.clients) == ["b", "c"]
+
+
+def test_worker_rate_adapts_to_load() -> None:
+    controller = new_controller()
+
+    controller.record_load(cpu_utilization=0.95, loop_lag_secs=0.0, now=0.0)
+    controller.record_load(cpu_utilization=0.1, loop_lag_secs=0.2, now=0.0)
+    assert controller.worker.rate == 2.5
+
+    for _ in range(10):
+        controller.record_load(cpu_utilization=1.0, loop_lag_secs=0.0, now=0.0)
+    assert controller.worker.rate == 1.0
+
+    controller.record_load(cpu_utilization=0.1, loop_lag_secs=0.0, now=0.0)
+    assert controller.rate_factor == 0.35
+
+
+async def test_load_sampler_feeds_the_controller(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ADMISSION__SAMPLE_INTERVAL_SECS", "0.01")
+    get_settings.cache_clear()
+    controller = new_controller()
+    samples = []
+
+    def record_load(cpu_utilization: float, loop_lag_secs: float, now: float) -> None:
+        samples.append((cpu_utilization, loop_lag_secs))
+        if len(samples) == 2:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(controller, "record_load", record_load)
+    monkeypatch.setattr(admission, "get_admission_controller", lambda: controller)
+
+    with pytest.raises(asyncio.CancelledError):
+        await run_load_sampler()
+
+    assert len(samples) == 2
+    assert all(cpu_utilization >= 0 and loop_lag_secs >= 0 for cpu_utilization, loop_lag_secs in samples)
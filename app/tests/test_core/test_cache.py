@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from app.core import cache as cache_module
+from app.core.cache import Cache, InMemoryBackend, RedisBackend, get_cache
+
+
+async def test_memory_backend_evicts_least_recently_used() -> None:
+    backend = InMemoryBackend(max_entries=2)
+    cache = Cache(backend, "test")
+
+    await cache.set_many({"a": b"1", "b": b"2"})
+    assert await cache.get("a") == b"1"
+    await cache.set("c", b"3")
+
+    assert await cache.get_many(["a", "b", "c"]) == [b"1", None, b"3"]
+    assert backend.evictions == 1
+
+
+async def test_memory_backend_expires_entries(monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = Cache(InMemoryBackend(max_entries=10), "test", default_ttl=10)
+    await cache.set("a", b"1")
+    await cache.set("b", b"2", ttl=100)
+
+    now = time.monotonic()
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now + 50)
+
+    assert await cache.get_many(["a", "b"]) == [None, b"2"]
+
+
+async def test_memory_backend_is_bounded_by_bytes() -> None:
+    backend = InMemoryBackend(max_entries=10, max_bytes=20)
+    cache = Cache(backend, "t")
+
+    # 2 byte keys ("t:a") plus 5 byte values, 8 bytes each
+    await cache.set_many({"a": b"11111", "b": b"22222"})
+    await cache.set("c", b"33333")
+
+    assert await cache.get_many(["a", "b", "c"]) == [None, b"22222", b"33333"]
+    assert backend.size_bytes == 16
+
+    # larger than the whole budget, not stored and nothing evicted for it
+    await cache.set("d", b"4" * 20)
+
+    assert await cache.get_many(["b", "c", "d"]) == [b"22222", b"33333", None]
+    await cache.delete("b", "c")
+    assert backend.size_bytes == 0
+
+
+async def test_namespaces_do_not_collide() -> None:
+    backend = InMemoryBackend(max_entries=10)
+    first = Cache(backend, "first", key_prefix="app")
+    second = Cache(backend, "second", key_prefix="app")
+
+    await first.set("key", b"1")
+
+    assert await second.get("key") is None
+    await first.delete("key")
+    assert await first.get("key") is None
+
+
+async def test_metrics_count_hits_and_misses() -> None:
+    cache = get_cache("test-metrics")
+    await cache.set("a", b"1")
+    await cache.get_many(["a", "b", "a"])
+
+    assert cache.metrics.sets == 1
+    assert cache.metrics.hits == 2
+    assert cache.metrics.misses == 1
+    assert cache_module.cache_metrics()["test-metrics"]["hit_rate"] == 2 / 3
+
+
+async def test_redis_backend_batches_with_ttl_and_namespaces() -> None:
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeAsyncRedis()
+    cache = Cache(RedisBackend(client), "test", default_ttl=60, key_prefix="app")
+
+    await cache.set_many({"a": b"1", "b": b"2"})
+
+    assert await cache.get_many(["a", "b", "c"]) == [b"1", b"2", None]
+    assert await client.get("app:test:a") == b"1"
+    assert 0 < await client.ttl("app:test:a") <= 60
+
+    await cache.delete("a")
+    assert await cache.get("a") is None
+    await cache.backend.close()
+
+
+async def test_redis_outage_fails_open() -> None:
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    server.connected = False
+    cache = Cache(RedisBackend(fakeredis.FakeAsyncRedis(server=server)), "test")
+
+    await cache.set("a", b"1")
+    assert await cache.get_many(["a", "b"]) == [None, None]
+    await cache.delete("a")
+
+    assert cache.metrics.errors == 3
+    assert cache.metrics.misses == 2
+    assert cache.metrics.sets == 0
@@ -0,0 +1,150 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core import database_session
+from app.core.config import get_settings
+from app.core.database_session import ReplicaMonitor, new_async_engine, prewarm_pool
+
+
+async def test_replica_monitor_healthy_when_caught_up() -> None:
+    monitor = ReplicaMonitor(database_session.get_async_engine(), max_lag_secs=5, check_interval_secs=60)
+
+    assert await monitor.is_usable()
+    assert monitor.lag_secs == 0
+    assert monitor.replica_reads == 1
+
+
+async def test_replica_monitor_falls_back_when_lagging() -> None:
+    monitor = ReplicaMonitor(database_session.get_async_engine(), max_lag_secs=-1, check_interval_secs=60)
+
+    assert not await monitor.is_usable()
+    assert monitor.primary_fallbacks == 1
+
+
+async def test_replica_monitor_falls_back_when_down() -> None:
+    engine = new_async_engine(get_settings().sqlalchemy_database_uri.set(port=1), connect_args={"timeout": 1})
+    monitor = ReplicaMonitor(engine, max_lag_secs=5, check_interval_secs=60)
+
+    assert not await monitor.is_usable()
+    assert monitor.lag_secs is None
+    await engine.dispose()
+
+
+@pytest.mark.parametrize(
+    "streaming, receive_lsn, replay_lsn, lag_secs",
+    [
+        (True, "0/10", "0/10", 0),
+        (True, "0/20", "0/10", 3600),
+        # replay caught up with the last WAL received before the receiver stopped
+        (False, "0/10", "0/10", None),
+    ],
+)
+async def test_replica_lag_of_standby(
+    session: AsyncSession, streaming: bool, receive_lsn: str, replay_lsn: str, lag_secs: float | None
+) -> None:
+    standby = (
+        f"SELECT true AS in_recovery, {streaming} AS streaming, '{receive_lsn}'::pg_lsn AS receive_lsn,"
+        f" '{replay_lsn}'::pg_lsn AS replay_lsn, now() - interval '1 hour' AS replay_at"
+    )
+
+    lag = await session.scalar(text(f"SELECT {database_session.REPLICA_LAG} FROM ({standby}) AS replica"))
+
+    assert lag == (pytest.approx(lag_secs) if lag_secs is not None else None)
+
+
+async def test_replica_monitor_falls_back_when_receiver_stopped(monkeypatch: pytest.MonkeyPatch) -> None:
+    monitor = ReplicaMonitor(database_session.get_async_engine(), max_lag_secs=5, check_interval_secs=0)
+    assert await monitor.is_usable()
+
+    monkeypatch.setattr(database_session, "REPLICA_LAG_QUERY", text("SELECT NULL"))
+
+    assert not await monitor.is_usable()
+    assert monitor.lag_secs is None
+
+
+async def test_replica_monitor_mark_unavailable() -> None:
+    monitor = ReplicaMonitor(database_session.get_async_engine(), max_lag_secs=5, check_interval_secs=60)
+    assert await monitor.is_usable()
+
+    monitor.mark_unavailable()
+
+    assert not await monitor.is_usable()
+
+
+async def test_read_endpoints_use_replica(
+    client: AsyncClient, default_user_headers: dict, session: AsyncSession, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # a second connection to the test database stands in for the replica, it
+    # does not see the uncommitted test user, like a replica that lags behind
+    monitor = ReplicaMonitor(database_session.get_async_engine(), max_lag_secs=5, check_interval_secs=60)
+    monkeypatch.setattr(database_session, "_REPLICA_MONITOR", monitor)
+    monkeypatch.setattr(database_session, "_REPLICA_SESSIONMAKER", async_sessionmaker(monitor.engine))
+
+    response = await client.get("/analytics/top-queries", headers=default_user_headers)
+
+    assert response.status_code == 200
+    assert monitor.replica_reads == 1
+
+    response = await client.get("/users/me", headers=default_user_headers)
+
+    assert response.status_code == 200
+    assert monitor.replica_reads == 2
+
+
+async def test_engine_without_prepared_statement_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DATABASE__PREPARED_STATEMENT_CACHE_SIZE", "0")
+    get_settings.cache_clear()
+    engine = new_async_engine(get_settings().sqlalchemy_database_uri)
+
+    async with engine.connect() as conn:
+        for _ in range(2):
+            assert await conn.scalar(text("SELECT 1")) == 1
+    await engine.dispose()
+
+
+async def test_new_async_engine_uses_pool_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DATABASE__POOL_SIZE", "2")
+    monkeypatch.setenv("DATABASE__MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DATABASE__POOL_TIMEOUT_SECS", "0.1")
+    get_settings.cache_clear()
+    engine = new_async_engine(get_settings().sqlalchemy_database_uri, "test")
+
+    assert engine.pool.size() == 2
+    assert engine.pool._timeout == 0.1
+    await engine.dispose()
+
+
+async def test_pool_timeouts_are_exported(client: AsyncClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DATABASE__POOL_SIZE", "1")
+    monkeypatch.setenv("DATABASE__MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DATABASE__POOL_TIMEOUT_SECS", "0.1")
+    get_settings.cache_clear()
+    engine = new_async_engine(get_settings().sqlalchemy_database_uri, "test")
+
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        with pytest.raises(TimeoutError):
+            async with engine.connect():
+                pass
+        response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert 'db_pool_connections_in_use{pool="test"} 1.0' in response.text
+    assert 'db_pool_timeouts_total{pool="test"} 1.0' in response.text
+    assert 'db_pool_checkout_seconds_count{pool="test"}' in response.text
+    await engine.dispose()
+
+
+async def test_prewarm_pool_opens_connections(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DATABASE__POOL_SIZE", "3")
+    get_settings.cache_clear()
+    engine = new_async_engine(get_settings().sqlalchemy_database_uri, "test")
+
+    await prewarm_pool(engine, 5)
+
+    assert engine.pool.checkedin() == 3
+    assert engine.pool.checkedout() == 0
+    await engine.dispose()
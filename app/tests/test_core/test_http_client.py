@@ -0,0 +1,33 @@
+from collections.abc import Generator
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from app.core import http_client
+
+
+@pytest.fixture(autouse=True)
+def fixture_close_http_client() -> Generator[None, None, None]:
+    yield
+    http_client.close_http_client()
+
+
+def test_http_client_is_shared() -> None:
+    assert http_client.get_http_client() is http_client.get_http_client()
+
+
+async def test_prewarm_http_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("UPSTREAM__PREWARM_CONNECTIONS", "3")
+
+    with patch("requests.Session.head") as head:
+        assert await http_client.prewarm_http_client() == 0
+
+    assert head.call_count == 3
+
+
+async def test_prewarm_http_client_failures_are_not_raised(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("UPSTREAM__PREWARM_CONNECTIONS", "2")
+
+    with patch("requests.Session.head", side_effect=requests.ConnectionError("down")):
+        assert await http_client.prewarm_http_client() == 2
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.ingestion import store_result_authors
+from app.models import QueryRecord, QueryResult
+
+
+async def test_authors_are_inserted_in_key_order(session: AsyncSession) -> None:
+    now = datetime.utcnow()
+    record = QueryRecord(query="au:Einstein", timestamp=now, status=200, num_results=1)
+    session.add(record)
+    await session.flush()
+    result = QueryResult(author="Einstein", title="Relativity", journal=None, query_record_id=record.id, timestamp=now)
+    session.add(result)
+    await session.flush()
+    inserted = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany) -> None:  # type: ignore[no-untyped-def]
+        if statement.startswith("INSERT INTO authors"):
+            inserted.extend(parameters)
+
+    conn = await session.connection()
+    event.listen(conn.sync_connection, "before_cursor_execute", capture)
+    try:
+        await store_result_authors(session, [(result.id, ["Niels Bohr", "Albert Einstein", "Max Born"])])
+    finally:
+        event.remove(conn.sync_connection, "before_cursor_execute", capture)
+
+    names = [name for parameters in inserted for name in parameters if name == name.lower()]
+    assert names == ["albert einstein", "max born", "niels bohr"]
@@ -3,7 +3,6 @@ import time
 import pytest
 from fastapi import HTTPException
 from freezegun import freeze_time
-from pydantic import SecretStr
 
 from app.core.config import get_settings
 from app.core.security import jwt
@@ -60,11 +59,14 @@ def test_jwt_error_with_invalid_token() -> None:
     assert e.value.detail == "Token invalid: Not enough segments"
 
 
-def test_jwt_error_with_invalid_issuer() -> None:
+def test_jwt_error_with_invalid_issuer(monkeypatch: pytest.MonkeyPatch) -> None:
     user_id = "test_user_id"
     token = jwt.create_jwt_token(user_id)
+    jwt.verify_jwt_token(token=token.access_token)
 
-    get_settings().security.jwt_issuer = "another_issuer"
+    # the signing context follows reloaded settings
+    monkeypatch.setenv("SECURITY__JWT_ISSUER", "another_issuer")
+    get_settings.cache_clear()
 
     with pytest.raises(HTTPException) as e:
         jwt.verify_jwt_token(token=token.access_token)
@@ -72,13 +74,40 @@ def test_jwt_error_with_invalid_issuer() -> None:
     assert e.value.detail == "Token invalid: Invalid issuer"
 
 
-def test_jwt_error_with_invalid_secret_key() -> None:
+def test_jwt_error_with_invalid_secret_key(monkeypatch: pytest.MonkeyPatch) -> None:
     user_id = "test_user_id"
     token = jwt.create_jwt_token(user_id)
+    jwt.verify_jwt_token(token=token.access_token)
 
-    get_settings().security.jwt_secret_key = SecretStr("the secret has changed now!")
+    monkeypatch.setenv("SECURITY__JWT_SECRET_KEY", "the secret has changed now!")
+    get_settings.cache_clear()
 
     with pytest.raises(HTTPException) as e:
         jwt.verify_jwt_token(token=token.access_token)
 
     assert e.value.detail == "Token invalid: Signature verification failed"
+
+
+def test_verified_token_is_cached_until_exp() -> None:
+    with freeze_time("2024-01-01"):
+        token = jwt.create_jwt_token("test_user_id")
+        payload = jwt.verify_jwt_token(token=token.access_token)
+        assert jwt.verify_jwt_token(token=token.access_token) is payload
+
+    with freeze_time("2024-02-01"):
+        with pytest.raises(HTTPException) as e:
+            jwt.verify_jwt_token(token=token.access_token)
+
+        assert e.value.detail == "Token invalid: Signature has expired"
+    assert token.access_token not in jwt.get_signing_context().verified
+
+
+def test_verified_token_cache_is_bounded(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SECURITY__JWT_VERIFIED_CACHE_SIZE", "2")
+    get_settings.cache_clear()
+
+    tokens = [jwt.create_jwt_token(f"user_{i}").access_token for i in range(3)]
+    for token in tokens:
+        jwt.verify_jwt_token(token=token)
+
+    assert list(jwt.get_signing_context().verified) == tokens[1:]
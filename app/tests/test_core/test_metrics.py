@@ -0,0 +1,112 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.metrics import register_stats
+
+
+def request_count(route: str, method: str, status: str) -> float:
+    labels = {"route": route, "method": method, "status": status}
+    return REGISTRY.get_sample_value("http_request_seconds_count", labels) or 0.0
+
+
+async def test_requests_are_timed_by_route_template(client: AsyncClient, default_user_headers: dict) -> None:
+    before = request_count("/arxiv/queries/{query_id}", "GET", "4xx")
+
+    response = await client.get("/arxiv/queries/123456", headers=default_user_headers)
+
+    assert response.status_code == 404
+    assert request_count("/arxiv/queries/{query_id}", "GET", "4xx") == before + 1
+    assert REGISTRY.get_sample_value("http_requests_in_flight") == 0
+
+
+async def test_unmatched_requests_share_one_series(client: AsyncClient) -> None:
+    before = request_count("unmatched", "OTHER", "4xx")
+
+    for method in ("FOO", "BAR"):
+        response = await client.request(method, "/no/such/path")
+        assert response.status_code == 404
+
+    assert request_count("unmatched", "OTHER", "4xx") == before + 2
+
+
+async def test_metrics_endpoint_exports_registered_stats(client: AsyncClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(metrics.STATS_COLLECTOR, "sources", {})
+    register_stats(
+        "test_jobs",
+        lambda: {"nightly": {"runs": 3, "running": True, "last_error": None}},
+        counters={"runs"},
+        label="job",
+    )
+
+    response = await client.get("/metrics")
+
+    assert 'test_jobs_runs_total{job="nightly"} 3.0' in response.text
+    assert 'test_jobs_running{job="nightly"} 1.0' in response.text
+    assert "test_jobs_last_error" not in response.text
+
+
+# one app.serve worker, recording and copying its collectors like the lifespan does
+WORKER = """
+import os, sys
+from app.core import metrics
+metrics.QUERY_RECORDS_INGESTED.inc(2)
+metrics.ADMISSION_RATE_FACTOR.set(float(sys.argv[1]))
+metrics.register_stats("test_jobs", lambda: {"runs": 3, "queued": 1}, counters={"runs"})
+metrics.COLLECTED_MIRROR.sync()
+if sys.argv[2] == "exited":
+    metrics.mark_worker_dead()
+print(os.getpid())
+"""
+
+
+def run_worker(metrics_dir, rate_factor: float, state: str) -> int:  # type: ignore[no-untyped-def]
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(metrics_dir)}
+    worker = subprocess.run(
+        [sys.executable, "-c", WORKER, str(rate_factor), state], env=env, capture_output=True, text=True, check=True
+    )
+    return int(worker.stdout)
+
+
+async def test_metrics_endpoint_merges_workers(client: AsyncClient, monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    exited = run_worker(tmp_path, 0.5, "exited")
+    running = run_worker(tmp_path, 1.0, "running")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+    response = await client.get("/metrics")
+
+    # counters add up, also those of exited workers
+    assert 'rows_ingested_total{table="query_records"} 4.0' in response.text
+    assert "test_jobs_runs_total 6.0" in response.text
+    # gauges are per running worker
+    assert f'admission_rate_factor{{pid="{running}"}} 1.0' in response.text
+    assert f'test_jobs_queued{{pid="{running}"}} 1.0' in response.text
+    assert f'pid="{exited}"' not in response.text
+
+
+async def test_collected_mirror_runs_until_cancelled(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    monkeypatch.setenv("METRICS__SYNC_INTERVAL_SECS", "0")
+    get_settings.cache_clear()
+    outcomes = [RuntimeError("collector failed"), None, asyncio.CancelledError()]
+
+    def sync() -> None:
+        outcome = outcomes.pop(0)
+        if outcome is not None:
+            raise outcome
+
+    monkeypatch.setattr(metrics.COLLECTED_MIRROR, "sync", sync)
+
+    with pytest.raises(asyncio.CancelledError):
+        await metrics.run_collected_mirror()
+
+    assert outcomes == []
+    assert "Copying collected metrics failed" in caplog.text
@@ -0,0 +1,80 @@
+import asyncio
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session, partitions
+from app.core.config import get_settings
+from app.core.partitions import MaintenanceReport, add_months, list_partitions, maintain_partitions, run_partition_maintenance
+from app.models import QueryRecord, QueryResult, QueryResultAuthor
+
+
+def test_add_months_crosses_years() -> None:
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+
+
+async def test_maintain_partitions_moves_default_rows(session: AsyncSession) -> None:
+    session.add(QueryRecord(query="au:Einstein", timestamp=datetime(2024, 1, 15), status=200, num_results=0))
+    await session.flush()
+
+    conn = await session.connection()
+    report = await maintain_partitions(conn, now=datetime(2024, 1, 20))
+
+    premake = get_settings().partitions.premake_months
+    assert len(report.created) == 2 * (premake + 1)
+    assert "query_records_p2024_01" in await list_partitions(conn, "query_records")
+    assert await conn.scalar(text("SELECT count(*) FROM query_records_p2024_01")) == 1
+    assert await conn.scalar(text("SELECT count(*) FROM query_records_default")) == 0
+
+    report = await maintain_partitions(conn, now=datetime(2024, 1, 20))
+
+    assert report.created == []
+
+
+async def test_maintain_partitions_detaches_old_months(session: AsyncSession, monkeypatch: pytest.MonkeyPatch) -> None:
+    record = QueryRecord(query="au:Einstein", timestamp=datetime(2024, 1, 15), status=200, num_results=1)
+    session.add(record)
+    await session.flush()
+    result = QueryResult(author="Einstein", title="Relativity", journal=None, query_record_id=record.id, timestamp=datetime(2024, 1, 15))
+    session.add(result)
+    await session.flush()
+    await session.execute(text("INSERT INTO authors (id, name, normalized_name) VALUES (-1, 'Einstein', 'einstein')"))
+    session.add(QueryResultAuthor(author_id=-1, query_result_id=result.id, position=0))
+    await session.flush()
+    conn = await session.connection()
+    await maintain_partitions(conn, now=datetime(2024, 1, 20))
+
+    monkeypatch.setenv("PARTITIONS__DETACH_AFTER_MONTHS", "1")
+    get_settings.cache_clear()
+    report = await maintain_partitions(conn, now=datetime(2024, 3, 1))
+
+    assert report.detached == ["query_records_p2024_01", "query_results_p2024_01"]
+    assert await session.scalar(select(func.count()).select_from(QueryRecord).where(QueryRecord.id == record.id)) == 0
+    assert await session.scalar(select(func.count()).select_from(QueryResultAuthor).where(QueryResultAuthor.author_id == -1)) == 0
+    assert await conn.scalar(text("SELECT count(*) FROM query_results_p2024_01")) == 1
+
+
+async def test_run_partition_maintenance_survives_failed_runs(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    monkeypatch.setenv("PARTITIONS__MAINTENANCE_INTERVAL_SECS", "0")
+    get_settings.cache_clear()
+    outcomes = [RuntimeError("lock timeout"), MaintenanceReport(created=["query_records_p2030_01"]), asyncio.CancelledError()]
+
+    async def maintain(conn) -> MaintenanceReport:  # type: ignore[no-untyped-def]
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(partitions, "maintain_partitions", maintain)
+
+    with pytest.raises(asyncio.CancelledError):
+        await run_partition_maintenance(database_session.get_async_engine())
+
+    assert outcomes == []
+    assert "Partition maintenance failed" in caplog.text
+    assert "query_records_p2030_01" in caplog.text
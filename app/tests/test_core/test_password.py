@@ -1,4 +1,19 @@
-from app.core.security.password import get_password_hash, verify_password
+import asyncio
+import threading
+
+import bcrypt
+import pytest
+from fastapi import HTTPException
+
+from app.core.security import password
+from app.core.security.password import (
+    calibrate_password_rounds,
+    get_password_hash,
+    needs_rehash,
+    password_hash_rounds,
+    run_password_hashing,
+    verify_password,
+)
 
 
 def test_hashed_password_is_verified() -> None:
@@ -9,3 +24,80 @@ def test_hashed_password_is_verified() -> None:
 def test_invalid_password_is_not_verified() -> None:
     pwd_hash = get_password_hash("my_password")
     assert not verify_password("my_password_invalid", pwd_hash)
+
+
+async def test_password_hashing_runs_off_the_event_loop() -> None:
+    pwd_hash = await run_password_hashing(get_password_hash, "my_password")
+
+    assert await run_password_hashing(verify_password, "my_password", pwd_hash)
+
+
+async def test_password_hashing_rejects_when_saturated(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SECURITY__PASSWORD_HASH_MAX_PENDING", "1")
+    release = threading.Event()
+
+    def slow_hash(plain_password: str) -> str:
+        release.wait()
+        return get_password_hash(plain_password)
+
+    # a second call while the first one is still pending is refused
+    first = asyncio.create_task(run_password_hashing(slow_hash, "my_password"))
+    await asyncio.sleep(0)
+    try:
+        with pytest.raises(HTTPException) as exc_info:
+            await run_password_hashing(get_password_hash, "my_password")
+    finally:
+        release.set()
+
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers == {"Retry-After": "1"}
+    await first
+
+
+async def test_cancelled_password_hashing_holds_its_slot_until_done(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SECURITY__PASSWORD_HASH_MAX_PENDING", "1")
+    hashing = threading.Event()
+    release = threading.Event()
+
+    def slow_hash(plain_password: str) -> str:
+        hashing.set()
+        release.wait()
+        return plain_password
+
+    request = asyncio.create_task(run_password_hashing(slow_hash, "my_password"))
+    try:
+        await asyncio.to_thread(hashing.wait)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+
+        # the thread still runs bcrypt, so the slot is still taken
+        with pytest.raises(HTTPException):
+            await run_password_hashing(get_password_hash, "my_password")
+    finally:
+        release.set()
+    async with asyncio.timeout(5):
+        while password._PENDING:
+            await asyncio.sleep(0.01)
+    assert await run_password_hashing(verify_password, "my_password", get_password_hash("my_password"))
+
+
+def test_calibration_stays_within_bounds() -> None:
+    assert calibrate_password_rounds(target_ms=0, min_rounds=4, max_rounds=6) == 4
+    assert calibrate_password_rounds(target_ms=10**6, min_rounds=4, max_rounds=6) == 6
+
+
+def test_calibration_only_proposes_a_cost(capsys: pytest.CaptureFixture[str]) -> None:
+    assert password.main(["--target-ms", "1000000", "--min-rounds", "4", "--max-rounds", "5"]) == 5
+
+    assert capsys.readouterr().out == "SECURITY__PASSWORD_BCRYPT_ROUNDS=5\n"
+    # new hashes keep the configured cost
+    assert password_hash_rounds(get_password_hash("my_password")) == 4
+
+
+def test_only_hashes_below_the_cost_need_rehashing(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SECURITY__PASSWORD_BCRYPT_ROUNDS", "5")
+
+    assert needs_rehash(bcrypt.hashpw(b"my_password", bcrypt.gensalt(4)).decode())
+    assert not needs_rehash(bcrypt.hashpw(b"my_password", bcrypt.gensalt(5)).decode())
+    assert not needs_rehash(bcrypt.hashpw(b"my_password", bcrypt.gensalt(6)).decode())
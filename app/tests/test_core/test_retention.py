@@ -0,0 +1,180 @@
+import asyncio
+import gzip
+from collections.abc import AsyncGenerator
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session, retention
+from app.core.config import get_settings
+from app.core.retention import Archive, archive_query_history_batch, run_retention, run_retention_schedule
+from app.models import QueryRecord, QueryResult, QueryResultAuthor
+
+
+async def add_record(session: AsyncSession, timestamp: datetime, num_results: int) -> QueryRecord:
+    record = QueryRecord(query="au:Einstein", timestamp=timestamp, status=200, num_results=num_results)
+    session.add(record)
+    await session.flush()
+    session.add_all([
+        QueryResult(author="Einstein", title=f"Paper {i}", journal=None, query_record_id=record.id, timestamp=timestamp)
+        for i in range(num_results)
+    ])
+    await session.flush()
+    return record
+
+
+def read_archive(archive: Archive, table: str) -> list[dict]:
+    with gzip.open(archive.path(table)) as archived:
+        return [orjson.loads(line) for line in archived]
+
+
+def read_archives(directory, table: str) -> list[dict]:
+    rows = []
+    for path in sorted(directory.glob(f"{table}-*.jsonl.gz")):
+        with gzip.open(path) as archived:
+            rows.extend(orjson.loads(line) for line in archived)
+    return rows
+
+
+async def remaining_record_ids(record_ids: list[int]) -> list[int]:
+    async with database_session.get_async_engine().connect() as conn:
+        return sorted((await conn.execute(select(QueryRecord.id).where(QueryRecord.id.in_(record_ids)))).scalars())
+
+
+@pytest.fixture(autouse=True)
+def retention_settings(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setenv("RETENTION__ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setenv("RETENTION__BATCH_SIZE", "2")
+    monkeypatch.setenv("RETENTION__BATCH_PAUSE_SECS", "0")
+    get_settings.cache_clear()
+
+
+@pytest_asyncio.fixture
+async def old_record_ids() -> AsyncGenerator[list[int], None]:
+    # run_retention commits batch by batch, so on the test database itself rather than the rollback session
+    engine = database_session.get_async_engine()
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        records = [await add_record(session, datetime.utcnow() - timedelta(days=400 + i), 1) for i in range(3)]
+        await session.commit()
+    record_ids = [record.id for record in records]
+    yield record_ids
+    async with engine.begin() as conn:
+        await conn.execute(delete(QueryResult).where(QueryResult.query_record_id.in_(record_ids)))
+        await conn.execute(delete(QueryRecord).where(QueryRecord.id.in_(record_ids)))
+
+
+async def test_archive_query_history_batch(session: AsyncSession, tmp_path) -> None:
+    now = datetime.utcnow()
+    old = await add_record(session, now - timedelta(days=400), 2)
+    new = await add_record(session, now, 1)
+    old_result_id = await session.scalar(select(QueryResult.id).where(QueryResult.query_record_id == old.id).limit(1))
+    await session.execute(text("INSERT INTO authors (id, name, normalized_name) VALUES (-1, 'Einstein', 'einstein')"))
+    session.add(QueryResultAuthor(author_id=-1, query_result_id=old_result_id, position=0))
+    await session.flush()
+    archive = Archive(tmp_path, "test")
+
+    conn = await session.connection()
+    assert await archive_query_history_batch(conn, archive, now - timedelta(days=365), 100) == (1, 2)
+    assert await archive_query_history_batch(conn, archive, now - timedelta(days=365), 100) == (0, 0)
+
+    assert [record["id"] for record in read_archive(archive, "query_records")] == [old.id]
+    assert {result["query_record_id"] for result in read_archive(archive, "query_results")} == {old.id}
+    remaining = (await session.execute(select(QueryRecord.id).where(QueryRecord.id.in_([old.id, new.id])))).scalars().all()
+    assert remaining == [new.id]
+    assert await session.scalar(select(func.count()).select_from(QueryResultAuthor).where(QueryResultAuthor.author_id == -1)) == 0
+
+
+async def test_archive_query_history_in_batches(session: AsyncSession, tmp_path) -> None:
+    old = datetime.utcnow() - timedelta(days=400)
+    for _ in range(3):
+        await add_record(session, old, 1)
+    archive = Archive(tmp_path, "test")
+    conn = await session.connection()
+
+    assert await archive_query_history_batch(conn, archive, old + timedelta(days=1), 2) == (2, 2)
+    assert await archive_query_history_batch(conn, archive, old + timedelta(days=1), 2) == (1, 1)
+
+    assert len(read_archive(archive, "query_records")) == 3
+
+
+async def test_run_retention_archives_in_batches_until_none_left(old_record_ids: list[int], tmp_path) -> None:
+    run = await run_retention(database_session.get_async_engine(), older_than_days=365)
+
+    assert (run.runs, run.batches, run.query_records_archived, run.query_results_archived) == (1, 2, 3, 3)
+    assert not run.running
+    assert await remaining_record_ids(old_record_ids) == []
+    assert sorted(record["id"] for record in read_archives(tmp_path, "query_records")) == sorted(old_record_ids)
+    assert len(read_archives(tmp_path, "query_results")) == 3
+
+
+async def test_run_retention_skips_while_another_run_holds_the_lock(old_record_ids: list[int], tmp_path) -> None:
+    async with database_session.get_async_engine().connect() as other_run:
+        assert await other_run.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": retention._RETENTION_LOCK_KEY})
+        try:
+            run = await run_retention(database_session.get_async_engine(), older_than_days=365)
+        finally:
+            await other_run.scalar(text("SELECT pg_advisory_unlock(:key)"), {"key": retention._RETENTION_LOCK_KEY})
+
+    assert run.runs == 0
+    assert await remaining_record_ids(old_record_ids) == sorted(old_record_ids)
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_run_retention_archives_before_each_batch_commits(
+    old_record_ids: list[int], tmp_path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    write = Archive.write
+    writes = []
+
+    def write_then_fail_second_batch(archive: Archive, table: str, rows) -> None:
+        writes.append(table)
+        if len(writes) > 2:
+            raise OSError("disk full")
+        write(archive, table, rows)
+
+    monkeypatch.setattr(Archive, "write", write_then_fail_second_batch)
+
+    with pytest.raises(OSError):
+        await run_retention(database_session.get_async_engine(), older_than_days=365)
+
+    # the first batch was archived and committed, the failed one rolled back
+    archived = [record["id"] for record in read_archives(tmp_path, "query_records")]
+    assert len(archived) == 2
+    assert await remaining_record_ids(old_record_ids) == sorted(set(old_record_ids) - set(archived))
+    # and the lock was released
+    monkeypatch.setattr(Archive, "write", write)
+    run = await run_retention(database_session.get_async_engine(), older_than_days=365)
+    assert run.runs == 1
+
+
+async def test_run_retention_schedule_survives_failed_runs(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    monkeypatch.setenv("RETENTION__INTERVAL_SECS", "0")
+    get_settings.cache_clear()
+    runs = []
+
+    async def run(engine) -> None:
+        runs.append(engine)
+        if len(runs) == 1:
+            raise RuntimeError("database gone")
+        raise asyncio.CancelledError
+
+    monkeypatch.setattr(retention, "run_retention", run)
+
+    with pytest.raises(asyncio.CancelledError):
+        await run_retention_schedule(database_session.get_async_engine())
+
+    assert len(runs) == 2
+    assert "Retention run failed" in caplog.text
+
+
+async def test_main_prints_the_run(old_record_ids: list[int], capsys: pytest.CaptureFixture) -> None:
+    await retention.main(older_than_days=365)
+
+    printed = orjson.loads(capsys.readouterr().out)
+    assert printed["query_records_archived"] == 3
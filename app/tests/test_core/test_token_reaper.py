@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session, token_reaper
+from app.core.config import get_settings
+from app.core.token_reaper import delete_refresh_tokens_batch, reap_refresh_tokens, run_token_reaper, token_reaper_metrics
+from app.models import RefreshToken, User
+
+
+def add_tokens(session: AsyncSession, user: User, now: int) -> None:
+    session.add_all([
+        RefreshToken(refresh_token="used", used=True, exp=now + 3600, user_id=user.user_id),
+        RefreshToken(refresh_token="expired", used=False, exp=now - 1, user_id=user.user_id),
+        RefreshToken(refresh_token="valid", used=False, exp=now + 3600, user_id=user.user_id),
+    ])
+
+
+async def test_delete_refresh_tokens_batch(session: AsyncSession, default_user: User) -> None:
+    now = int(time.time())
+    add_tokens(session, default_user, now)
+    await session.flush()
+
+    assert await delete_refresh_tokens_batch(await session.connection(), now, 1) == 1
+    assert await delete_refresh_tokens_batch(await session.connection(), now, 10) == 1
+
+    tokens = (await session.execute(select(RefreshToken.refresh_token))).scalars().all()
+    assert tokens == ["valid"]
+
+
+async def test_reap_refresh_tokens_until_none_left() -> None:
+    # committed batch by batch, so on the test database itself rather than the rollback session
+    engine = database_session.get_async_engine()
+    user = User(email="reaper@example.com", hashed_password="-")
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add(user)
+        await session.flush()
+        add_tokens(session, user, int(time.time()))
+        await session.commit()
+    try:
+        assert await reap_refresh_tokens(engine, batch_size=1, batch_pause_secs=0) == 2
+
+        async with engine.connect() as conn:
+            tokens = (await conn.execute(select(RefreshToken.refresh_token))).scalars().all()
+        assert tokens == ["valid"]
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(delete(User).where(User.user_id == user.user_id))
+
+
+async def test_spent_tokens_are_found_through_partial_indexes(session: AsyncSession) -> None:
+    async with database_session.get_async_engine().connect() as conn:
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+        plan = "\n".join(
+            (await conn.exec_driver_sql(
+                "EXPLAIN DELETE FROM refresh_token WHERE id IN ("
+                "SELECT id FROM refresh_token WHERE used OR (NOT used AND exp < 0) LIMIT 10 FOR UPDATE SKIP LOCKED)"
+            )).scalars()
+        )
+
+    assert "ix_refresh_token_used" in plan
+    assert "ix_refresh_token_unused_exp" in plan
+
+
+async def test_run_token_reaper_survives_failed_runs(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    monkeypatch.setenv("TOKEN_REAPER__INTERVAL_SECS", "0")
+    get_settings.cache_clear()
+    outcomes: list = [RuntimeError("database gone"), 3, asyncio.CancelledError()]
+
+    async def reap(engine, batch_size: int, batch_pause_secs: float) -> int:  # type: ignore[no-untyped-def]
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(token_reaper, "reap_refresh_tokens", reap)
+    runs = token_reaper_metrics()["runs"]
+
+    with pytest.raises(asyncio.CancelledError):
+        await run_token_reaper(database_session.get_async_engine())
+
+    assert token_reaper_metrics()["runs"] - runs == 2
+    assert "Refresh token reaper failed" in caplog.text
+    assert "Deleted 3 spent refresh tokens" in caplog.text
@@ -0,0 +1,178 @@
+import asyncio
+from collections.abc import AsyncGenerator
+
+import pytest
+import pytest_asyncio
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core import database_session, user_cache
+from app.core.database_session import ReplicaMonitor
+from app.core.security.jwt import create_jwt_token
+from app.core.user_cache import (
+    LocalChannel,
+    PostgresChannel,
+    RedisChannel,
+    cache_user,
+    get_cached_user,
+    get_user_cache,
+    invalidate_user,
+    listen_for_invalidations,
+    user_cache_generation,
+)
+from app.main import app
+from app.models import User
+
+
+async def wait_for(condition, timeout: float = 5.0) -> None:  # type: ignore[no-untyped-def]
+    async with asyncio.timeout(timeout):
+        while not await condition():
+            await asyncio.sleep(0.01)
+
+
+async def test_authenticated_requests_are_served_from_cache(
+    client: AsyncClient,
+    default_user_headers: dict[str, str],
+    default_user: User,
+    session: AsyncSession,
+) -> None:
+    response = await client.get(app.url_path_for("read_current_user"), headers=default_user_headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    # gone from the database without an invalidation, the cached user still answers
+    await session.execute(delete(User).where(User.user_id == default_user.user_id))
+    response = await client.get(app.url_path_for("read_current_user"), headers=default_user_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["email"] == default_user.email
+    assert get_user_cache().metrics.hits == 1
+
+    await invalidate_user(default_user.user_id)
+    response = await client.get(app.url_path_for("read_current_user"), headers=default_user_headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_reset_password_invalidates_cached_user(
+    client: AsyncClient,
+    default_user_headers: dict[str, str],
+    default_user: User,
+) -> None:
+    await client.get(app.url_path_for("read_current_user"), headers=default_user_headers)
+    assert await get_cached_user(default_user.user_id) is not None
+
+    await client.post(
+        app.url_path_for("reset_current_user_password"),
+        headers=default_user_headers,
+        json={"password": "test_pwd"},
+    )
+
+    assert await get_cached_user(default_user.user_id) is None
+
+
+@pytest.mark.parametrize("invalidated_by", ["this worker", "another worker"])
+async def test_user_read_before_an_invalidation_is_not_cached(default_user: User, invalidated_by: str) -> None:
+    generation = user_cache_generation()
+
+    # the read started before the change committed and ends after the invalidation
+    if invalidated_by == "this worker":
+        await invalidate_user(default_user.user_id)
+    else:
+        await user_cache._drop(default_user.user_id)
+    await cache_user(default_user, generation)
+
+    assert await get_cached_user(default_user.user_id) is None
+
+
+@pytest_asyncio.fixture
+async def committed_user(default_hashed_password: str) -> AsyncGenerator[User, None]:
+    # requested before "session", so it is deleted after the test transaction
+    # rolled back and released its row locks
+    user = User(email="committed@example.com", hashed_password=default_hashed_password)
+    async with async_sessionmaker(database_session.get_async_engine(), expire_on_commit=False)() as other_session:
+        other_session.add(user)
+        await other_session.commit()
+    yield user
+    async with database_session.get_async_engine().begin() as conn:
+        await conn.execute(delete(User).where(User.user_id == user.user_id))
+
+
+async def test_users_are_not_cached_from_a_lagging_replica(
+    committed_user: User, client: AsyncClient, session: AsyncSession, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # the second connection standing in for the replica still sees the user
+    # deleted in the test transaction, like a replica lagging behind
+    await session.execute(delete(User).where(User.user_id == committed_user.user_id))
+    monitor = ReplicaMonitor(database_session.get_async_engine(), max_lag_secs=5, check_interval_secs=60)
+    monkeypatch.setattr(database_session, "_REPLICA_MONITOR", monitor)
+    monkeypatch.setattr(database_session, "_REPLICA_SESSIONMAKER", async_sessionmaker(monitor.engine))
+
+    headers = {"Authorization": f"Bearer {create_jwt_token(committed_user.user_id).access_token}"}
+    response = await client.get(app.url_path_for("read_current_user"), headers=headers)
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert await get_cached_user(committed_user.user_id) is None
+
+
+async def test_disabled_cache_reads_every_time(
+    client: AsyncClient,
+    default_user_headers: dict[str, str],
+    default_user: User,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("USER_CACHE__ENABLED", "false")
+
+    await client.get(app.url_path_for("read_current_user"), headers=default_user_headers)
+
+    assert await get_user_cache().get(default_user.user_id) is None
+
+
+async def listen_until_subscribed(channel: PostgresChannel | RedisChannel) -> asyncio.Task[None]:
+    resets = user_cache.user_cache_metrics()["resets"]
+    task = asyncio.create_task(channel.listen(user_cache._drop))
+
+    async def subscribed() -> bool:
+        return user_cache.user_cache_metrics()["resets"] > resets
+
+    await wait_for(subscribed)
+    return task
+
+
+@pytest.mark.parametrize("invalidation", ["postgres", "redis"])
+async def test_channel_invalidates_other_workers(invalidation: str) -> None:
+    if invalidation == "postgres":
+        listener = publisher = PostgresChannel("test_user_cache", reconnect_interval_secs=0.1)
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        listener = RedisChannel(fakeredis.FakeAsyncRedis(), "app:test_user_cache", reconnect_interval_secs=0.1)
+        publisher = RedisChannel(listener.client, listener.channel, reconnect_interval_secs=0.1)
+    task = await listen_until_subscribed(listener)
+    try:
+        await get_user_cache().set("user-1", b"one@example.com")
+        await get_user_cache().set("user-2", b"two@example.com")
+
+        await publisher.publish("user-1")
+
+        async def dropped() -> bool:
+            return await get_user_cache().get("user-1") is None
+
+        await wait_for(dropped)
+        assert await get_user_cache().get("user-2") == b"two@example.com"
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def test_listen_for_invalidations_drops_users(monkeypatch: pytest.MonkeyPatch) -> None:
+    user = User(user_id="b75365d9-7bf9-4f54-add5-aeab333a087b", email="listener@example.com")
+    await cache_user(user, user_cache_generation())
+
+    class OneMessageChannel(LocalChannel):
+        async def listen(self, on_message) -> None:  # type: ignore[no-untyped-def]
+            await on_message(user.user_id)
+
+    monkeypatch.setattr(user_cache, "get_invalidation_channel", OneMessageChannel)
+
+    await listen_for_invalidations()
+
+    assert await get_cached_user(user.user_id) is None
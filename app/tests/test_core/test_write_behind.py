@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.write_behind import (
+    SearchWriter,
+    get_search_writer,
+    start_search_writer,
+    stop_search_writer,
+    write_behind_metrics,
+)
+from app.models import DailyQueryStats, QueryRecord, QueryResult
+
+
+def new_search(index: int) -> tuple[QueryRecord, list[QueryResult], list[list[str]]]:
+    now = datetime.utcnow()
+    record = QueryRecord(query=f"ti:Paper {index}", timestamp=now, status=200, num_results=1)
+    results = [QueryResult(author="Ada Lovelace", title=f"Paper {index}", journal=None, timestamp=now)]
+    return record, results, [["Ada Lovelace"]]
+
+
+def new_writer(**options: object) -> SearchWriter:
+    defaults: dict = dict(
+        queue_size=100,
+        batch_size=100,
+        flush_interval_secs=0.05,
+        enqueue_timeout_secs=1,
+        wait_for_commit=True,
+        synchronous_commit=True,
+        id_block_size=5,
+    )
+    return SearchWriter(**(defaults | options))
+
+
+async def test_search_writer_batches_concurrent_searches(session: AsyncSession) -> None:
+    # flushed once the batch is full, long before the interval, however slow
+    # the id allocation of the submitters is
+    writer = new_writer(batch_size=12, flush_interval_secs=60)
+    writer.start()
+    before = write_behind_metrics()
+
+    await asyncio.gather(*(writer.submit(*new_search(index)) for index in range(12)))
+    await writer.close()
+
+    after = write_behind_metrics()
+    assert after["written"] - before["written"] == 12
+    assert after["batches"] - before["batches"] == 1
+    assert await session.scalar(select(func.count()).select_from(QueryRecord)) == 12
+    assert await session.scalar(select(func.count()).select_from(QueryResult)) == 12
+    assert await session.scalar(select(func.sum(DailyQueryStats.num_queries))) == 12
+
+
+async def test_search_writer_close_drains_queue(session: AsyncSession) -> None:
+    writer = new_writer(wait_for_commit=False, batch_size=2)
+    writer.start()
+
+    for index in range(5):
+        await writer.submit(*new_search(index))
+    await writer.close()
+
+    assert writer.queue.empty()
+    assert await session.scalar(select(func.count()).select_from(QueryRecord)) == 5
+
+
+async def test_search_writer_assigns_ids_in_order(session: AsyncSession) -> None:
+    writer = new_writer(wait_for_commit=False)
+    record, results, authors = new_search(0)
+    results.append(QueryResult(author="Alan Turing", title="Computable numbers", journal=None, timestamp=record.timestamp))
+
+    await writer.submit(record, results, authors + [["Alan Turing"]])
+
+    assert record.id is not None
+    assert results[0].id < results[1].id
+    assert {result.query_record_id for result in results} == {record.id}
+
+
+async def test_start_and_stop_search_writer(session: AsyncSession, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("WRITE_BEHIND__DURABILITY", "enqueued")
+    get_settings.cache_clear()
+    writer = start_search_writer()
+
+    assert get_search_writer() is writer
+    assert not writer.wait_for_commit
+
+    await writer.submit(*new_search(0))
+    await stop_search_writer()
+
+    assert get_search_writer() is None
+    assert await session.scalar(select(func.count()).select_from(QueryRecord)) == 1
+    await stop_search_writer()
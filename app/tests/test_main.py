@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from app import main
+from app.core import database_session
+from app.core.config import get_settings
+from app.core.write_behind import get_search_writer
+
+BACKGROUND_JOBS = (
+    "run_load_sampler",
+    "listen_for_invalidations",
+    "run_partition_maintenance",
+    "run_token_reaper",
+    "run_retention_schedule",
+)
+
+
+async def test_lifespan_starts_and_stops_background_jobs(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("UPSTREAM__PREWARM_CONNECTIONS", "0")
+    monkeypatch.setenv("WRITE_BEHIND__ENABLED", "true")
+    monkeypatch.setenv("RETENTION__ENABLED", "true")
+    get_settings.cache_clear()
+    # disposed at shutdown, put back for the tests after this one
+    for name in ("_ASYNC_ENGINE", "_ASYNC_SESSIONMAKER"):
+        monkeypatch.setattr(database_session, name, getattr(database_session, name))
+    started, cancelled = [], []
+
+    def job(name: str):  # type: ignore[no-untyped-def]
+        async def run(*args: object) -> None:
+            started.append(name)
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(name)
+                raise
+
+        return run
+
+    for name in BACKGROUND_JOBS:
+        monkeypatch.setattr(main, name, job(name))
+
+    async with main.lifespan(main.app):
+        while len(started) < len(BACKGROUND_JOBS):
+            await asyncio.sleep(0)
+
+        assert sorted(started) == sorted(BACKGROUND_JOBS)
+        assert get_search_writer() is not None
+
+    assert sorted(cancelled) == sorted(BACKGROUND_JOBS)
+    assert get_search_writer() is None
+    assert database_session._ASYNC_ENGINE is None
@@ -0,0 +1,74 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import migrate
+
+
+def write_revision(directory: Path, revision: str, down_revision: str | tuple[str, ...] | None) -> None:
+    (directory / f"{revision}.py").write_text(
+        f'"""{revision}"""\n\nrevision = {revision!r}\ndown_revision = {down_revision!r}\n'
+    )
+
+
+def test_script_heads(tmp_path: Path) -> None:
+    write_revision(tmp_path, "a", None)
+    write_revision(tmp_path, "b", "a")
+    write_revision(tmp_path, "c", "a")
+
+    assert migrate.script_heads(tmp_path) == {"b", "c"}
+
+    write_revision(tmp_path, "d", ("b", "c"))
+
+    assert migrate.script_heads(tmp_path) == {"d"}
+
+
+def test_script_heads_of_project() -> None:
+    assert len(migrate.script_heads()) == 1
+
+
+def test_released_revisions_upgrade_to_head() -> None:
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    config = Config(str(migrate.PROJECT_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(migrate.PROJECT_DIR / "alembic"))
+    chain = {script.revision for script in ScriptDirectory.from_config(config).walk_revisions("base", "heads")}
+
+    # deployed databases may be at any of them, e.g. the last release's head
+    assert "63b567c97add" in chain
+    assert "c79b0938ea4b" in chain
+    # fresh databases start from the baseline and continue on the chain from its revision
+    (baseline,) = migrate.script_heads(migrate.BASELINE_DIR)
+    assert baseline in chain
+
+
+async def test_database_revisions(session: AsyncSession) -> None:
+    # the test database is created from the models, it was never migrated
+    assert await migrate.database_revisions(await session.connection()) == set()
+
+    await session.execute(text("CREATE TABLE alembic_version (version_num varchar(32) PRIMARY KEY)"))
+    await session.execute(text("INSERT INTO alembic_version VALUES ('9e4b1f6c2d87')"))
+
+    assert await migrate.database_revisions(await session.connection()) == {"9e4b1f6c2d87"}
+
+
+@pytest.mark.parametrize("revisions, upgrades", [({"head"}, 0), ({"older"}, 1), (set(), 2)])
+def test_migrate_skips_upgrade_at_head(
+    monkeypatch: pytest.MonkeyPatch, revisions: set[str], upgrades: int
+) -> None:
+    monkeypatch.setattr(migrate, "script_heads", lambda *args: {"head"})
+
+    async def read_database_revisions() -> set[str]:
+        return revisions
+
+    monkeypatch.setattr(migrate, "read_database_revisions", read_database_revisions)
+
+    with patch("alembic.command.upgrade") as upgrade:
+        assert migrate.migrate() is bool(upgrades)
+
+    # a fresh database is upgraded to the baseline first, then to head
+    assert upgrade.call_count == upgrades
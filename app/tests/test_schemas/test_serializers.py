@@ -0,0 +1,51 @@
+import json
+from datetime import datetime
+
+from app.models import QueryRecord, QueryResult
+from app.schemas.responses import QueryRecordResponse, QueryResultResponse
+from app.schemas.serializers import (
+    dump_query_record,
+    dump_query_records,
+    dump_query_results,
+)
+
+
+def make_record() -> tuple[QueryRecord, list[QueryResult]]:
+    timestamp = datetime(2024, 1, 2, 3, 4, 5, 678)
+    record = QueryRecord(
+        id=1, query="au:Einstein", timestamp=timestamp, status=200, num_results=2
+    )
+    results = [
+        QueryResult(id=1, author="Albert Einstein", title="Relativity", journal=None),
+        QueryResult(id=2, author="Nathan Rosen", title="EPR", journal="Phys. Rev."),
+    ]
+    record.results = results
+    return record, results
+
+
+def test_query_results_match_response_schema() -> None:
+    _, results = make_record()
+
+    expected = [
+        QueryResultResponse.model_validate(result, from_attributes=True).model_dump(
+            mode="json"
+        )
+        for result in results
+    ]
+    assert json.loads(dump_query_results(results)) == expected
+
+
+def test_query_record_matches_response_schema() -> None:
+    record, results = make_record()
+
+    expected = QueryRecordResponse.model_validate(
+        record, from_attributes=True
+    ).model_dump(mode="json")
+    assert json.loads(dump_query_record(record, results)) == expected
+
+
+def test_query_records_keep_isoformat_timestamps() -> None:
+    record, _ = make_record()
+
+    (row,) = json.loads(dump_query_records([record]))
+    assert row["timestamp"] == record.timestamp.isoformat()
@@ -0,0 +1,68 @@
+import os
+from collections.abc import Iterator
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from app import serve
+from app.core.config import get_settings
+
+
+@pytest.fixture(autouse=True)
+def metrics_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+    monkeypatch.setenv("METRICS__MULTIPROC_DIR", str(tmp_path / "metrics"))
+    get_settings.cache_clear()
+    yield tmp_path / "metrics"
+    # set by serve.main for its workers, not for the tests after these
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+
+def test_available_cpus_respects_cgroup_quota(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cpu_max = tmp_path / "cpu.max"
+    cpu_max.write_text("150000 100000\n")
+    monkeypatch.setattr(serve, "CGROUP_CPU_MAX", cpu_max)
+    monkeypatch.setattr(serve.os, "sched_getaffinity", lambda pid: set(range(8)))
+
+    assert serve.available_cpus() == 2
+
+    cpu_max.write_text("max 100000\n")
+
+    assert serve.available_cpus() == 8
+
+
+def test_main_defaults_to_one_worker_per_cpu(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(serve, "available_cpus", lambda: 4)
+
+    with patch("uvicorn.run") as run:
+        serve.main([])
+
+    run.assert_called_once_with(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=4,
+        timeout_graceful_shutdown=30,
+        forwarded_allow_ips=None,
+    )
+
+
+def test_main_worker_count_from_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("SERVER__WORKERS", "3")
+
+    with patch("uvicorn.run") as run:
+        serve.main(["--port", "9000"])
+
+    assert run.call_args.kwargs["workers"] == 3
+    assert run.call_args.kwargs["port"] == 9000
+
+
+def test_main_empties_the_metrics_dir_for_the_workers(metrics_dir: Path) -> None:
+    metrics_dir.mkdir()
+    (metrics_dir / "counter_1234.db").write_bytes(b"stale")
+
+    with patch("uvicorn.run"):
+        serve.main([])
+
+    assert list(metrics_dir.iterdir()) == []
+    assert os.environ["PROMETHEUS_MULTIPROC_DIR"] == str(metrics_dir)
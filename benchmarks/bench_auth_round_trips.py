@@ -0,0 +1,177 @@
+# Database statements and latency per auth call, before vs after.
+#
+# "before" repeats the ORM flows the auth endpoints used to run: registration
+# selected the email and then inserted the user, a refresh selected the token
+# FOR UPDATE, then flushed an UPDATE and an INSERT. "after" executes the
+# statements `app.api.endpoints.auth` runs now. Login is the same in both, a
+# SELECT and an INSERT, listed for reference. bcrypt is left out, passwords
+# are hashed once up front. Round trips count statements plus BEGIN and COMMIT.
+#
+# Needs the database from settings, a scratch "bench_auth_round_trips" database
+# is created next to it. Run from the project root:
+#
+#   python -m benchmarks.bench_auth_round_trips
+
+import asyncio
+import math
+import os
+import secrets
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import sqlalchemy
+from sqlalchemy import event
+
+from app.api.endpoints.auth import _INSERT_USER, _ROTATE_REFRESH_TOKEN, _USER_BY_EMAIL
+from app.core import database_session
+from app.core.config import get_settings
+from app.core.security.password import get_password_hash
+from app.models import Base, RefreshToken, User
+
+BENCH_DB = "bench_auth_round_trips"
+CALLS = 2_000
+TOKEN_EXPIRE_SECS = 3600
+
+_REFRESH_TOKEN_FOR_UPDATE = (
+    sqlalchemy.select(RefreshToken)
+    .where(RefreshToken.refresh_token == sqlalchemy.bindparam("refresh_token"), ~RefreshToken.used)
+    .with_for_update(skip_locked=True)
+)
+
+
+class RoundTrips:
+    """Statements and transactions run through the app engine."""
+
+    def __init__(self) -> None:
+        self.statements = 0
+        self.transactions = 0
+        engine = database_session.get_async_engine().sync_engine
+        event.listen(engine, "before_cursor_execute", self.on_statement)
+        event.listen(engine, "begin", self.on_begin)
+
+    def on_statement(self, *args: Any) -> None:
+        self.statements += 1
+
+    def on_begin(self, *args: Any) -> None:
+        self.transactions += 1
+
+    def reset(self) -> None:
+        self.statements = self.transactions = 0
+
+
+async def setup_database() -> None:
+    admin_engine = database_session.new_async_engine(get_settings().sqlalchemy_database_uri)
+    async with admin_engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(sqlalchemy.text(f"DROP DATABASE IF EXISTS {BENCH_DB}"))
+        await conn.execute(sqlalchemy.text(f"CREATE DATABASE {BENCH_DB}"))
+    await admin_engine.dispose()
+
+    # engines are created on first use, the app's now points at the scratch database
+    os.environ["DATABASE__DB"] = BENCH_DB
+    get_settings.cache_clear()
+    await database_session.dispose_engines()
+    async with database_session.get_async_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def register_before(index: int, hashed_password: str) -> None:
+    async with database_session.get_async_session() as session:
+        email = f"before-{index}@example.com"
+        if await session.scalar(_USER_BY_EMAIL, {"email": email}) is None:
+            session.add(User(email=email, hashed_password=hashed_password))
+            await session.commit()
+
+
+async def register_after(index: int, hashed_password: str) -> None:
+    async with database_session.get_async_session() as session:
+        params = {"email": f"after-{index}@example.com", "hashed_password": hashed_password}
+        if (await session.execute(_INSERT_USER, params)).first() is not None:
+            await session.commit()
+
+
+def new_refresh_token(user_id: str) -> RefreshToken:
+    return RefreshToken(
+        user_id=user_id, refresh_token=secrets.token_urlsafe(32), exp=int(time.time()) + TOKEN_EXPIRE_SECS
+    )
+
+
+async def refresh_before(token: str) -> str:
+    async with database_session.get_async_session() as session:
+        stored = await session.scalar(_REFRESH_TOKEN_FOR_UPDATE, {"refresh_token": token})
+        assert stored is not None and time.time() <= stored.exp
+        stored.used = True
+        successor = new_refresh_token(stored.user_id)
+        session.add(successor)
+        await session.commit()
+        return successor.refresh_token
+
+
+async def refresh_after(token: str) -> str:
+    async with database_session.get_async_session() as session:
+        successor = secrets.token_urlsafe(32)
+        params = {
+            "token": token,
+            "now": math.ceil(time.time()),
+            "new_token": successor,
+            "new_exp": int(time.time()) + TOKEN_EXPIRE_SECS,
+        }
+        assert await session.scalar(_ROTATE_REFRESH_TOKEN, params) is not None
+        await session.commit()
+        return successor
+
+
+async def login(email: str) -> None:
+    async with database_session.get_async_session() as session:
+        user = await session.scalar(_USER_BY_EMAIL, {"email": email})
+        session.add(new_refresh_token(user.user_id))
+        await session.commit()
+
+
+async def measure(name: str, round_trips: RoundTrips, call: Callable[[int], Awaitable[None]]) -> None:
+    await call(-1)  # warm up compiled and prepared statement caches
+    round_trips.reset()
+    latencies = []
+    for index in range(CALLS):
+        start = time.perf_counter()
+        await call(index)
+        latencies.append(time.perf_counter() - start)
+    statements = round_trips.statements / CALLS
+    # BEGIN and COMMIT
+    trips = statements + 2 * round_trips.transactions / CALLS
+    print(
+        f"{name:>18} {statements:>10.1f} {trips:>11.1f}"
+        f" {statistics.mean(latencies) * 1e3:>9.2f} {statistics.median(latencies) * 1e3:>9.2f}"
+    )
+
+
+async def main() -> None:
+    await setup_database()
+    hashed_password = get_password_hash("password")
+    async with database_session.get_async_session() as session:
+        user = User(email="bench@example.com", hashed_password=hashed_password)
+        session.add(user)
+        await session.commit()
+        tokens = [new_refresh_token(user.user_id), new_refresh_token(user.user_id)]
+        session.add_all(tokens)
+        await session.commit()
+    chains = {"before": tokens[0].refresh_token, "after": tokens[1].refresh_token}
+
+    async def refresh(flow: Callable[[str], Awaitable[str]], chain: str) -> None:
+        chains[chain] = await flow(chains[chain])
+
+    round_trips = RoundTrips()
+    print(f"per auth call, {CALLS:,} sequential calls, bcrypt excluded")
+    print(f"{'flow':>18} {'statements':>10} {'round trips':>11} {'mean ms':>9} {'p50 ms':>9}")
+    await measure("register, before", round_trips, lambda i: register_before(i, hashed_password))
+    await measure("register, after", round_trips, lambda i: register_after(i, hashed_password))
+    await measure("refresh, before", round_trips, lambda i: refresh(refresh_before, "before"))
+    await measure("refresh, after", round_trips, lambda i: refresh(refresh_after, "after"))
+    await measure("login", round_trips, lambda i: login("bench@example.com"))
+    await database_session.dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+# Access token cost per request, before vs after the signing context.
+#
+# "before" mirrors the old `verify_jwt_token` and `create_jwt_token`: settings
+# looked up per field, a full `jwt.decode` (base64, JSON, HMAC, claims) and a
+# validated pydantic payload every time. "after, first use" is a token the
+# process has not seen yet, "after, cached" every later request with it.
+#
+# Run from the project root, no database needed (settings must load, e.g.
+# SECURITY__JWT_SECRET_KEY and DATABASE__PASSWORD set):
+#
+#   python -m benchmarks.bench_jwt
+
+import time
+import timeit
+
+import jwt
+
+from app.core.config import get_settings
+from app.core.security.jwt import JWT_ALGORITHM, JWTToken, JWTTokenPayload, create_jwt_token, verify_jwt_token
+
+NUMBER = 20_000
+REPEAT = 5
+
+
+def verify_before(token: str) -> JWTTokenPayload:
+    raw_payload = jwt.decode(
+        token,
+        get_settings().security.jwt_secret_key.get_secret_value(),
+        algorithms=[JWT_ALGORITHM],
+        options={"verify_signature": True},
+        issuer=get_settings().security.jwt_issuer,
+    )
+    return JWTTokenPayload(**raw_payload)
+
+
+def create_before(user_id: str) -> JWTToken:
+    iat = int(time.time())
+    token_payload = JWTTokenPayload(
+        iss=get_settings().security.jwt_issuer,
+        sub=user_id,
+        exp=iat + get_settings().security.jwt_access_token_expire_secs,
+        iat=iat,
+    )
+    access_token = jwt.encode(
+        token_payload.model_dump(),
+        key=get_settings().security.jwt_secret_key.get_secret_value(),
+        algorithm=JWT_ALGORITHM,
+    )
+    return JWTToken(payload=token_payload, access_token=access_token)
+
+
+def time_per_call(stmt: object) -> float:
+    return min(timeit.repeat(stmt, number=NUMBER, repeat=REPEAT)) / NUMBER  # type: ignore[arg-type]
+
+
+def report(name: str, seconds: float, baseline: float) -> None:
+    print(f"{name:<26} {seconds * 1e6:>8.2f} us   x{baseline / seconds:6.1f}")
+
+
+def main() -> None:
+    token = create_jwt_token("b75365d9-7bf9-4f54-add5-aeab333a087b").access_token
+    # distinct tokens so that none of them is in the cache yet
+    fresh_tokens = iter([create_jwt_token(f"user-{i}").access_token for i in range(NUMBER * REPEAT)])
+
+    print(f"per call, best of {REPEAT} x {NUMBER:,}")
+    verify = time_per_call(lambda: verify_before(token))
+    report("verify, before", verify, verify)
+    report("verify, after, first use", time_per_call(lambda: verify_jwt_token(next(fresh_tokens))), verify)
+    report("verify, after, cached", time_per_call(lambda: verify_jwt_token(token)), verify)
+    create = time_per_call(lambda: create_before("user"))
+    report("create, before", create, create)
+    report("create, after", time_per_call(lambda: create_jwt_token("user")), create)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# GET /arxiv/results read path: ORM entities vs Core column select.
+#
+# "orm" loads full QueryResult instances (identity map, instrumentation) and
+# serializes four attributes, "core" is the column select used by the endpoint,
+# turning row tuples straight into JSON. Both run in a fresh session per
+# request, like the endpoint. CPU is process time of this (client) process.
+#
+# Needs the database from settings, a scratch "bench_read_path" database is
+# created next to it. Run from the project root:
+#
+#   python -m benchmarks.bench_read_path
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta
+
+import sqlalchemy
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core import database_session
+from app.core.config import get_settings
+from app.models import Base, QueryRecord, QueryResult
+from app.schemas.serializers import (
+    QUERY_RESULT_FIELDS,
+    dump_query_result_rows,
+    dump_query_results,
+)
+
+BENCH_DB = "bench_read_path"
+TOTAL_ROWS = 50_000
+PAGE_SIZES = (10, 100, 1_000)
+REQUESTS = 200
+
+_query_results = QueryResult.__table__
+_QUERY_RESULT_COLUMNS = [_query_results.c[field] for field in QUERY_RESULT_FIELDS]
+
+
+async def orm_page(session: AsyncSession, offset: int, limit: int) -> bytes:
+    result = await session.execute(
+        select(QueryResult).order_by(QueryResult.timestamp).offset(offset).limit(limit)
+    )
+    return dump_query_results(result.scalars().all())
+
+
+async def core_page(session: AsyncSession, offset: int, limit: int) -> bytes:
+    result = await session.execute(
+        select(*_QUERY_RESULT_COLUMNS)
+        .order_by(_query_results.c.timestamp)
+        .offset(offset)
+        .limit(limit)
+    )
+    return dump_query_result_rows(result.all())
+
+
+async def setup_database() -> async_sessionmaker[AsyncSession]:
+    admin_engine = database_session.new_async_engine(
+        get_settings().sqlalchemy_database_uri
+    )
+    async with admin_engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(sqlalchemy.text(f"DROP DATABASE IF EXISTS {BENCH_DB}"))
+        await conn.execute(sqlalchemy.text(f"CREATE DATABASE {BENCH_DB}"))
+    await admin_engine.dispose()
+
+    engine = database_session.new_async_engine(
+        get_settings().sqlalchemy_database_uri.set(database=BENCH_DB)
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        record_id = (
+            await conn.execute(
+                insert(QueryRecord)
+                .values(
+                    query="au:Einstein",
+                    timestamp=datetime(2024, 1, 1),
+                    status=200,
+                    num_results=TOTAL_ROWS,
+                )
+                .returning(QueryRecord.id)
+            )
+        ).scalar_one()
+        start = datetime(2024, 1, 1)
+        await conn.execute(
+            insert(QueryResult),
+            [
+                {
+                    "author": "Albert Einstein, Nathan Rosen",
+                    "title": f"Paper {i}",
+                    "journal": "Phys. Rev. 47, 777" if i % 2 else None,
+                    "query_record_id": record_id,
+                    "timestamp": start + timedelta(seconds=i),
+                }
+                for i in range(TOTAL_ROWS)
+            ],
+        )
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+async def measure(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    read_page: Callable[[AsyncSession, int, int], Awaitable[bytes]],
+    limit: int,
+) -> tuple[float, float]:
+    # warm up pool, statement caches and prepared statements
+    for _ in range(10):
+        async with sessionmaker() as session:
+            await read_page(session, 0, limit)
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for i in range(REQUESTS):
+        async with sessionmaker() as session:
+            await read_page(session, (i * limit) % (TOTAL_ROWS - limit), limit)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    return REQUESTS * limit / wall, cpu / REQUESTS
+
+
+async def main() -> None:
+    sessionmaker = await setup_database()
+    print(f"{REQUESTS} requests per page size, {TOTAL_ROWS:,} rows in table")
+    print(f"{'page size':>10} {'path':>6} {'rows/s':>12} {'CPU/request':>14}")
+    for limit in PAGE_SIZES:
+        for name, read_page in (("orm", orm_page), ("core", core_page)):
+            rows_per_sec, cpu_per_request = await measure(sessionmaker, read_page, limit)
+            print(
+                f"{limit:>10} {name:>6} {rows_per_sec:>12,.0f}"
+                f" {cpu_per_request * 1e3:>11.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+# Cost of `RequestMetricsMiddleware` per request.
+#
+# "bare" calls a trivial ASGI app directly, "instrumented" through the
+# middleware, "labels() per request" through a variant resolving its histogram
+# child with `labels()` each time, as instrumentation usually does. The route
+# is matched by hand, no router runs.
+#
+# Run from the project root, no database needed (settings must load, e.g.
+# SECURITY__JWT_SECRET_KEY and DATABASE__PASSWORD set):
+#
+#   python -m benchmarks.bench_request_metrics
+
+import asyncio
+import time
+
+from fastapi.routing import APIRoute
+from starlette.types import Receive, Scope, Send
+
+from app.core.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_FLIGHT, RequestMetricsMiddleware
+
+NUMBER = 100_000
+REPEAT = 5
+
+ROUTE = APIRoute("/arxiv/queries/{query_id}", lambda query_id: None, methods=["GET"])
+START = {"type": "http.response.start", "status": 200, "headers": []}
+BODY = {"type": "http.response.body", "body": b"{}"}
+
+
+async def endpoint(scope: Scope, receive: Receive, send: Send) -> None:
+    scope["route"] = ROUTE
+    await send(START)
+    await send(BODY)
+
+
+async def labels_per_request(scope: Scope, receive: Receive, send: Send) -> None:
+    status_code = 500
+    started = time.perf_counter()
+
+    async def send_with_status(message: dict) -> None:
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+        await send(message)
+
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+    try:
+        await endpoint(scope, receive, send_with_status)
+    finally:
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+        route = scope["route"].path_format
+        HTTP_REQUEST_SECONDS.labels(route, scope["method"], f"{status_code // 100}xx").observe(
+            time.perf_counter() - started
+        )
+
+
+async def receive() -> dict:
+    return {"type": "http.request"}
+
+
+async def send(message: dict) -> None:
+    pass
+
+
+async def time_per_call(app) -> float:  # type: ignore[no-untyped-def]
+    scope = {"type": "http", "method": "GET", "path": "/arxiv/queries/1"}
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        for _ in range(NUMBER):
+            await app(scope, receive, send)
+        best = min(best, (time.perf_counter() - started) / NUMBER)
+    return best
+
+
+async def main() -> None:
+    print(f"per request, best of {REPEAT} x {NUMBER:,}")
+    bare = await time_per_call(endpoint)
+    for name, app in (
+        ("bare", endpoint),
+        ("instrumented", RequestMetricsMiddleware(endpoint, routes=[ROUTE])),
+        ("labels() per request", labels_per_request),
+    ):
+        seconds = await time_per_call(app)
+        print(f"{name:<22} {seconds * 1e6:>7.2f} us   +{(seconds - bare) * 1e6:5.2f} us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
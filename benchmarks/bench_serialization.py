@@ -0,0 +1,114 @@
+# Serialization cost per 1,000 rows, default FastAPI path vs precompiled orjson.
+#
+# "before" mirrors what FastAPI does for a `response_model` endpoint returning
+# ORM objects: validate them into the response schema, `jsonable_encoder`, then
+# `json.dumps` in JSONResponse. "after" is `app.schemas.serializers`.
+#
+# Run from the project root, no database needed:
+#
+#   python -m benchmarks.bench_serialization
+
+import json
+import timeit
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.models import QueryRecord, QueryResult
+from app.schemas.responses import QueryRecordResponse, QueryResultResponse
+from app.schemas.serializers import (
+    dump_query_record,
+    dump_query_records,
+    dump_query_results,
+)
+
+ROWS = 1_000
+REPEAT = 20
+
+
+def make_rows() -> tuple[list[QueryRecord], list[QueryResult]]:
+    start = datetime(2024, 1, 1)
+    records = [
+        QueryRecord(
+            id=i,
+            query=f"au:Author {i}",
+            timestamp=start + timedelta(seconds=i),
+            status=200,
+            num_results=8,
+        )
+        for i in range(ROWS)
+    ]
+    results = [
+        QueryResult(
+            id=i,
+            author="Albert Einstein, Nathan Rosen",
+            title=f"Paper {i}",
+            journal="Phys. Rev. 47, 777" if i % 2 else None,
+        )
+        for i in range(ROWS)
+    ]
+    return records, results
+
+
+def fastapi_default(adapter: TypeAdapter, rows: object) -> bytes:  # type: ignore[type-arg]
+    validated = adapter.validate_python(rows, from_attributes=True)
+    content = jsonable_encoder(adapter.dump_python(validated, mode="json"))
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def report(name: str, before: float, after: float) -> None:
+    print(
+        f"{name:<36} before {before * 1e3:8.2f} ms   after {after * 1e3:8.2f} ms"
+        f"   x{before / after:5.1f}"
+    )
+
+
+def best(stmt: object) -> float:
+    return min(timeit.repeat(stmt, number=1, repeat=REPEAT))  # type: ignore[arg-type]
+
+
+def main() -> None:
+    records, results = make_rows()
+    record = records[0]
+    record.results = results
+
+    results_adapter = TypeAdapter(list[QueryResultResponse])
+    record_adapter = TypeAdapter(QueryRecordResponse)
+
+    # GET /arxiv/queries used to build dicts with .isoformat() per row
+    def queries_before() -> bytes:
+        data = [
+            {
+                "id": r.id,
+                "query": r.query,
+                "timestamp": r.timestamp.isoformat(),
+                "status": r.status,
+                "num_results": r.num_results,
+            }
+            for r in records
+        ]
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+    print(f"serialization time per {ROWS:,} rows, best of {REPEAT}")
+    report(
+        "GET /arxiv/results",
+        best(lambda: fastapi_default(results_adapter, results)),
+        best(lambda: dump_query_results(results)),
+    )
+    report(
+        "GET /arxiv/queries",
+        best(queries_before),
+        best(lambda: dump_query_records(records)),
+    )
+    report(
+        f"POST /arxiv/search ({ROWS:,} results)",
+        best(lambda: fastapi_default(record_adapter, record)),
+        best(lambda: dump_query_record(record, results)),
+    )
+
+
+if __name__ == "__main__":
+    main()
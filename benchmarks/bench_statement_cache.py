@@ -0,0 +1,134 @@
+# Per-request SQL statement overhead: rebuilt vs module-level statements.
+#
+# "rebuilt" constructs the select on every request like the endpoints used to,
+# SQLAlchemy then has to derive its cache key before finding the compiled SQL.
+# "prebuilt" executes a module-level statement with bind parameters, whose
+# cache key is memoized on the object. "compile" is the cost of a compiled
+# cache miss, for reference. The database part repeats the get_current_user
+# lookup in a fresh session per request, with the asyncpg prepared statement
+# cache on and off. CPU is process time of this (client) process.
+#
+# Needs the database from settings, a scratch "bench_statement_cache" database
+# is created next to it. Run from the project root:
+#
+#   python -m benchmarks.bench_statement_cache
+
+import asyncio
+import time
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+import sqlalchemy
+from sqlalchemy import bindparam, insert, select
+from sqlalchemy.dialects.postgresql import asyncpg
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from app.core import database_session
+from app.core.config import get_settings
+from app.models import Base, QueryResult, User
+
+BENCH_DB = "bench_statement_cache"
+ITERATIONS = 20_000
+REQUESTS = 2_000
+
+_query_results = QueryResult.__table__
+_RESULTS_PAGE = (
+    select(_query_results.c.id, _query_results.c.author, _query_results.c.title, _query_results.c.journal)
+    .order_by(_query_results.c.timestamp)
+    .offset(bindparam("offset"))
+    .limit(bindparam("limit"))
+)
+_USER_BY_ID = select(User).where(User.user_id == bindparam("user_id"))
+
+
+def rebuilt_results_page() -> Any:
+    statement = (
+        select(_query_results.c.id, _query_results.c.author, _query_results.c.title, _query_results.c.journal)
+        .order_by(_query_results.c.timestamp)
+        .offset(20)
+        .limit(11)
+    )
+    return statement._generate_cache_key()
+
+
+def prebuilt_results_page() -> Any:
+    return _RESULTS_PAGE._generate_cache_key()
+
+
+def compile_results_page() -> Any:
+    return _RESULTS_PAGE.compile(dialect=asyncpg.dialect())
+
+
+def time_per_call(function: Callable[[], Any]) -> float:
+    start = time.process_time()
+    for _ in range(ITERATIONS):
+        function()
+    return (time.process_time() - start) / ITERATIONS
+
+
+async def setup_database() -> str:
+    admin_engine = database_session.new_async_engine(get_settings().sqlalchemy_database_uri)
+    async with admin_engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(sqlalchemy.text(f"DROP DATABASE IF EXISTS {BENCH_DB}"))
+        await conn.execute(sqlalchemy.text(f"CREATE DATABASE {BENCH_DB}"))
+    await admin_engine.dispose()
+
+    user_id = str(uuid.uuid4())
+    engine = database_session.new_async_engine(get_settings().sqlalchemy_database_uri.set(database=BENCH_DB))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User).values(user_id=user_id, email="bench@example.com", hashed_password="x"))
+    await engine.dispose()
+    return user_id
+
+
+async def measure_lookups(engine: AsyncEngine, user_id: str, prebuilt: bool) -> tuple[float, float]:
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def lookup() -> None:
+        async with sessionmaker() as session:
+            if prebuilt:
+                await session.scalar(_USER_BY_ID, {"user_id": user_id})
+            else:
+                await session.scalar(select(User).where(User.user_id == user_id))
+
+    for _ in range(50):
+        await lookup()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(REQUESTS):
+        await lookup()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    return REQUESTS / wall, cpu / REQUESTS
+
+
+async def main() -> None:
+    print(f"statement preparation, {ITERATIONS:,} iterations")
+    for name, function in (
+        ("rebuilt", rebuilt_results_page),
+        ("prebuilt", prebuilt_results_page),
+        ("compile", compile_results_page),
+    ):
+        print(f"{name:>10} {time_per_call(function) * 1e6:>9.2f} us/request")
+
+    user_id = await setup_database()
+    print(f"\nget_current_user lookup, {REQUESTS:,} requests")
+    print(f"{'prepared cache':>15} {'statement':>10} {'requests/s':>12} {'CPU/request':>14}")
+    for cache_size in (100, 0):
+        engine = database_session.new_async_engine(
+            get_settings().sqlalchemy_database_uri.set(database=BENCH_DB),
+            connect_args={"prepared_statement_cache_size": cache_size},
+        )
+        for prebuilt in (False, True):
+            requests_per_sec, cpu_per_request = await measure_lookups(engine, user_id, prebuilt)
+            print(
+                f"{cache_size:>15} {'prebuilt' if prebuilt else 'rebuilt':>10}"
+                f" {requests_per_sec:>12,.0f} {cpu_per_request * 1e6:>11.1f} us"
+            )
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,131 @@
+# Search persistence: one transaction per search vs the write-behind queue.
+#
+# CONCURRENCY clients store SEARCHES searches of RESULTS results each, like
+# `POST /arxiv/search` does after the upstream call. "per search" commits every
+# search in its own transaction (the default path), "committed" and "enqueued"
+# go through `SearchWriter` in those durability modes, "enqueued, async commit"
+# additionally sets synchronous_commit off. Commits are counted from
+# pg_stat_database.
+#
+# Needs the database from settings, a scratch "bench_write_behind" database is
+# created next to it. Run from the project root:
+#
+#   python -m benchmarks.bench_write_behind
+
+import asyncio
+import os
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+
+import sqlalchemy
+
+from app.core import database_session
+from app.core.config import get_settings
+from app.core.ingestion import store_searches
+from app.core.write_behind import IdAllocator, SearchWriter
+from app.models import Base, QueryRecord, QueryResult
+
+BENCH_DB = "bench_write_behind"
+SEARCHES = 2_000
+RESULTS = 8
+CONCURRENCY = 64
+
+COMMITS = sqlalchemy.text("SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()")
+
+
+def new_search(index: int) -> tuple[QueryRecord, list[QueryResult], list[list[str]]]:
+    now = datetime.utcnow()
+    record = QueryRecord(query=f"ti:paper {index % 100}", timestamp=now, status=200, num_results=RESULTS)
+    results = [
+        QueryResult(author=f"Author {index % 500}", title=f"Paper {index}.{n}", journal=None, timestamp=now)
+        for n in range(RESULTS)
+    ]
+    return record, results, [[f"Author {index % 500}"] for _ in results]
+
+
+async def setup_database() -> None:
+    admin_engine = database_session.new_async_engine(get_settings().sqlalchemy_database_uri)
+    async with admin_engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(sqlalchemy.text(f"DROP DATABASE IF EXISTS {BENCH_DB}"))
+        await conn.execute(sqlalchemy.text(f"CREATE DATABASE {BENCH_DB}"))
+    await admin_engine.dispose()
+
+    # engines are created on first use, the app's now points at the scratch database
+    os.environ["DATABASE__DB"] = BENCH_DB
+    get_settings.cache_clear()
+    await database_session.dispose_engines()
+    async with database_session.get_async_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def commits() -> int:
+    # statistics are only refreshed per transaction unless told otherwise
+    async with database_session.get_async_engine().connect() as conn:
+        await conn.execute(sqlalchemy.text("SELECT pg_stat_clear_snapshot()"))
+        return int(await conn.scalar(COMMITS))
+
+
+async def run_clients(store: Callable[..., Awaitable[None]]) -> None:
+    queue = iter(range(SEARCHES))
+
+    async def client() -> None:
+        for index in queue:
+            await store(*new_search(index))
+
+    await asyncio.gather(*(client() for _ in range(CONCURRENCY)))
+
+
+async def measure(name: str, writer: SearchWriter | None) -> None:
+    record_ids = IdAllocator("query_records_id_seq", 1000)
+    result_ids = IdAllocator("query_results_id_seq", 1000)
+
+    async def per_search(record: QueryRecord, results: list[QueryResult], authors: list[list[str]]) -> None:
+        record.id = (await record_ids.take(1))[0]
+        for result, result_id in zip(results, await result_ids.take(len(results))):
+            result.id, result.query_record_id = result_id, record.id
+        async with database_session.get_async_session() as session:
+            await store_searches(session, [(record, results, authors)])
+            await session.commit()
+
+    commits_before = await commits()
+    start = time.perf_counter()
+    if writer is None:
+        await run_clients(per_search)
+    else:
+        writer.start()
+        await run_clients(writer.submit)
+        await writer.close()
+    elapsed = time.perf_counter() - start
+    # commits of the id blocks and the counting itself are included, a few dozen
+    transactions = await commits() - commits_before
+    print(f"{name:>24} {SEARCHES / elapsed:>11,.0f} {transactions:>9,}")
+
+
+def new_writer(wait_for_commit: bool, synchronous_commit: bool = True) -> SearchWriter:
+    return SearchWriter(
+        queue_size=10_000,
+        batch_size=500,
+        flush_interval_secs=0.05,
+        enqueue_timeout_secs=10,
+        wait_for_commit=wait_for_commit,
+        synchronous_commit=synchronous_commit,
+        id_block_size=1000,
+    )
+
+
+async def main() -> None:
+    os.environ["DATABASE__POOL_SIZE"] = str(CONCURRENCY)
+    await setup_database()
+    print(f"{SEARCHES:,} searches of {RESULTS} results, {CONCURRENCY} concurrent clients")
+    print(f"{'mode':>24} {'searches/s':>11} {'commits':>9}")
+    await measure("per search", None)
+    await measure("committed", new_writer(wait_for_commit=True))
+    await measure("enqueued", new_writer(wait_for_commit=False))
+    await measure("enqueued, async commit", new_writer(wait_for_commit=False, synchronous_commit=False))
+    await database_session.dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())